@@ -3,6 +3,24 @@ ASGI config for FoodSaver project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+This is the production entry point; deploy with:
+    gunicorn FoodSaver.asgi:application -k uvicorn.workers.UvicornWorker --workers N
+
+The chatbot views are async. Under ASGI each worker process serves many
+requests concurrently, so a slow Gemini answer holds an event-loop task rather
+than the whole worker, and the per-process AI bulkhead
+(AI_MAX_CONCURRENT_REQUESTS) actually caps concurrent upstream calls: at most
+N x AI_MAX_CONCURRENT_REQUESTS per host. Under sync WSGI workers a process
+serves one request at a time, the bulkhead can never fill and a slow answer
+pins the worker, so FoodSaver.wsgi is only for local development.
+
+Persistent database connections are off here: DB_CONN_MAX_AGE defaults to 0
+when this module is the entry point (see FoodSaver.database). Sync ORM code
+runs in sync_to_async's thread pool, whose threads are not tied to a request,
+so a kept-open connection is never closed by request_finished and leaks. Do
+not set DB_CONN_MAX_AGE above 0 for ASGI; use a server-side pooler (e.g.
+PgBouncer) to avoid reconnect cost instead.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +30,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "FoodSaver.settings")
+# Read by FoodSaver.database before settings load
+os.environ["FOODSAVER_ASGI"] = "1"
 
 application = get_asgi_application()
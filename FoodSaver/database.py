@@ -0,0 +1,91 @@
+"""
+Database connection configuration.
+
+Builds settings.DATABASES with persistent connections (CONN_MAX_AGE) and
+health checks, so a request reuses its worker's open connection instead of
+reconnecting. That only holds for the WSGI development server; under ASGI
+(FoodSaver.asgi sets FOODSAVER_ASGI) sync ORM calls run on pooled threads that
+outlive requests, so CONN_MAX_AGE defaults to 0 there and should stay 0.
+On SQLite every new connection also applies:
+
+    journal_mode=WAL      readers no longer block on a writer (and vice versa)
+    synchronous=NORMAL    fsync at checkpoints, not on every commit (safe with WAL)
+    busy_timeout          wait for the write lock instead of failing "database is locked"
+    mmap_size             read pages through a memory map
+    temp_store=MEMORY     sorts and temp indexes stay in memory
+
+and starts write transactions as BEGIN IMMEDIATE, so concurrent writers
+queue on busy_timeout up front rather than deadlocking on lock upgrade.
+``manage.py benchmark_db`` compares these pragmas with SQLite's defaults.
+
+Read replicas (DATABASE_REPLICA_URLS, or SQLITE_REPLICA_PATHS locally) are
+added as ``replica1``, ``replica2``, ... and used by
+HungerFree.db_routing.ReplicaRouter. In tests they mirror ``default``.
+"""
+import os
+
+from decouple import config
+
+SERVING_ASGI = bool(os.environ.get('FOODSAVER_ASGI'))
+CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=0 if SERVING_ASGI else 60, cast=int)
+CONN_HEALTH_CHECKS = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+
+SQLITE_BUSY_TIMEOUT_MS = config('SQLITE_BUSY_TIMEOUT_MS', default=5000, cast=int)
+SQLITE_MMAP_SIZE = config('SQLITE_MMAP_SIZE', default=128 * 1024 * 1024, cast=int)
+
+
+def sqlite_pragmas(busy_timeout_ms=SQLITE_BUSY_TIMEOUT_MS, mmap_size=SQLITE_MMAP_SIZE):
+    """PRAGMA statements applied to every new SQLite connection."""
+    return [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f'PRAGMA busy_timeout={int(busy_timeout_ms)}',
+        f'PRAGMA mmap_size={int(mmap_size)}',
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+def sqlite_database(name):
+    """DATABASES entry for a tuned SQLite file."""
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name,
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': CONN_HEALTH_CHECKS,
+        'OPTIONS': {
+            'init_command': ';'.join(sqlite_pragmas()),
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+
+
+def url_database(url):
+    """DATABASES entry for a DATABASE_URL (PostgreSQL on Render)."""
+    import dj_database_url
+    return dj_database_url.parse(url, conn_max_age=CONN_MAX_AGE, conn_health_checks=CONN_HEALTH_CHECKS)
+
+
+def build_databases(database_url, sqlite_path, replica_urls=(), sqlite_replica_paths=()):
+    """
+    settings.DATABASES for this deployment.
+
+    Args:
+        database_url: DATABASE_URL; a postgres:// URL selects PostgreSQL
+        sqlite_path: SQLite file used otherwise
+        replica_urls: Read replica URLs (PostgreSQL)
+        sqlite_replica_paths: Read replica files (SQLite, e.g. a copy kept by Litestream)
+
+    Returns:
+        dict: The DATABASES setting
+    """
+    if database_url.startswith('postgres'):
+        databases = {'default': url_database(database_url)}
+        replicas = [url_database(url) for url in replica_urls]
+    else:
+        databases = {'default': sqlite_database(sqlite_path)}
+        replicas = [sqlite_database(path) for path in sqlite_replica_paths]
+    for number, replica in enumerate(replicas, start=1):
+        # Tests run against the primary's test database through this alias
+        replica['TEST'] = {'MIRROR': 'default'}
+        databases[f'replica{number}'] = replica
+    return databases
@@ -35,6 +35,23 @@ ALLOWED_HOSTS = config(
 GEMINI_API_KEY = config('GEMINI_API_KEY', default='')
 IPSTACK_API_KEY = config('IPSTACK_API_KEY', default='')
 
+# Gemini model preference order and failover circuit breaker tuning
+GEMINI_MODELS = config(
+    'GEMINI_MODELS',
+    default='gemini-2.0-flash,gemini-2.5-flash,gemini-pro',
+    cast=Csv()
+)
+GEMINI_BREAKER_THRESHOLD = config('GEMINI_BREAKER_THRESHOLD', default=3, cast=int)
+GEMINI_BREAKER_RESET_SECONDS = config('GEMINI_BREAKER_RESET_SECONDS', default=30.0, cast=float)
+
+# AI bulkhead: max concurrent Gemini calls per process and hard timeout (seconds).
+# Sized for the required ASGI deployment (FoodSaver/asgi.py), where a process
+# serves many requests at once; the host-wide cap is workers x this value.
+AI_MAX_CONCURRENT_REQUESTS = config('AI_MAX_CONCURRENT_REQUESTS', default=8, cast=int)
+AI_REQUEST_TIMEOUT_SECONDS = config('AI_REQUEST_TIMEOUT_SECONDS', default=20.0, cast=float)
+# Seconds a coalesced AI answer stays shareable with identical follow-up prompts
+AI_COALESCE_RESULT_TTL = config('AI_COALESCE_RESULT_TTL', default=15, cast=int)
+
 if not GEMINI_API_KEY:
     print("⚠️ WARNING: GEMINI_API_KEY not found in environment variables")
 if not IPSTACK_API_KEY:
@@ -57,11 +74,19 @@ INSTALLED_APPS = [
 # MIDDLEWARE
 # ---------------------------------------------------------------
 MIDDLEWARE = [
+    # Outermost, so the Server-Timing total covers every other middleware
+    "HungerFree.middleware.ServerTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    # Collected static files (hashed, precompressed) without sessions or auth
+    "HungerFree.middleware.StaticFilesMiddleware",
+    # Replica routing state and read-your-writes stickiness cookie
+    "HungerFree.db_routing.ReplicaRoutingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # Lazily loads request.actor (profile, role, Donor/NGO) once per request
+    "HungerFree.middleware.ActorMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     # Custom middleware for role handling
@@ -75,7 +100,8 @@ ROOT_URLCONF = "FoodSaver.urls"
 # ---------------------------------------------------------------
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates that records render time for Server-Timing
+        "BACKEND": "HungerFree.timing.TimedDjangoTemplates",
         "DIRS": [os.path.join(BASE_DIR, "templates")],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -94,20 +120,84 @@ WSGI_APPLICATION = "FoodSaver.wsgi.application"
 # ---------------------------------------------------------------
 # DATABASE CONFIGURATION
 # ---------------------------------------------------------------
-# Use SQLite locally and PostgreSQL on Render (via DATABASE_URL)
-if config("DATABASE_URL", default="").startswith("postgres"):
-    import dj_database_url
-    DATABASES = {
-        "default": dj_database_url.parse(config("DATABASE_URL"))
+# Use SQLite locally and PostgreSQL on Render (via DATABASE_URL), with
+# persistent connections and, on SQLite, WAL pragmas (see FoodSaver/database.py)
+from .database import build_databases
+
+DATABASES = build_databases(
+    config("DATABASE_URL", default=""),
+    BASE_DIR / 'db.sqlite3',
+    replica_urls=config("DATABASE_REPLICA_URLS", default="", cast=Csv()),
+    sqlite_replica_paths=config("SQLITE_REPLICA_PATHS", default="", cast=Csv()),
+)
+
+# Read-only views read from replicas; a user who just wrote reads from the
+# primary for REPLICA_STICKY_SECONDS (see HungerFree/db_routing.py)
+DATABASE_ROUTERS = ['HungerFree.db_routing.ReplicaRouter']
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=10, cast=int)
+
+# ---------------------------------------------------------------
+# CACHE CONFIGURATION
+# ---------------------------------------------------------------
+# Shared cache (Redis via REDIS_URL) lets workers coordinate, e.g. AI request
+# coalescing; falls back to a per-process in-memory cache.
+if config("REDIS_URL", default=""):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": config("REDIS_URL"),
+        }
     }
 else:
-    DATABASES = {
-        'default': {
-            'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
         }
     }
 
+# ---------------------------------------------------------------
+# ANALYTICS
+# ---------------------------------------------------------------
+# Admin time-series API: max points per series and cache lifetime (seconds)
+TIMESERIES_MAX_POINTS = config('TIMESERIES_MAX_POINTS', default=120, cast=int)
+TIMESERIES_CACHE_SECONDS = config('TIMESERIES_CACHE_SECONDS', default=300, cast=int)
+
+# ---------------------------------------------------------------
+# EXPIRY SWEEPER
+# ---------------------------------------------------------------
+# manage.py expire_donations: rows per UPDATE and seconds between --loop runs
+EXPIRY_SWEEP_CHUNK_SIZE = config('EXPIRY_SWEEP_CHUNK_SIZE', default=500, cast=int)
+EXPIRY_SWEEP_INTERVAL_SECONDS = config('EXPIRY_SWEEP_INTERVAL_SECONDS', default=900, cast=int)
+
+# ---------------------------------------------------------------
+# PICKUP CLAIMS
+# ---------------------------------------------------------------
+# Minutes an approved claim holds a donation before it lapses to the next in
+# line; a later donor pickup_by extends it. Pending claims only lapse at the
+# donor's pickup_by.
+PICKUP_CLAIM_WINDOW_MINUTES = config('PICKUP_CLAIM_WINDOW_MINUTES', default=120, cast=int)
+
+# ---------------------------------------------------------------
+# ARCHIVAL
+# ---------------------------------------------------------------
+# manage.py archive_rows: age threshold (days), rows per transaction, and an
+# optional directory for gzip JSONL copies of each archived chunk
+ARCHIVE_AFTER_DAYS = config('ARCHIVE_AFTER_DAYS', default=90, cast=int)
+ARCHIVE_CHUNK_SIZE = config('ARCHIVE_CHUNK_SIZE', default=500, cast=int)
+ARCHIVE_SEGMENT_DIR = config('ARCHIVE_SEGMENT_DIR', default='')
+
+# ---------------------------------------------------------------
+# AUTHENTICATION
+# ---------------------------------------------------------------
+# ProfileModelBackend loads the UserProfile with the session's user, for role
+# checks. ModelBackend stays listed so sessions logged in under its path (before
+# ProfileModelBackend existed) remain valid; they just load the profile lazily.
+AUTHENTICATION_BACKENDS = [
+    'HungerFree.claims.ProfileModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 # ---------------------------------------------------------------
 # PASSWORD VALIDATION
 # ---------------------------------------------------------------
@@ -136,6 +226,16 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'HungerFree', 'static'),
 ]
 
+# collectstatic writes content-hashed names plus .gz/.br variants;
+# StaticFilesMiddleware serves them (see HungerFree/staticfiles.py)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'HungerFree.staticfiles.CompressedManifestStaticFilesStorage'},
+}
+# Cache lifetimes (seconds) for hashed (immutable) and unhashed static files
+STATIC_IMMUTABLE_MAX_AGE = config('STATIC_IMMUTABLE_MAX_AGE', default=365 * 24 * 3600, cast=int)
+STATIC_MAX_AGE = config('STATIC_MAX_AGE', default=60, cast=int)
+
 # ---------------------------------------------------------------
 # MEDIA FILES
 # ---------------------------------------------------------------
@@ -147,6 +247,14 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # ---------------------------------------------------------------
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# ---------------------------------------------------------------
+# REQUEST TIMING
+# ---------------------------------------------------------------
+# Server-Timing header (total, db, tpl and external call durations) on every
+# response; requests at least REQUEST_TIMING_LOG_MIN_MS long are also logged
+SERVER_TIMING_ENABLED = config('SERVER_TIMING_ENABLED', default=True, cast=bool)
+REQUEST_TIMING_LOG_MIN_MS = config('REQUEST_TIMING_LOG_MIN_MS', default=0, cast=float)
+
 # ---------------------------------------------------------------
 # LOGGING (Useful for Render logs)
 # ---------------------------------------------------------------
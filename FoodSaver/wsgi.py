@@ -3,14 +3,27 @@ WSGI config for FoodSaver project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
 
+Used by ``manage.py runserver``. Production must be served through
+FoodSaver.asgi (UvicornWorker): sync workers serve one request per process, so
+the AI bulkhead cannot protect them from slow Gemini calls.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 """
 
+import logging
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "FoodSaver.settings")
 
 application = get_wsgi_application()
+
+if not settings.DEBUG:
+    logging.getLogger(__name__).warning(
+        "FoodSaver is being served through WSGI. Production requires the ASGI app "
+        "(gunicorn FoodSaver.asgi:application -k uvicorn.workers.UvicornWorker); "
+        "under sync workers the AI bulkhead does not limit Gemini calls."
+    )
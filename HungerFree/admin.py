@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import Food, Donor, NGO, Donation, PickupRequest, Payment, UserProfile, NGOFoodRequirement, Notification
+from .models import (
+    Food, Donor, NGO, Donation, PickupRequest, Payment, UserProfile, NGOFoodRequirement, Notification, DailyImpactRollup,
+    ArchivedDonation, ArchivedPickupRequest, ArchivedNotification,
+)
+from .pickups import approve_claim, release_claim
 
 
 @admin.register(Food)
@@ -32,7 +36,7 @@ class DonationAdmin(admin.ModelAdmin):
     list_filter = ['status', 'expiry_date', 'created_at', 'location']
     search_fields = ['title', 'description', 'location', 'donor__name']
     date_hierarchy = 'created_at'
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['created_at', 'updated_at', 'calories', 'protein', 'carbs', 'fats', 'fiber']
     fieldsets = (
         ('Basic Information', {
             'fields': ('title', 'description', 'donor', 'ngo')
@@ -43,6 +47,10 @@ class DonationAdmin(admin.ModelAdmin):
         ('Status', {
             'fields': ('status', 'nutritional_info')
         }),
+        ('Nutrition (synced from nutritional_info)', {
+            'fields': ('calories', 'protein', 'carbs', 'fats', 'fiber'),
+            'classes': ('collapse',)
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
@@ -69,6 +77,19 @@ class PickupRequestAdmin(admin.ModelAdmin):
             'classes': ('collapse',)
         }),
     )
+    
+    def save_model(self, request, obj, form, change):
+        # Approving starts the pickup window; cancelling or rejecting an open
+        # request frees the donation for the next one on its waitlist
+        status = obj.status
+        if not change or 'status' not in form.changed_data or status not in ('Approved', 'Cancelled', 'Rejected'):
+            return super().save_model(request, obj, form, change)
+        obj.status = form.initial['status']
+        super().save_model(request, obj, form, change)
+        handled = approve_claim(obj) if status == 'Approved' else release_claim(obj, status=status)
+        if not handled:
+            obj.status = status
+            obj.save(update_fields=['status'])
 
 
 @admin.register(Payment)
@@ -116,3 +137,35 @@ class NotificationAdmin(admin.ModelAdmin):
     search_fields = ['user__username', 'title', 'message']
     date_hierarchy = 'created_at'
     readonly_fields = ['created_at']
+
+
+@admin.register(DailyImpactRollup)
+class DailyImpactRollupAdmin(admin.ModelAdmin):
+    list_display = ['date', 'scope', 'key', 'donations_count', 'servings_donated', 'pickups_completed', 'servings_received', 'servings_expired']
+    list_filter = ['scope', 'date']
+    search_fields = ['key']
+    date_hierarchy = 'date'
+
+
+@admin.register(ArchivedDonation)
+class ArchivedDonationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'title', 'donor', 'ngo', 'quantity', 'status', 'created_at', 'archived_at']
+    list_filter = ['status', 'archived_at']
+    search_fields = ['title', 'donor__name']
+    raw_id_fields = ['donor', 'ngo']
+
+
+@admin.register(ArchivedPickupRequest)
+class ArchivedPickupRequestAdmin(admin.ModelAdmin):
+    list_display = ['id', 'donation_id', 'requester_name', 'status', 'requested_at', 'archived_at']
+    list_filter = ['status', 'archived_at']
+    search_fields = ['requester_name', 'requester_email']
+    raw_id_fields = ['requester']
+
+
+@admin.register(ArchivedNotification)
+class ArchivedNotificationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'notification_type', 'title', 'created_at', 'archived_at']
+    list_filter = ['notification_type', 'archived_at']
+    search_fields = ['user__username', 'title']
+    raw_id_fields = ['user']
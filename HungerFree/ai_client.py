@@ -0,0 +1,451 @@
+"""
+Process-level Gemini client manager.
+
+The SDK is configured once per process, a working model is probed and
+selected on first use, and the selected model object is reused across
+requests. Each model sits behind a small circuit breaker so an outage of one
+model fails over to the next candidate instead of failing every request.
+"""
+import hashlib
+import logging
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+import google.generativeai as genai
+from decouple import config
+from django.conf import settings
+from django.core.cache import caches
+
+from .timing import external_call
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GEMINI_MODELS = ['gemini-2.0-flash', 'gemini-2.5-flash', 'gemini-pro']
+
+
+class AIServiceError(Exception):
+    """Raised when no Gemini model is able to serve a request."""
+
+
+class AIServiceBusy(AIServiceError):
+    """Raised when the AI bulkhead is full and the request is shed."""
+
+
+class Bulkhead:
+    """
+    Caps the number of concurrent upstream AI calls in this process.
+
+    Acquisition never waits: when every slot is taken the caller is told
+    immediately so it can answer "busy, try again" instead of queueing. The
+    semaphore is thread-based so it works the same for sync views, async views
+    and the worker threads that run the blocking SDK calls.
+
+    The limit is per process. It is meaningful under the ASGI deployment
+    (FoodSaver/asgi.py), where one process runs many requests concurrently;
+    a sync WSGI worker never has more than one call to limit.
+    """
+
+    def __init__(self, max_concurrent: int = 8):
+        self.max_concurrent = max_concurrent
+        self._semaphore = threading.BoundedSemaphore(max_concurrent)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        acquired = self._semaphore.acquire(blocking=False)
+        with self._lock:
+            if acquired:
+                self.in_flight += 1
+            else:
+                self.rejected += 1
+        return acquired
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._semaphore.release()
+
+    def get_metrics(self) -> Dict[str, int]:
+        return {
+            'max_concurrent': self.max_concurrent,
+            'in_flight': self.in_flight,
+            'rejected': self.rejected,
+        }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical calls into one upstream call.
+
+    Within a process, callers with the same key wait on the first caller (the
+    leader) and share its result or exception. Across workers, the leader takes
+    a short-lived lock in the shared cache and publishes its result there for
+    ``result_ttl`` seconds; other workers poll for that result instead of making
+    their own call. Exceptions are never published to the cache.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self, cache_alias: str = 'default', lock_ttl: float = 30.0,
+                 result_ttl: float = 15.0, poll_interval: float = 0.05):
+        self.cache_alias = cache_alias
+        self.lock_ttl = lock_ttl
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            if not call.event.wait(self.lock_ttl):
+                raise AIServiceError('Timed out waiting for an identical in-flight request.')
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = self._do_shared(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def _do_shared(self, key: str, fn):
+        cache = caches[self.cache_alias]
+        result_key = f'singleflight:result:{key}'
+        lock_key = f'singleflight:lock:{key}'
+        cached = cache.get(result_key)
+        if cached is not None:
+            self.coalesced += 1
+            return cached
+        if not cache.add(lock_key, 1, self.lock_ttl):
+            # Another worker is already calling upstream; wait for its result.
+            deadline = time.monotonic() + self.lock_ttl
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                cached = cache.get(result_key)
+                if cached is not None:
+                    self.coalesced += 1
+                    return cached
+                if cache.get(lock_key) is None:
+                    break  # the other worker failed; call upstream ourselves
+            cache.add(lock_key, 1, self.lock_ttl)
+        try:
+            self.upstream_calls += 1
+            result = fn()
+            cache.set(result_key, result, self.result_ttl)
+            return result
+        finally:
+            cache.delete(lock_key)
+
+    def get_metrics(self) -> Dict[str, int]:
+        return {
+            'upstream_calls': self.upstream_calls,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._calls),
+        }
+
+
+def prompt_key(prompt: str) -> str:
+    """Cache/coalescing key for a prompt: case-folded, whitespace-collapsed, hashed."""
+    normalized = ' '.join((prompt or '').split()).casefold()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class CircuitBreaker:
+    """
+    Minimal closed/open/half-open circuit breaker.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    rejects calls for ``reset_timeout`` seconds. The first call after that
+    window is let through as a trial (half-open); its outcome closes or
+    re-opens the breaker.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Return True if a call may be attempted right now."""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at >= self.reset_timeout:
+                    self.state = self.HALF_OPEN
+                    return True
+                return False
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class ModelMetrics:
+    """Request, error and latency counters for a single model."""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_error = ''
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, error: Optional[Exception] = None):
+        with self._lock:
+            self.requests += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+            if error is not None:
+                self.errors += 1
+                self.last_error = str(error)
+
+    def snapshot(self) -> Dict[str, any]:
+        with self._lock:
+            avg = self.total_latency / self.requests if self.requests else 0.0
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'error_rate': round(self.errors / self.requests, 4) if self.requests else 0.0,
+                'avg_latency_ms': round(avg * 1000, 1),
+                'max_latency_ms': round(self.max_latency * 1000, 1),
+                'last_error': self.last_error,
+            }
+
+
+class GeminiClientManager:
+    """
+    Shared Gemini client: configure once, select a working model, fail over.
+
+    Usage:
+        manager = get_gemini_manager()
+        text = manager.generate(prompt)
+    """
+
+    def __init__(self, api_key: str, model_names: List[str] = None,
+                 failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.api_key = api_key
+        self.model_names = list(model_names or DEFAULT_GEMINI_MODELS)
+        self.breakers = {name: CircuitBreaker(failure_threshold, reset_timeout) for name in self.model_names}
+        self.metrics = {name: ModelMetrics() for name in self.model_names}
+        self.active_model = None
+        self._models = {}
+        self._configured = False
+        self._lock = threading.Lock()
+
+    # ---------------------------------------------------------------
+    # SDK hooks (overridden in tests)
+    # ---------------------------------------------------------------
+    def _configure(self):
+        genai.configure(api_key=self.api_key)
+
+    def _probe(self, name: str):
+        """Check the model is actually served for this key; raises if not."""
+        genai.get_model(f'models/{name}')
+
+    def _build_model(self, name: str):
+        return genai.GenerativeModel(name)
+
+    # ---------------------------------------------------------------
+    # Model selection
+    # ---------------------------------------------------------------
+    def _ensure_configured(self):
+        if self._configured:
+            return
+        with self._lock:
+            if not self._configured:
+                self._configure()
+                self._configured = True
+
+    def _get_model(self, name: str):
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(name)
+                if model is None:
+                    model = self._build_model(name)
+                    self._models[name] = model
+        return model
+
+    def select_model(self) -> str:
+        """Probe candidates in preference order and remember the first that answers."""
+        self._ensure_configured()
+        for name in self.model_names:
+            if not self.breakers[name].allow():
+                continue
+            try:
+                self._probe(name)
+            except Exception as e:
+                logger.warning("Gemini model %s unavailable: %s", name, e)
+                self.breakers[name].record_failure()
+                continue
+            self.active_model = name
+            logger.info("Gemini model selected: %s", name)
+            return name
+        raise AIServiceError('No Gemini model is currently available.')
+
+    def _candidates(self) -> List[str]:
+        """Active model first, then the remaining models in preference order."""
+        if self.active_model is None:
+            self.select_model()
+        return [self.active_model] + [n for n in self.model_names if n != self.active_model]
+
+    # ---------------------------------------------------------------
+    # Generation
+    # ---------------------------------------------------------------
+    def generate(self, prompt: str, **kwargs):
+        """
+        Run ``generate_content`` on the active model, failing over to the next
+        model whose breaker is closed. Returns the SDK response object.
+        """
+        self._ensure_configured()
+        last_error = None
+        for name in self._candidates():
+            breaker = self.breakers[name]
+            if not breaker.allow():
+                continue
+            start = time.monotonic()
+            try:
+                with external_call('gemini'):
+                    result = self._get_model(name).generate_content(prompt, **kwargs)
+            except Exception as e:
+                self.metrics[name].record(time.monotonic() - start, e)
+                breaker.record_failure()
+                last_error = e
+                logger.warning("Gemini model %s failed: %s", name, e)
+                continue
+            self.metrics[name].record(time.monotonic() - start)
+            breaker.record_success()
+            if name != self.active_model:
+                logger.info("Gemini failover: %s -> %s", self.active_model, name)
+                self.active_model = name
+            return result
+        raise AIServiceError(f'All Gemini models failed: {last_error}')
+
+    def generate_text(self, prompt: str, timeout: float = None) -> str:
+        kwargs = {'request_options': {'timeout': timeout}} if timeout else {}
+        result = self.generate(prompt, **kwargs)
+        try:
+            return result.text
+        except Exception:
+            # Fallback formatting
+            return str(result)
+
+    def stream_text(self, prompt: str, timeout: float = None) -> Iterator[str]:
+        """
+        Yield response text chunks from the model's streaming API.
+
+        Failover only applies to starting the stream; once chunks are flowing
+        an error is raised to the caller.
+        """
+        kwargs = {'request_options': {'timeout': timeout}} if timeout else {}
+        for chunk in self.generate(prompt, stream=True, **kwargs):
+            try:
+                text = chunk.text
+            except Exception:
+                continue
+            if text:
+                yield text
+
+    def get_metrics(self) -> Dict[str, any]:
+        return {
+            'active_model': self.active_model,
+            'models': {
+                name: dict(self.metrics[name].snapshot(), breaker=self.breakers[name].state)
+                for name in self.model_names
+            },
+        }
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_gemini_manager() -> Optional[GeminiClientManager]:
+    """Return the process-wide manager, or None if no API key is configured."""
+    global _manager
+    if _manager is None:
+        api_key = getattr(settings, 'GEMINI_API_KEY', None) or config('GEMINI_API_KEY', default='')
+        if not api_key:
+            return None
+        with _manager_lock:
+            if _manager is None:
+                _manager = GeminiClientManager(
+                    api_key=api_key,
+                    model_names=getattr(settings, 'GEMINI_MODELS', DEFAULT_GEMINI_MODELS),
+                    failure_threshold=getattr(settings, 'GEMINI_BREAKER_THRESHOLD', 3),
+                    reset_timeout=getattr(settings, 'GEMINI_BREAKER_RESET_SECONDS', 30.0),
+                )
+    return _manager
+
+
+_bulkhead = None
+
+
+def get_ai_bulkhead() -> Bulkhead:
+    """Return the process-wide bulkhead sized by AI_MAX_CONCURRENT_REQUESTS."""
+    global _bulkhead
+    if _bulkhead is None:
+        with _manager_lock:
+            if _bulkhead is None:
+                _bulkhead = Bulkhead(getattr(settings, 'AI_MAX_CONCURRENT_REQUESTS', 8))
+    return _bulkhead
+
+
+_single_flight = None
+
+
+def get_single_flight() -> SingleFlight:
+    """Return the process-wide request coalescer for AI prompts."""
+    global _single_flight
+    if _single_flight is None:
+        with _manager_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight(
+                    lock_ttl=getattr(settings, 'AI_REQUEST_TIMEOUT_SECONDS', 20.0) + 5,
+                    result_ttl=getattr(settings, 'AI_COALESCE_RESULT_TTL', 15),
+                )
+    return _single_flight
+
+
+def reset_gemini_manager(manager: GeminiClientManager = None):
+    """Replace the process-wide manager (used by tests and after key rotation)."""
+    global _manager, _bulkhead, _single_flight
+    with _manager_lock:
+        _manager = manager
+        _bulkhead = None
+        _single_flight = None
@@ -0,0 +1,146 @@
+"""
+Time-series analytics served from the daily impact rollups.
+
+Series are summed per day, week or month in the database (one GROUP BY over
+DailyImpactRollup, never over Donation), zero-filled, downsampled to at most
+``max_points`` points and cached for TIMESERIES_CACHE_SECONDS.
+"""
+import hashlib
+import math
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+from .models import DailyImpactRollup
+from .rollups import ROLLUP_METRICS, city_key
+
+BUCKETS = ('day', 'week', 'month')
+
+# Derived metrics: name -> (numerator, denominator), computed from bucket sums
+RATIO_METRICS = {
+    'expiry_waste_rate': ('servings_expired', 'servings_donated'),
+}
+
+TIMESERIES_METRICS = ROLLUP_METRICS + tuple(RATIO_METRICS)
+
+
+class TimeseriesError(ValueError):
+    """Raised for an unknown metric, bucket or scope, or an invalid date range."""
+
+
+def bucket_start(day, bucket):
+    """First day of the bucket containing ``day``."""
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _next_bucket(day, bucket):
+    if bucket == 'week':
+        return day + timedelta(days=7)
+    if bucket == 'month':
+        return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+    return day + timedelta(days=1)
+
+
+def _sum_by_bucket(rows, bucket, fields):
+    sums = {field: Sum(field) for field in fields}
+    if bucket == 'day':
+        grouped = rows.values('date').annotate(**sums).values_list('date', *fields)
+    else:
+        trunc = TruncWeek('date') if bucket == 'week' else TruncMonth('date')
+        grouped = rows.annotate(bucket=trunc).values('bucket').annotate(**sums).values_list('bucket', *fields)
+    result = {}
+    for start, *values in grouped:
+        # TruncWeek/TruncMonth on a DateField return dates
+        result[start] = dict(zip(fields, (value or 0 for value in values)))
+    return result
+
+
+def _value(sums, metric):
+    if metric in RATIO_METRICS:
+        numerator, denominator = RATIO_METRICS[metric]
+        total = sums.get(denominator, 0)
+        return round(sums.get(numerator, 0) / total, 4) if total else 0.0
+    return sums.get(metric, 0)
+
+
+def build_timeseries(metric, bucket='day', start=None, end=None, scope=None, key=None, max_points=None):
+    """
+    Return a bucketed series for ``metric`` from the rollups.
+
+    Args:
+        metric: One of TIMESERIES_METRICS
+        bucket: 'day', 'week' or 'month'
+        start, end: Inclusive date range (default: the last 30 days)
+        scope, key: Restrict to one donor/NGO/city; platform-wide (city rows) when omitted
+        max_points: Downsampling bound (default settings.TIMESERIES_MAX_POINTS)
+
+    Returns:
+        dict: ``points`` is a list of {"start": ISO date, "value": number}; when
+        downsampled each point covers ``buckets_per_point`` consecutive buckets.
+
+    Raises:
+        TimeseriesError: On invalid arguments
+    """
+    if metric not in TIMESERIES_METRICS:
+        raise TimeseriesError(f'Unknown metric "{metric}". Choose from: {", ".join(TIMESERIES_METRICS)}.')
+    if bucket not in BUCKETS:
+        raise TimeseriesError(f'Unknown bucket "{bucket}". Choose from: {", ".join(BUCKETS)}.')
+    scope = scope or 'city'
+    if scope not in dict(DailyImpactRollup.SCOPE_CHOICES):
+        raise TimeseriesError(f'Unknown scope "{scope}".')
+    end = end or date.today()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise TimeseriesError('start must not be after end.')
+    max_points = max(1, int(max_points or settings.TIMESERIES_MAX_POINTS))
+    if scope == 'city' and key is not None:
+        key = city_key(key)
+
+    fields = RATIO_METRICS.get(metric, (metric,))
+    rows = DailyImpactRollup.objects.filter(scope=scope, date__gte=start, date__lte=end)
+    if key is not None:
+        rows = rows.filter(key=str(key))
+    sums = _sum_by_bucket(rows, bucket, fields)
+
+    # Zero-filled bucket sequence covering the range
+    buckets = []
+    current = bucket_start(start, bucket)
+    while current <= end:
+        buckets.append((current, sums.get(current, {})))
+        current = _next_bucket(current, bucket)
+
+    per_point = max(1, math.ceil(len(buckets) / max_points))
+    points = []
+    for i in range(0, len(buckets), per_point):
+        group = buckets[i:i + per_point]
+        merged = {field: sum(b.get(field, 0) for _, b in group) for field in fields}
+        points.append({'start': group[0][0].isoformat(), 'value': _value(merged, metric)})
+
+    return {
+        'metric': metric,
+        'bucket': bucket,
+        'scope': scope,
+        'key': key,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'buckets_per_point': per_point,
+        'points': points,
+    }
+
+
+def cached_timeseries(**params):
+    """build_timeseries() memoized in the cache for TIMESERIES_CACHE_SECONDS."""
+    digest = hashlib.sha256(repr(sorted(params.items())).encode()).hexdigest()
+    cache_key = f'timeseries:{digest}'
+    series = cache.get(cache_key)
+    if series is None:
+        series = build_timeseries(**params)
+        cache.set(cache_key, series, settings.TIMESERIES_CACHE_SECONDS)
+    return series
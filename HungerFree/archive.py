@@ -0,0 +1,238 @@
+"""
+Cold storage for finished donations, pickup requests and notifications.
+
+archive_terminal_rows() moves rows that can no longer change out of the hot
+tables, oldest first, in primary-key chunks:
+    Donation       Picked Up / Expired / Cancelled, untouched for N days
+                   (with all of its pickup requests, which would cascade)
+    PickupRequest  Rejected / Completed / Cancelled / Expired, older than N days
+    Notification   read, older than N days
+
+Each chunk is copied into the Archived* tables (same ids; columns used by
+history and rollups copied, the rest kept in ``data``) and deleted from the
+live table in one transaction. When a segment directory is configured, the
+chunk is also written as a gzip-compressed JSONL segment for off-database
+cold storage. donor_history() and ngo_history() page through live and
+archived rows as one keyset-paginated listing, and ngo_impact() sums both.
+"""
+import gzip
+import json
+import logging
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, Sum
+from django.utils import timezone
+
+from .listing import paginate_merged
+from .models import (
+    ArchivedDonation, ArchivedNotification, ArchivedPickupRequest, Donation, NGOFoodRequirement,
+    Notification, PickupRequest,
+)
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_DONATION_STATUSES = ('Picked Up', 'Expired', 'Cancelled')
+TERMINAL_PICKUP_STATUSES = ('Rejected', 'Completed', 'Cancelled', 'Expired')
+
+HISTORY_PAGE_SIZE = 50
+
+
+def row_to_dict(obj):
+    """JSON-safe dict of a model instance's concrete field values, keyed by attname."""
+    values = {field.attname: field.value_from_object(obj) for field in obj._meta.concrete_fields}
+    return json.loads(json.dumps(values, cls=DjangoJSONEncoder))
+
+
+def to_archive(obj, archive_model):
+    """Build the archive row for live instance ``obj``."""
+    values = {field.attname: field.value_from_object(obj) for field in obj._meta.concrete_fields}
+    copied = {
+        field.attname for field in archive_model._meta.concrete_fields
+        if field.attname not in ('archived_at', 'data')
+    }
+    extra = {name: value for name, value in values.items() if name not in copied}
+    return archive_model(
+        data=json.loads(json.dumps(extra, cls=DjangoJSONEncoder)),
+        **{name: values[name] for name in copied if name in values},
+    )
+
+
+def write_segment(directory, label, rows):
+    """
+    Write ``rows`` as one gzip-compressed JSONL segment.
+
+    Returns:
+        str: Path of the segment, ``<directory>/<label>/<timestamp>-<first id>-<last id>.jsonl.gz``
+    """
+    folder = os.path.join(directory, label)
+    os.makedirs(folder, exist_ok=True)
+    stamp = timezone.now().strftime('%Y%m%dT%H%M%S%f')
+    path = os.path.join(folder, f"{stamp}-{rows[0]['id']}-{rows[-1]['id']}.jsonl.gz")
+    with gzip.open(path, 'wt', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, separators=(',', ':')) + '\n')
+    return path
+
+
+class ArchiveResult:
+    """Row counts moved by one archival run."""
+
+    def __init__(self):
+        self.donations = 0
+        self.pickup_requests = 0
+        self.notifications = 0
+        self.segments = []
+
+    def __str__(self):
+        return (f'{self.donations} donations, {self.pickup_requests} pickup requests, '
+                f'{self.notifications} notifications archived')
+
+
+def _archive_chunk(queryset, archive_model, chunk_size, segment_dir, label, children=None):
+    """
+    Archive one chunk of ``queryset`` (and its ``children`` pickups); returns (rows, child rows, segments).
+    """
+    with transaction.atomic():
+        chunk = list(queryset.select_for_update().order_by('pk')[:chunk_size])
+        if not chunk:
+            return 0, 0, []
+        ids = [obj.pk for obj in chunk]
+        child_rows = list(children.filter(donation_id__in=ids).order_by('pk')) if children is not None else []
+
+        segments = []
+        if segment_dir:
+            segments.append(write_segment(segment_dir, label, [row_to_dict(obj) for obj in chunk]))
+            if child_rows:
+                segments.append(write_segment(segment_dir, 'pickup_requests', [row_to_dict(obj) for obj in child_rows]))
+
+        # ignore_conflicts makes a re-run after a failed delete harmless
+        archive_model.objects.bulk_create([to_archive(obj, archive_model) for obj in chunk], ignore_conflicts=True)
+        if child_rows:
+            ArchivedPickupRequest.objects.bulk_create(
+                [to_archive(obj, ArchivedPickupRequest) for obj in child_rows], ignore_conflicts=True
+            )
+        queryset.model.objects.filter(pk__in=ids).delete()
+    return len(chunk), len(child_rows), segments
+
+
+def _drain(result, queryset, archive_model, chunk_size, segment_dir, label, children=None):
+    total = 0
+    while True:
+        rows, child_rows, segments = _archive_chunk(
+            queryset, archive_model, chunk_size, segment_dir, label, children
+        )
+        if not rows:
+            return total
+        total += rows
+        result.pickup_requests += child_rows
+        result.segments.extend(segments)
+
+
+def archive_terminal_rows(older_than_days=None, chunk_size=None, segment_dir=None):
+    """
+    Move terminal rows older than ``older_than_days`` into the archive.
+
+    Args:
+        older_than_days: Age threshold (defaults to settings.ARCHIVE_AFTER_DAYS)
+        chunk_size: Rows per transaction (defaults to settings.ARCHIVE_CHUNK_SIZE)
+        segment_dir: Also write JSONL segments here (defaults to settings.ARCHIVE_SEGMENT_DIR; '' disables)
+
+    Returns:
+        ArchiveResult: Counts per table and the segment files written
+    """
+    days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    chunk_size = max(1, chunk_size or settings.ARCHIVE_CHUNK_SIZE)
+    segment_dir = settings.ARCHIVE_SEGMENT_DIR if segment_dir is None else segment_dir
+    cutoff = timezone.now() - timedelta(days=days)
+    result = ArchiveResult()
+
+    # Donations that fulfilled a requirement stay live so the link is kept
+    donations = Donation.objects.filter(
+        status__in=TERMINAL_DONATION_STATUSES, created_at__lt=cutoff, updated_at__lt=cutoff,
+    ).exclude(Exists(NGOFoodRequirement.objects.filter(fulfilled_by=OuterRef('pk'))))
+    result.donations = _drain(
+        result, donations, ArchivedDonation, chunk_size, segment_dir, 'donations',
+        children=PickupRequest.objects.all(),
+    )
+    pickups = PickupRequest.objects.filter(status__in=TERMINAL_PICKUP_STATUSES, requested_at__lt=cutoff)
+    result.pickup_requests += _drain(
+        result, pickups, ArchivedPickupRequest, chunk_size, segment_dir, 'pickup_requests'
+    )
+    notifications = Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+    result.notifications = _drain(
+        result, notifications, ArchivedNotification, chunk_size, segment_dir, 'notifications'
+    )
+    logger.info('Archival: %s', result)
+    return result
+
+
+# ==================== HISTORY ACROSS LIVE AND ARCHIVE ====================
+
+def donor_history(donor, cursor=None, page_size=HISTORY_PAGE_SIZE):
+    """
+    One page of a donor's donations, live and archived, newest first.
+
+    Args:
+        donor: The donor, or None (empty page)
+        cursor: ``next_cursor`` of the previous page, or None for the first page
+
+    Returns:
+        KeysetPage: Donation and ArchivedDonation instances
+
+    Raises:
+        InvalidCursor: If ``cursor`` is malformed
+    """
+    if donor is None:
+        return paginate_merged([], cursor, page_size)
+    return paginate_merged([
+        Donation.objects.filter(donor=donor),
+        ArchivedDonation.objects.filter(donor=donor),
+    ], cursor, page_size)
+
+
+def ngo_donation_filters(ngo):
+    """
+    Filters for donations assigned to or requested by ``ngo``.
+
+    Requests may be live or archived, so both filters also match the ids of
+    archived requests. Exists() keeps each donation once without DISTINCT.
+
+    Returns:
+        tuple: (Q for Donation, Q for ArchivedDonation)
+    """
+    archived_requests = ArchivedPickupRequest.objects.filter(requester__email=ngo.email).values('donation_id')
+    live_requests = PickupRequest.objects.filter(donation=OuterRef('pk'), requester__email=ngo.email)
+    live = Q(ngo=ngo) | Q(Exists(live_requests)) | Q(pk__in=archived_requests)
+    archived = Q(ngo=ngo) | Q(pk__in=archived_requests)
+    return live, archived
+
+
+def ngo_history(ngo, cursor=None, page_size=HISTORY_PAGE_SIZE):
+    """One page of donations assigned to or requested by an NGO, live and archived, newest first."""
+    if ngo is None:
+        return paginate_merged([], cursor, page_size)
+    live, archived = ngo_donation_filters(ngo)
+    return paginate_merged([
+        Donation.objects.filter(live).select_related('donor'),
+        ArchivedDonation.objects.filter(archived).select_related('donor'),
+    ], cursor, page_size)
+
+
+def ngo_impact(ngo):
+    """
+    Servings, calories and protein of an NGO's donations, live and archived.
+
+    Returns:
+        dict: servings, calories, protein (0 when there are none)
+    """
+    live, archived = ngo_donation_filters(ngo)
+    sums = {'servings': Sum('quantity'), 'calories': Sum('calories'), 'protein': Sum('protein')}
+    totals = dict.fromkeys(sums, 0)
+    for queryset in (Donation.objects.filter(live), ArchivedDonation.objects.filter(archived)):
+        for name, value in queryset.aggregate(**sums).items():
+            totals[name] += value or 0
+    return totals
@@ -128,8 +128,8 @@ def login_view(request):
     """Custom login view with role-based redirect."""
     if request.user.is_authenticated:
         # Redirect based on role
-        if hasattr(request.user, 'user_profile'):
-            profile = request.user.user_profile
+        profile = request.actor.profile
+        if profile:
             # Use explicit role checks and short path redirects
             try:
                 if profile.role == 'Admin':
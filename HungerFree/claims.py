@@ -0,0 +1,53 @@
+"""
+Role and approval claims for authorization checks.
+
+role_required needs only the user's role and whether they may access their
+dashboard. ProfileModelBackend loads the UserProfile (and the Donor/NGO
+records request.actor exposes) together with the user in the authentication
+query every request already makes, so the check reads the current profile at
+no extra query cost, and approvals or rejections take effect on the user's
+next request in every worker.
+"""
+from django.apps import apps
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import ObjectDoesNotExist
+
+# Reverse one-to-one relations of User loaded with it (see middleware.Actor)
+ACTOR_RELATIONS = ('user_profile', 'donor_profile', 'ngo_profile')
+
+
+class ProfileModelBackend(ModelBackend):
+    """ModelBackend whose per-request user query also loads the profile and Donor/NGO records."""
+
+    def get_user(self, user_id):
+        UserModel = apps.get_model('auth', 'User')
+        try:
+            user = UserModel._default_manager.select_related(*ACTOR_RELATIONS).get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+
+def get_user_profile(user):
+    """The user's UserProfile or None (no query when it was loaded with the user)."""
+    try:
+        return user.user_profile
+    except ObjectDoesNotExist:
+        return None
+
+
+def get_role_claims(request):
+    """
+    Return the current user's claims as a dict with ``role`` and ``can_access``.
+
+    Args:
+        request: An authenticated request
+
+    Returns:
+        dict: ``role`` is None when the user has no profile
+    """
+    profile = get_user_profile(request.user)
+    return {
+        'role': profile.role if profile else None,
+        'can_access': profile.can_access_dashboard() if profile else False,
+    }
@@ -6,12 +6,18 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
 from datetime import date, timedelta
+import json
 from django.http import JsonResponse
-from django.db.models import Q
 from .models import Donation, Donor, NGO, NGOFoodRequirement, UserProfile, Notification
 from django.urls import reverse
-from .decorators import donor_required, ngo_required, admin_required
+from .decorators import role_required, donor_required, ngo_required, admin_required
 from .utils import matchDonationToRequirements
+from . import archive
+from .db_routing import replica_reads
+from .pickups import DonationUnavailable, claim_donation, waitlist_position
+from .services import build_ngo_dashboard_context
+from .rollups import impact_totals, platform_totals
+from .listing import InvalidCursor, page_json, paginate, paginate_request
 
 
 # ==================== DONOR DASHBOARD ====================
@@ -19,16 +25,12 @@ from .utils import matchDonationToRequirements
 @donor_required
 def donor_dashboard(request):
     """Donor dashboard with donation upload, nutrition analysis, and history."""
-    donor = None
-    if hasattr(request.user, 'donor_profile'):
-        donor = request.user.donor_profile
-    
-    # Ensure donor object exists for authenticated users (helps keep history updated)
-    if request.user.is_authenticated and not donor:
-        donor = Donor.objects.filter(user=request.user).first()
+    donor = request.actor.donor
 
     # Get donor's donations
     my_donations = Donation.objects.filter(donor=donor).order_by('-created_at')[:10] if donor else []
+    # Lifetime impact from the daily rollups (a few rows per active day, not per donation)
+    impact = impact_totals('donor', donor.id) if donor else None
     # Get unread notifications (donor-specific)
     notifications = Notification.objects.filter(user=request.user, is_read=False).order_by('-created_at')[:5]
 
@@ -36,19 +38,19 @@ def donor_dashboard(request):
     # Also show upcoming NGO requirements near the donor (helps donors decide what to donate)
     upcoming_requirements = []
     try:
-        if donor and donor.city:
-            upcoming_requirements = NGOFoodRequirement.objects.filter(ngo__city__iexact=donor.city, status='Pending', required_date__gte=date.today()).order_by('required_date')[:10]
+        if donor and donor.city_key:
+            upcoming_requirements = NGOFoodRequirement.objects.filter(ngo__city_key=donor.city_key, status='Pending', required_date__gte=date.today()).order_by('required_date')[:10]
         else:
             upcoming_requirements = NGOFoodRequirement.objects.filter(status='Pending', required_date__gte=date.today()).order_by('required_date')[:10]
     except Exception:
         upcoming_requirements = []
 
-    # Nearby donations for donor view (available donations in donor's city or location)
+    # Nearby donations for donor view (available donations in the donor's city)
     nearby_donations = []
     try:
-        if donor and donor.city:
-            nearby_donations = Donation.objects.filter(status='Available').filter(
-                Q(donor__city__iexact=donor.city) | Q(location__icontains=donor.city)
+        if donor and donor.city_key:
+            nearby_donations = Donation.objects.filter(
+                status='Available', city_key=donor.city_key
             ).order_by('-created_at')[:20]
         else:
             nearby_donations = Donation.objects.filter(status='Available').order_by('-created_at')[:20]
@@ -58,6 +60,7 @@ def donor_dashboard(request):
     context = {
         'donor': donor,
         'my_donations': my_donations,
+        'impact': impact,
         'notifications': notifications,
         'upcoming_requirements': upcoming_requirements,
         'nearby_donations': nearby_donations,
@@ -74,15 +77,15 @@ def donor_upload_food(request):
             donor = None
             # Ensure authenticated users have a Donor record linked so history shows their uploads
             if request.user.is_authenticated:
-                donor, _ = Donor.objects.get_or_create(
-                    user=request.user,
-                    defaults={
-                        'name': request.user.get_full_name() or request.user.username,
-                        'email': request.user.email or ''
-                    }
-                )
-            elif hasattr(request.user, 'donor_profile'):
-                donor = request.user.donor_profile
+                donor = request.actor.donor
+                if donor is None:
+                    donor, _ = Donor.objects.get_or_create(
+                        user=request.user,
+                        defaults={
+                            'name': request.user.get_full_name() or request.user.username,
+                            'email': request.user.email or ''
+                        }
+                    )
             
             # Create donation
             donation = Donation.objects.create(
@@ -127,9 +130,9 @@ def donor_upload_food(request):
     upcoming_requirements = []
     try:
         if request.user.is_authenticated:
-            donor_obj = Donor.objects.filter(user=request.user).first()
-            if donor_obj and donor_obj.city:
-                upcoming_requirements = NGOFoodRequirement.objects.filter(ngo__city__iexact=donor_obj.city, status='Pending', required_date__gte=date.today()).order_by('required_date')[:10]
+            donor_obj = request.actor.donor
+            if donor_obj and donor_obj.city_key:
+                upcoming_requirements = NGOFoodRequirement.objects.filter(ngo__city_key=donor_obj.city_key, status='Pending', required_date__gte=date.today()).order_by('required_date')[:10]
             else:
                 upcoming_requirements = NGOFoodRequirement.objects.filter(status='Pending', required_date__gte=date.today()).order_by('required_date')[:10]
     except Exception:
@@ -159,135 +162,75 @@ def donor_nutrition_analysis(request):
     return render(request, 'dashboards/donor_nutrition_analysis.html')
 
 
-@donor_required
-def donor_nearby_donations(request):
-    """View nearby donations with distance info for donors."""
-    donor = None
-    if hasattr(request.user, 'donor_profile'):
-        donor = request.user.donor_profile
-    elif request.user.is_authenticated:
-        donor = Donor.objects.filter(user=request.user).first()
-
-    # Get available donations, optionally filtered by donor's city
-    if donor and donor.city:
-        nearby_donations = Donation.objects.filter(status='Available').filter(
-            Q(donor__city__iexact=donor.city) | Q(location__icontains=donor.city)
-        ).order_by('-created_at')
+# Upper bound on menus accepted by one bulk nutrition request. Scoring runs
+# in the request's worker, so this keeps a request to well under a second;
+# larger batches go through ``manage.py score_menus``.
+NUTRITION_BULK_MAX_MENUS = 2000
+
+
+@role_required(['Donor', 'NGO'])
+def nutrition_analysis_bulk(request):
+    """
+    Bulk nutrition scoring (e.g. a whole canteen menu) for donors and NGOs.
+
+    POST either JSON ``{"menus": ["rice, dal", ...], "meal_type": "lunch"}`` or a
+    form with a ``menus`` field holding one ingredient list per line.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST a list of menus.'}, status=405)
+
+    if request.content_type == 'application/json':
+        try:
+            payload = json.loads(request.body.decode('utf-8') or '{}')
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON body.'}, status=400)
+        menus = payload.get('menus')
+        meal_type = payload.get('meal_type', '')
     else:
-        nearby_donations = Donation.objects.filter(status='Available').order_by('-created_at')
+        menus = [line.strip() for line in request.POST.get('menus', '').splitlines() if line.strip()]
+        meal_type = request.POST.get('meal_type', '')
 
-    return render(request, 'dashboards/donor_nearby_donations.html', {
-        'nearby_donations': nearby_donations,
-        'donor': donor,
-    })
+    if not isinstance(menus, list) or not all(isinstance(m, str) for m in menus):
+        return JsonResponse({'error': '"menus" must be a list of strings.'}, status=400)
+    if len(menus) > NUTRITION_BULK_MAX_MENUS:
+        return JsonResponse({'error': f'At most {NUTRITION_BULK_MAX_MENUS} menus per request.'}, status=400)
+
+    from .utils import nutritional_score_batch
+    results = nutritional_score_batch(menus, meal_type or None)
+    return JsonResponse({'count': len(results), 'results': results})
 
 
 @donor_required
+@replica_reads
 def donor_history(request):
     """Donation history tracker for donors."""
-    donor = None
-    if hasattr(request.user, 'donor_profile'):
-        donor = request.user.donor_profile
-    else:
-        # Try to resolve donor by user or email for cases where donor_profile wasn't created
-        if request.user.is_authenticated:
-            donor = Donor.objects.filter(user=request.user).first() or Donor.objects.filter(email=request.user.email).first()
+    donor = request.actor.donor
+    if donor is None and request.user.email:
+        # Fall back to an email match for donors created without a user link
+        donor = Donor.objects.filter(email=request.user.email).first()
     
-    donations = Donation.objects.filter(donor=donor).order_by('-created_at') if donor else []
+    # Live and archived donations, newest first, one keyset page at a time
+    donations = _history_page(request, archive.donor_history, donor)
     
     return render(request, 'dashboards/donor_history.html', {
         'donations': donations,
     })
 
 
+def _history_page(request, history, owner):
+    """Page of ``history(owner)`` at ?cursor=; a stale cursor restarts at page one."""
+    try:
+        return history(owner, cursor=request.GET.get('cursor') or None)
+    except InvalidCursor:
+        return history(owner)
+
+
 # ==================== NGO DASHBOARD ====================
 
 @ngo_required
 def ngo_dashboard(request):
     """NGO dashboard with calendar, nearby donations, and schedule management."""
-    ngo = None
-    if hasattr(request.user, 'user_profile'):
-        # Get NGO associated with user
-        ngo = NGO.objects.filter(email=request.user.email).first()
-    
-    # Get NGO's food requirements
-    requirements = NGOFoodRequirement.objects.filter(ngo=ngo).order_by('required_date', 'required_time') if ngo else []
-    
-    # Get available donations (match by donor city or location text contains NGO city)
-    if ngo and ngo.city:
-        available_qs = Donation.objects.filter(status='Available').filter(
-            Q(donor__city__iexact=ngo.city) | Q(location__icontains=ngo.city)
-        ).order_by('-created_at')[:20]
-    else:
-        available_qs = Donation.objects.filter(status='Available').order_by('-created_at')[:20]
-
-    # Build donation items with completion info (whether pickup completed)
-    available_donations = []
-    for d in available_qs:
-        try:
-            picked_completed = d.status == 'Picked Up' or d.pickup_requests.filter(status='Completed').exists()
-        except Exception:
-            picked_completed = False
-        available_donations.append({
-            'donation': d,
-            'is_completed': picked_completed,
-        })
-    
-    # Get scheduled pickups
-    scheduled_pickups = []  # TODO: Get from PickupRequest model
-    
-    # Compute simple impact metrics for NGO: include donations explicitly assigned to this NGO
-    # and donations where the NGO made pickup requests (covers cases where donation.ngo wasn't set).
-    if ngo:
-        received_qs = Donation.objects.filter(Q(ngo=ngo) | Q(pickup_requests__requester__email=ngo.email)).distinct().order_by('-created_at')
-    else:
-        received_qs = Donation.objects.none()
-    total_received_servings = sum([d.quantity for d in received_qs])
-    # Sum nutritional info safely
-    total_calories = 0
-    total_protein = 0
-    for d in received_qs:
-        info = d.nutritional_info or {}
-        try:
-            total_calories += float(info.get('calories') or 0)
-        except Exception:
-            pass
-        try:
-            total_protein += float(info.get('protein') or 0)
-        except Exception:
-            pass
-
-    # Completion stats for available donations
-    completed_count = sum(1 for item in available_donations if item['is_completed'])
-    not_completed_count = len(available_donations) - completed_count
-
-    # Apply optional filter from query params (all | pending)
-    filter_mode = request.GET.get('filter', 'all')
-    if filter_mode == 'pending':
-        filtered_donations = [item for item in available_donations if not item['is_completed']]
-    else:
-        filtered_donations = available_donations
-
-    nearby_donations = available_qs if available_qs is not None else Donation.objects.filter(status='Available').order_by('-created_at')[:20]
-
-    donors_qs = Donor.objects.filter(city__iexact=ngo.city).order_by('-created_at') if ngo and ngo.city else Donor.objects.all().order_by('-created_at')[:20]
-
-    context = {
-        'ngo': ngo,
-        'requirements': requirements,
-        'available_donations': available_donations,
-        'filtered_donations': filtered_donations,
-        'filter_mode': filter_mode,
-        'scheduled_pickups': scheduled_pickups,
-        'donors': donors_qs,
-        'donors_count': donors_qs.count() if hasattr(donors_qs, 'count') else len(donors_qs),
-        'nearby_donations': nearby_donations,
-        'total_received_servings': total_received_servings,
-        'total_calories': total_calories,
-        'total_protein': total_protein,
-        'available_completed_count': completed_count,
-        'available_not_completed_count': not_completed_count,
-    }
+    context = build_ngo_dashboard_context(request.actor.ngo, request.GET.get('filter', 'all'))
     
     return render(request, 'dashboards/ngo_dashboard.html', context)
 
@@ -295,9 +238,7 @@ def ngo_dashboard(request):
 @ngo_required
 def ngo_calendar(request):
     """Calendar interface for NGOs to mark food requirements."""
-    ngo = None
-    if hasattr(request.user, 'user_profile'):
-        ngo = NGO.objects.filter(email=request.user.email).first()
+    ngo = request.actor.ngo
     
     if request.method == 'POST':
         try:
@@ -324,8 +265,8 @@ def ngo_calendar(request):
         # Notify donors in the NGO's city about the new requirement
         try:
             from .utils import showInAppAlert, sendEmailNotification
-            if ngo and ngo.city:
-                donors_nearby = Donor.objects.filter(city__iexact=ngo.city)
+            if ngo and ngo.city_key:
+                donors_nearby = Donor.objects.filter(city_key=ngo.city_key)
                 for donor in donors_nearby:
                     # Create in-app and email notifications
                     if donor.user:
@@ -357,22 +298,6 @@ def ngo_calendar(request):
     })
 
 
-@ngo_required
-def ngo_nearby_donations(request):
-    """View nearby donations with map/list interface."""
-    ngo = None
-    if hasattr(request.user, 'user_profile'):
-        ngo = NGO.objects.filter(email=request.user.email).first()
-    
-    # Get nearby donations (mock - would use actual location filtering)
-    donations = Donation.objects.filter(status='Available').order_by('-created_at')
-    
-    return render(request, 'dashboards/ngo_nearby_donations.html', {
-        'ngo': ngo,
-        'donations': donations,
-    })
-
-
 @ngo_required
 def ngo_nutrition_analysis(request):
     """Nutrition analysis accessible to NGOs (reuses donor analysis logic)."""
@@ -392,60 +317,96 @@ def ngo_nutrition_analysis(request):
 
 
 @ngo_required
+@replica_reads
 def ngo_history(request):
     """Donation history for NGO: donations reserved or picked up by this NGO."""
-    ngo = NGO.objects.filter(email=request.user.email).first()
-    if ngo:
-        # Include donations explicitly assigned to this NGO and donations requested by this NGO
-        donations = Donation.objects.filter(Q(ngo=ngo) | Q(pickup_requests__requester__email=ngo.email)).distinct().order_by('-created_at')
-    else:
-        donations = []
+    # Donations assigned to or requested by this NGO, live and archived
+    donations = _history_page(request, archive.ngo_history, request.actor.ngo)
 
     return render(request, 'dashboards/ngo_history.html', {
         'donations': donations,
     })
 
 
+# Donor directory columns matched by the ?q= prefix search (see Donor.Meta.indexes)
+DONOR_SEARCH_FIELDS = ('name', 'email', 'city')
+
+
+def _donor_directory_page(request):
+    """First or next page of the donor directory; a stale cursor restarts at page one."""
+    try:
+        return paginate_request(request, Donor.objects.all(), DONOR_SEARCH_FIELDS)
+    except InvalidCursor:
+        return paginate(Donor.objects.all(), search=request.GET.get('q', ''), search_fields=DONOR_SEARCH_FIELDS)
+
+
+def _donor_json(donor):
+    return {
+        'id': donor.id,
+        'name': donor.name,
+        'email': donor.email,
+        'city': donor.city,
+        'is_verified': donor.is_verified,
+        'created_at': donor.created_at.isoformat(),
+    }
+
+
 @ngo_required
 def ngo_donors(request):
-    """Simple donors list for NGOs to view potential donors."""
-    # Show all donors sorted by most recent first
-    donors = Donor.objects.all().order_by('-created_at')
+    """Searchable, paginated donors list for NGOs to view potential donors."""
+    page = _donor_directory_page(request)
     
     context = {
-        'donors': donors,
-        'total_donors': donors.count(),
+        'donors': page,
+        'page': page,
+        'q': page.search,
     }
     
     return render(request, 'dashboards/ngo_donors.html', context)
 
 
+@role_required(['NGO', 'Admin'])
+@replica_reads
+def donor_directory_api(request):
+    """JSON donor directory for incremental loading (``q``, ``cursor``, ``limit``)."""
+    try:
+        page = paginate_request(request, Donor.objects.all(), DONOR_SEARCH_FIELDS)
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+    return JsonResponse(page_json(page, _donor_json))
+
+
 @ngo_required
 def ngo_request_pickup(request, donation_id):
     """Request pickup for a donation."""
     donation = get_object_or_404(Donation, id=donation_id)
-    ngo = NGO.objects.filter(email=request.user.email).first()
+    ngo = request.actor.ngo
     
     if request.method == 'POST':
-        from .models import PickupRequest
-        pickup_request = PickupRequest.objects.create(
-            donation=donation,
-            requester=request.user,
-            requester_name=ngo.name if ngo else request.user.username,
-            requester_email=ngo.email if ngo else request.user.email,
-            requester_phone=ngo.phone if ngo else '',
-            notes=request.POST.get('notes', ''),
-            status='Pending'
-        )
-        # Associate donation with the NGO requesting pickup so NGO history and impact include it
+        # Conditional claim: only one concurrent request can reserve the donation;
+        # NGOs that lose the race join the donation's waitlist
         try:
-            if ngo:
-                donation.ngo = ngo
-        except Exception:
-            pass
-
-        donation.status = 'Reserved'
-        donation.save()
+            pickup_request = claim_donation(
+                donation,
+                requester=request.user,
+                requester_name=ngo.name if ngo else request.user.username,
+                requester_email=ngo.email if ngo else request.user.email,
+                requester_phone=ngo.phone if ngo else '',
+                notes=request.POST.get('notes', ''),
+                # Associate donation with the NGO so NGO history and impact include it
+                ngo=ngo,
+                join_waitlist=True,
+            )
+        except DonationUnavailable:
+            messages.error(request, 'Sorry, this donation is no longer available.')
+            return redirect('ngo_dashboard')
+        if pickup_request.status == 'Waitlisted':
+            messages.info(
+                request,
+                f'This donation is already claimed. You are #{waitlist_position(pickup_request)} '
+                'on the waitlist and will be notified if it is released.'
+            )
+            return redirect('ngo_dashboard')
         # Notify the donor that their donation has been requested
         try:
             from .utils import showInAppAlert, sendEmailNotification
@@ -477,10 +438,12 @@ def ngo_request_pickup(request, donation_id):
 # ==================== ADMIN DASHBOARD ====================
 
 @admin_required
+@replica_reads
 def admin_dashboard(request):
     """Admin dashboard with platform stats, NGO approval queue, and user management."""
-    # Platform stats
-    total_donations = Donation.objects.count()
+    # Platform stats; donation and servings totals come from the city rollups
+    impact = platform_totals()
+    total_donations = impact['donations_count']
     total_donors = Donor.objects.count()
     total_ngos = NGO.objects.count()
     pending_ngos = UserProfile.objects.filter(role='NGO', is_approved=False, is_rejected=False).count()
@@ -512,6 +475,7 @@ def admin_dashboard(request):
 
     context = {
         'total_donations': total_donations,
+        'impact': impact,
         'total_donors': total_donors,
         'total_ngos': total_ngos,
         'pending_ngos': pending_ngos,
@@ -525,42 +489,55 @@ def admin_dashboard(request):
     return render(request, 'dashboards/admin_dashboard.html', context)
 
 
-@login_required
-@donor_required
-def donor_nearby_donations(request):
-    """View for donors to see nearby available donations."""
-    # Get the donor's city and nearby donations
-    donor = request.user.donor
-    donor_city = donor.city
-    
-    # Get all available donations in the same city
-    nearby_donations = Donation.objects.filter(
-        donor__city=donor_city,
-        status='Available'
-    ).exclude(donor=donor)  # Exclude donor's own donations
-    
-    return render(request, 'dashboards/donor_nearby_donations.html', {
-        'nearby_donations': nearby_donations
-    })
+@admin_required
+@replica_reads
+def admin_timeseries(request):
+    """
+    Trend series for admin charts, served from the daily impact rollups.
+
+    Query params: ``metric`` (e.g. donations_count, pickups_completed,
+    expiry_waste_rate), ``bucket`` (day|week|month), ``start``/``end``
+    (YYYY-MM-DD), optional ``scope`` (donor|ngo|city) with ``key``, and
+    ``max_points``.
+    """
+    from .analytics import TimeseriesError, cached_timeseries
+    from django.utils.dateparse import parse_date
+    params = {}
+    try:
+        for name in ('start', 'end'):
+            raw = request.GET.get(name)
+            params[name] = parse_date(raw) if raw else None
+            if raw and params[name] is None:
+                raise ValueError(name)
+        params['max_points'] = int(request.GET['max_points']) if request.GET.get('max_points') else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid start, end or max_points.'}, status=400)
+    try:
+        series = cached_timeseries(
+            metric=request.GET.get('metric', 'donations_count'),
+            bucket=request.GET.get('bucket', 'day'),
+            scope=request.GET.get('scope') or None,
+            key=request.GET.get('key') or None,
+            **params,
+        )
+    except TimeseriesError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(series)
 
 
-@login_required
-@ngo_required
-def ngo_nearby_donations(request):
-    """View for NGOs to see nearby available donations."""
-    # Get the NGO's city
-    ngo = request.user.ngo
-    ngo_city = ngo.city
-    
-    # Get all available donations in the same city
-    nearby_donations = Donation.objects.filter(
-        donor__city=ngo_city,
-        status='Available'
-    )
-    
-    return render(request, 'dashboards/ngo_nearby_donations.html', {
-        'nearby_donations': nearby_donations
-    })
+@admin_required
+def admin_ai_metrics(request):
+    """Latency, error, circuit breaker, bulkhead and coalescing stats for the shared Gemini client."""
+    from .ai_client import get_gemini_manager, get_ai_bulkhead, get_single_flight
+    manager = get_gemini_manager()
+    if manager is None:
+        return JsonResponse({'configured': False})
+    return JsonResponse(dict(
+        manager.get_metrics(),
+        configured=True,
+        bulkhead=get_ai_bulkhead().get_metrics(),
+        coalescing=get_single_flight().get_metrics(),
+    ))
 
 
 @admin_required
@@ -634,7 +611,7 @@ def admin_manage_users(request):
     """User management interface for admins."""
     # Provide richer context: all user profiles and donors
     userprofiles = UserProfile.objects.select_related('user').order_by('-created_at')
-    donors = Donor.objects.all().order_by('-created_at')
+    donors = _donor_directory_page(request)
 
     # Also prepare convenience querysets for templates that need filtered lists
     active_ngos = UserProfile.objects.filter(role='NGO', is_approved=True).select_related('user').order_by('-created_at')
@@ -643,6 +620,8 @@ def admin_manage_users(request):
     return render(request, 'dashboards/admin_manage_users.html', {
         'userprofiles': userprofiles,
         'donors': donors,
+        'page': donors,
+        'q': donors.search,
         'active_ngos': active_ngos,
         'rejected_ngos': rejected_ngos,
     })
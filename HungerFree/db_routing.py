@@ -0,0 +1,136 @@
+"""
+Read-replica routing with read-your-writes stickiness.
+
+Writes always go to ``default``. Reads of this app's models go to a replica
+only inside read-only code: views decorated with @replica_reads, or blocks
+wrapped in ``with read_only():``. Everything else, including auth and
+session tables, reads from the primary.
+
+Stickiness: when a request writes, ReplicaRoutingMiddleware sets a short-lived
+cookie. Until it expires (REPLICA_STICKY_SECONDS) that browser's requests read
+from the primary, so a user never sees a replica that has not caught up with
+their own write. A write inside a read-only block also pins the rest of that
+request to the primary.
+
+A request picks one replica, on its first routed read, and uses it for every
+later read, so its queries never mix replicas that lag by different amounts.
+"""
+import contextvars
+import random
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+STICKY_COOKIE = 'db_primary_until'
+
+# Apps whose reads may be served by a replica
+REPLICA_APP_LABELS = frozenset({'HungerFree'})
+
+
+class RoutingState:
+    """Per-request routing flags."""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned        # read from the primary (recent write by this user)
+        self.read_only = False      # inside @replica_reads / read_only()
+        self.wrote = False          # this request wrote to the primary
+        self.replica = None         # replica chosen for this request's reads
+
+    def read_alias(self):
+        """The request's replica, chosen on first use, or 'default' without replicas."""
+        if self.replica is None:
+            self.replica = choose_replica()
+        return self.replica or 'default'
+
+
+_state = contextvars.ContextVar('db_routing_state', default=None)
+
+
+def choose_replica():
+    """A configured replica alias, or None when there are none."""
+    replicas = settings.DATABASE_REPLICAS
+    return random.choice(replicas) if replicas else None
+
+
+@contextmanager
+def read_only():
+    """Let reads inside the block go to a replica (unless the caller is pinned)."""
+    state = _state.get()
+    token = None
+    if state is None:
+        # Outside a request (shell, commands): scope a state to the block
+        state = RoutingState()
+        token = _state.set(state)
+    previous = state.read_only
+    state.read_only = True
+    try:
+        yield
+    finally:
+        state.read_only = previous
+        if token is not None:
+            _state.reset(token)
+
+
+def replica_reads(view_func):
+    """View decorator: the view only reads, so its queries may use a replica."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        with read_only():
+            return view_func(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    """Database router: primary for writes, replicas for read-only reads."""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.read_only or state.pinned or state.wrote:
+            return 'default'
+        if model._meta.app_label not in REPLICA_APP_LABELS:
+            return 'default'
+        return state.read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        # Session and last_login writes never affect replica reads
+        if state is not None and model._meta.app_label in REPLICA_APP_LABELS:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema by replication
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaRoutingMiddleware:
+    """Scopes routing state to the request and maintains the stickiness cookie."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(STICKY_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        state = RoutingState(pinned=pinned_until > time.time())
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote and settings.DATABASE_REPLICAS:
+            sticky = settings.REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                STICKY_COOKIE, f'{time.time() + sticky:.3f}', max_age=sticky,
+                httponly=True, samesite='Lax',
+            )
+        return response
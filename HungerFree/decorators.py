@@ -6,6 +6,8 @@ from django.shortcuts import redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 
+from .claims import get_role_claims
+
 
 def role_required(allowed_roles):
     """
@@ -20,17 +22,19 @@ def role_required(allowed_roles):
         @wraps(view_func)
         @login_required
         def wrapped_view(request, *args, **kwargs):
-            if not hasattr(request.user, 'user_profile'):
+            # Role and approval come from the profile loaded with the user
+            # (claims.ProfileModelBackend), so this check runs no query.
+            claims = get_role_claims(request)
+            if claims['role'] is None:
                 messages.error(request, 'Please complete your profile setup.')
                 return redirect('register')
             
-            user_profile = request.user.user_profile
-            if user_profile.role not in allowed_roles:
+            if claims['role'] not in allowed_roles:
                 messages.error(request, 'You do not have permission to access this page.')
                 return redirect('home')
             
             # Check if user can access dashboard (NGOs need approval)
-            if not user_profile.can_access_dashboard():
+            if not claims['can_access']:
                 messages.warning(request, 'Your account is pending approval. Please wait for admin approval.')
                 return redirect('home')
             
@@ -0,0 +1,139 @@
+"""
+Expiry sweeper: moves overdue rows out of the live working set.
+
+One sweep, in primary-key chunks of bulk UPDATEs:
+    Donation            Available/Reserved with expiry_date < today -> Expired
+    PickupRequest       Pending/Approved/Waitlisted on a donation expired here -> Expired
+    PickupRequest       Pending/Approved past its pickup_by deadline -> Expired,
+                        and the donation's waitlist head is promoted
+    NGOFoodRequirement  Pending with required_date < today          -> Expired
+
+Bulk UPDATEs bypass Donation.save(), so the sweep records the expired
+servings in the impact rollups itself. The whole run is then announced once
+through the ``expiry_sweep_completed`` signal, not once per row. Run it with
+``manage.py expire_donations`` (one-shot, or ``--loop`` to keep sweeping).
+"""
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Donation, NGOFoodRequirement, PickupRequest
+from .pickups import lapse_overdue_claims
+from .rollups import add_expired, apply_deltas, donation_city, new_deltas
+
+logger = logging.getLogger(__name__)
+
+OPEN_DONATION_STATUSES = ('Available', 'Reserved')
+OPEN_PICKUP_STATUSES = ('Pending', 'Approved', 'Waitlisted')
+
+# Sent once per sweep with the ids moved to Expired:
+#   donation_ids, pickup_ids, lapsed_pickup_ids, requirement_ids (lists), swept_at (datetime)
+expiry_sweep_completed = Signal()
+
+
+class SweepResult:
+    """Ids of the rows one sweep moved to Expired."""
+
+    def __init__(self):
+        self.donation_ids = []
+        self.pickup_ids = []
+        self.lapsed_pickup_ids = []
+        self.requirement_ids = []
+
+    @property
+    def total(self):
+        return (len(self.donation_ids) + len(self.pickup_ids) + len(self.lapsed_pickup_ids)
+                + len(self.requirement_ids))
+
+    def __str__(self):
+        return (f'{len(self.donation_ids)} donations, {len(self.pickup_ids)} pickup requests, '
+                f'{len(self.requirement_ids)} requirements expired, '
+                f'{len(self.lapsed_pickup_ids)} claims lapsed')
+
+
+def _expire_donation_chunk(today, chunk_size, now):
+    """Expire one chunk of overdue donations; returns (donation_ids, pickup_ids)."""
+    with transaction.atomic():
+        # Driven by the (status, expiry_date) index; row locks on backends that have them
+        chunk = list(
+            Donation.objects.select_for_update()
+            .filter(status__in=OPEN_DONATION_STATUSES, expiry_date__lt=today)
+            .order_by('pk')
+            .only('pk', 'donor_id', 'quantity', 'city_key', 'location')[:chunk_size]
+        )
+        if not chunk:
+            return [], []
+        donation_ids = [donation.pk for donation in chunk]
+        # updated_at is set explicitly: auto_now only applies in save()
+        Donation.objects.filter(pk__in=donation_ids).update(status='Expired', updated_at=now)
+
+        pickups = PickupRequest.objects.filter(donation_id__in=donation_ids, status__in=OPEN_PICKUP_STATUSES)
+        pickup_ids = list(pickups.values_list('pk', flat=True))
+        if pickup_ids:
+            PickupRequest.objects.filter(pk__in=pickup_ids).update(status='Expired')
+
+        deltas = new_deltas()
+        day = timezone.localdate(now)
+        for donation in chunk:
+            add_expired(deltas, donation, donation_city(donation), day)
+        apply_deltas(deltas)
+    return donation_ids, pickup_ids
+
+
+def _expire_requirement_chunk(today, chunk_size):
+    with transaction.atomic():
+        requirement_ids = list(
+            NGOFoodRequirement.objects.filter(status='Pending', required_date__lt=today)
+            .order_by('pk').values_list('pk', flat=True)[:chunk_size]
+        )
+        if requirement_ids:
+            NGOFoodRequirement.objects.filter(pk__in=requirement_ids, status='Pending').update(status='Expired')
+    return requirement_ids
+
+
+def sweep_expired(today=None, chunk_size=None):
+    """
+    Run one expiry sweep.
+
+    Args:
+        today: Rows dated before this day are overdue (defaults to the local date)
+        chunk_size: Rows per UPDATE (defaults to settings.EXPIRY_SWEEP_CHUNK_SIZE)
+
+    Returns:
+        SweepResult: Ids moved to Expired, also sent with expiry_sweep_completed
+    """
+    now = timezone.now()
+    today = today or timezone.localdate(now)
+    chunk_size = max(1, chunk_size or settings.EXPIRY_SWEEP_CHUNK_SIZE)
+    result = SweepResult()
+
+    while True:
+        donation_ids, pickup_ids = _expire_donation_chunk(today, chunk_size, now)
+        if not donation_ids:
+            break
+        result.donation_ids.extend(donation_ids)
+        result.pickup_ids.extend(pickup_ids)
+
+    # After the donation pass, so expired donations are not handed on
+    result.lapsed_pickup_ids = lapse_overdue_claims(now)
+
+    while True:
+        requirement_ids = _expire_requirement_chunk(today, chunk_size)
+        if not requirement_ids:
+            break
+        result.requirement_ids.extend(requirement_ids)
+
+    if result.total:
+        expiry_sweep_completed.send(
+            sender=SweepResult,
+            donation_ids=result.donation_ids,
+            pickup_ids=result.pickup_ids,
+            lapsed_pickup_ids=result.lapsed_pickup_ids,
+            requirement_ids=result.requirement_ids,
+            swept_at=now,
+        )
+    logger.info('Expiry sweep: %s', result)
+    return result
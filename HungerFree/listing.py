@@ -0,0 +1,159 @@
+"""
+Shared listing component: keyset pagination and indexed prefix search.
+
+Pages are ordered newest first by (created_at, id) and continue from an opaque
+cursor holding the last row's key, so fetching page N costs the same as page 1
+(no OFFSET scan, no COUNT). Search matches a prefix of any of the given fields
+case-insensitively, written as a range on LOWER(field) so it can use the
+functional indexes declared on the model (e.g. Donor.Meta.indexes).
+paginate_merged() pages several disjoint sources (live rows and their
+archive) with the same cursors.
+"""
+import base64
+import heapq
+from datetime import datetime
+
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def encode_cursor(obj):
+    """Encode the keyset position after ``obj`` as a URL-safe string."""
+    raw = f'{obj.created_at.isoformat()}|{obj.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into (created_at, pk); raises InvalidCursor."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursor(f'Invalid cursor: {cursor!r}') from e
+
+
+def _prefix_upper_bound(prefix):
+    """Smallest string greater than every string starting with ``prefix``."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def prefix_search(queryset, term, fields):
+    """
+    Filter ``queryset`` to rows where any of ``fields`` starts with ``term``
+    (case-insensitive), as LOWER(field) >= term AND LOWER(field) < upper bound.
+    """
+    term = (term or '').strip().lower()
+    if not term or not fields:
+        return queryset
+    upper = _prefix_upper_bound(term)
+    condition = Q()
+    annotations = {}
+    for field in fields:
+        alias = f'_{field}_lower'
+        annotations[alias] = Lower(field)
+        condition |= Q(**{f'{alias}__gte': term, f'{alias}__lt': upper})
+    return queryset.alias(**annotations).filter(condition)
+
+
+class KeysetPage:
+    """One page of a keyset listing."""
+
+    def __init__(self, items, next_cursor, search=''):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.has_more = next_cursor is not None
+        self.search = search
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _after_cursor(queryset, cursor):
+    if not cursor:
+        return queryset
+    created_at, pk = decode_cursor(cursor)
+    return queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+
+
+def _page(rows, page_size, search=''):
+    items = rows[:page_size]
+    next_cursor = encode_cursor(items[-1]) if len(rows) > page_size else None
+    return KeysetPage(items, next_cursor, search)
+
+
+def paginate(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE, search='', search_fields=()):
+    """
+    Return one KeysetPage of ``queryset`` (newest first).
+
+    Args:
+        queryset: Model queryset with ``created_at`` and ``id``
+        cursor: Cursor from a previous page's ``next_cursor``, or None for the first page
+        page_size: Rows per page (capped at MAX_PAGE_SIZE)
+        search: Optional prefix to match against ``search_fields``
+        search_fields: Field names to prefix-search
+
+    Raises:
+        InvalidCursor: If ``cursor`` is malformed
+    """
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    queryset = prefix_search(queryset, search, search_fields)
+    # Fetch one extra row to learn whether another page exists
+    rows = list(_after_cursor(queryset, cursor).order_by('-created_at', '-id')[:page_size + 1])
+    return _page(rows, page_size, search)
+
+
+def paginate_merged(querysets, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return one KeysetPage over several querysets as if they were one table.
+
+    The querysets must not share primary keys (e.g. live rows and their
+    archive). Each contributes at most ``page_size + 1`` rows after the cursor,
+    and the newest of those form the page, so a page costs one bounded query
+    per source however deep it is.
+
+    Raises:
+        InvalidCursor: If ``cursor`` is malformed
+    """
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    sources = [
+        _after_cursor(queryset, cursor).order_by('-created_at', '-id')[:page_size + 1]
+        for queryset in querysets
+    ]
+    merged = heapq.merge(*sources, key=lambda obj: (obj.created_at, obj.pk), reverse=True)
+    rows = [obj for obj, _ in zip(merged, range(page_size + 1))]
+    return _page(rows, page_size)
+
+
+def paginate_request(request, queryset, search_fields=(), page_size=DEFAULT_PAGE_SIZE):
+    """paginate() with ``q``, ``cursor`` and ``limit`` taken from request.GET."""
+    try:
+        page_size = int(request.GET.get('limit', page_size))
+    except (TypeError, ValueError):
+        page_size = DEFAULT_PAGE_SIZE
+    return paginate(
+        queryset,
+        cursor=request.GET.get('cursor') or None,
+        page_size=page_size,
+        search=request.GET.get('q', ''),
+        search_fields=search_fields,
+    )
+
+
+def page_json(page, serialize):
+    """JSON-ready dict for a page, serializing each item with ``serialize``."""
+    return {
+        'results': [serialize(item) for item in page.items],
+        'next_cursor': page.next_cursor,
+        'has_more': page.has_more,
+    }
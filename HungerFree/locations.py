@@ -0,0 +1,96 @@
+"""
+City normalization for location matching.
+
+Free-text cities ("Bangalore ", "BENGALURU", "Bengaluru, Karnataka") are reduced
+to one canonical ``city_key`` ("bengaluru") that is stored in an indexed column
+on Donor, NGO and Donation, so city filters are equality lookups. The pipeline
+is: case folding, punctuation and whitespace cleanup, then the alias table in
+data/city_aliases.json (alternate spellings and former names). Unknown cities
+keep their cleaned text, skipping state and country names.
+"""
+import json
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, FrozenSet, Tuple
+
+CITY_ALIASES_PATH = Path(__file__).resolve().parent / 'data' / 'city_aliases.json'
+
+CITY_KEY_MAX_LENGTH = 100
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s,]+")
+
+
+def clean_location(text: str) -> str:
+    """Case-fold, drop punctuation (commas kept as separators) and collapse whitespace."""
+    cleaned = _PUNCTUATION_RE.sub(' ', (text or '').casefold())
+    return ','.join(' '.join(part.split()) for part in cleaned.split(','))
+
+
+@lru_cache(maxsize=1)
+def load_city_aliases() -> Tuple[Dict[str, str], FrozenSet[str]]:
+    """Map every cleaned name and alias to its canonical city key; also return the region names."""
+    with open(CITY_ALIASES_PATH, encoding='utf-8') as f:
+        data = json.load(f)
+    index = {}
+    for canonical, aliases in data['cities'].items():
+        for name in [canonical] + aliases:
+            index.setdefault(clean_location(name), canonical)
+    return index, frozenset(clean_location(region) for region in data.get('regions', []))
+
+
+def find_known_city(text: str) -> str:
+    """
+    Canonical key of the longest known city name in ``text`` ('' if none).
+
+    Ties go to the rightmost match, since addresses end with the city
+    ("Pune Road, Mumbai" -> "mumbai").
+    """
+    aliases, _ = load_city_aliases()
+    words = clean_location(text).replace(',', ' ').split()
+    for length in range(min(4, len(words)), 0, -1):
+        for start in range(len(words) - length, -1, -1):
+            canonical = aliases.get(' '.join(words[start:start + length]))
+            if canonical:
+                return canonical
+    return ''
+
+
+def _city_parts(text: str):
+    _, regions = load_city_aliases()
+    return [part.strip() for part in clean_location(text).split(',') if part.strip() and part.strip() not in regions]
+
+
+def normalize_city(city: str) -> str:
+    """
+    Canonical key for a city field such as "Bangalore" or "Pune, Maharashtra" ('' when blank).
+
+    Known names and aliases map to their canonical key; an unknown city keeps
+    its cleaned first part, so spellings that differ only in case, spacing or
+    punctuation still compare equal.
+    """
+    known = find_known_city(city)
+    if known:
+        return known
+    parts = _city_parts(city)
+    return parts[0][:CITY_KEY_MAX_LENGTH] if parts else ''
+
+
+def city_key_from_location(location: str) -> str:
+    """
+    City key for a free-text address such as "Andheri West, Bombay": a known
+    city named in it, otherwise the last part that is not a state or country.
+    """
+    known = find_known_city(location)
+    if known:
+        return known
+    parts = _city_parts(location)
+    return parts[-1][:CITY_KEY_MAX_LENGTH] if parts else ''
+
+
+def donation_city_key(location: str, donor_city: str = '') -> str:
+    """
+    City key for a donation: a known city named in its location, else the
+    donor's city, else the last part of the location.
+    """
+    return find_known_city(location) or normalize_city(donor_city) or city_key_from_location(location)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from HungerFree.archive import archive_terminal_rows
+
+
+class Command(BaseCommand):
+    help = 'Move finished donations, pickup requests and read notifications older than N days into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=None,
+                            help='Age threshold in days (default ARCHIVE_AFTER_DAYS)')
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Rows per transaction (default ARCHIVE_CHUNK_SIZE)')
+        parser.add_argument('--segment-dir', default=None,
+                            help='Also write gzip JSONL segments here (default ARCHIVE_SEGMENT_DIR)')
+
+    def handle(self, *args, **options):
+        result = archive_terminal_rows(
+            older_than_days=options['older_than_days'],
+            chunk_size=options['chunk_size'],
+            segment_dir=options['segment_dir'],
+        )
+        for path in result.segments:
+            self.stdout.write(f'Wrote {path}')
+        self.stdout.write(self.style.SUCCESS(f'{result}.'))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from HungerFree.locations import donation_city_key, normalize_city
+from HungerFree.models import Donation, Donor, NGO
+
+
+class Command(BaseCommand):
+    help = 'Recompute the normalized city_key on donors, NGOs and donations, in primary-key chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows read per query (default 2000)')
+        parser.add_argument('--dry-run', action='store_true', help='Count changed rows without writing them')
+
+    def handle(self, *args, **options):
+        chunk_size = max(1, options['chunk_size'])
+        dry_run = options['dry_run']
+
+        # Donors first: donation keys fall back to the donor's city
+        targets = [
+            (Donor.objects.all(), lambda donor: normalize_city(donor.city)),
+            (NGO.objects.all(), lambda ngo: normalize_city(ngo.city)),
+            (
+                Donation.objects.select_related('donor'),
+                lambda donation: donation_city_key(donation.location, donation.donor.city if donation.donor else ''),
+            ),
+        ]
+        for queryset, compute in targets:
+            changed = self._backfill(queryset, compute, chunk_size, dry_run)
+            name = queryset.model._meta.verbose_name_plural
+            verb = 'Would update' if dry_run else 'Updated'
+            self.stdout.write(self.style.SUCCESS(f'{verb} city_key on {changed} {name}.'))
+
+    def _backfill(self, queryset, compute, chunk_size, dry_run):
+        changed = 0
+        last_pk = 0
+        while True:
+            chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:chunk_size])
+            if not chunk:
+                return changed
+            last_pk = chunk[-1].pk
+
+            stale = []
+            for obj in chunk:
+                key = compute(obj)
+                if obj.city_key != key:
+                    obj.city_key = key
+                    stale.append(obj)
+            # bulk_update skips save(), so rollups and signals are untouched
+            if stale and not dry_run:
+                queryset.model.objects.bulk_update(stale, ['city_key'], batch_size=chunk_size)
+            changed += len(stale)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from HungerFree.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild DailyImpactRollup rows from donation history, reading donations in primary-key chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Donations read per query (default 2000)')
+        parser.add_argument('--dry-run', action='store_true', help='Compute rollups without writing them')
+
+    def handle(self, *args, **options):
+        def progress(processed, model):
+            self.stdout.write(f'Processed {processed} {model._meta.verbose_name_plural}...')
+
+        rows, processed = rebuild_rollups(
+            chunk_size=options['chunk_size'], dry_run=options['dry_run'], progress=progress
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Dry run: would write {rows} rollup rows.'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Wrote {rows} rollup rows from {processed} donations.'))
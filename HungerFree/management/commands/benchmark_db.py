@@ -0,0 +1,120 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from FoodSaver.database import sqlite_pragmas
+
+SCHEMA = [
+    """
+    CREATE TABLE donation (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT NOT NULL, quantity INTEGER NOT NULL,
+        location TEXT NOT NULL, status TEXT NOT NULL, created_at TEXT NOT NULL
+    )
+    """,
+    'CREATE INDEX donation_status_created ON donation (status, created_at DESC)',
+]
+READ_SQL = "SELECT id, title, quantity FROM donation WHERE status = 'Available' ORDER BY created_at DESC LIMIT 20"
+WRITE_SQL = "INSERT INTO donation (title, quantity, location, status, created_at) VALUES (?, ?, ?, 'Available', datetime('now'))"
+
+
+class Command(BaseCommand):
+    help = ('Compare concurrent SQLite read/write throughput with the defaults (new connection per '
+            'request, rollback journal) and the tuned configuration (persistent connections, WAL pragmas)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Concurrent reader threads (default 8)')
+        parser.add_argument('--writers', type=int, default=2, help='Concurrent writer threads (default 2)')
+        parser.add_argument('--seconds', type=float, default=5.0, help='Duration of each run (default 5)')
+        parser.add_argument('--rows', type=int, default=5000, help='Rows seeded before each run (default 5000)')
+
+    def handle(self, *args, **options):
+        results = {}
+        for label, persistent, pragmas in (
+            ('default', False, []),
+            ('tuned', True, sqlite_pragmas()),
+        ):
+            results[label] = self._run(label, persistent, pragmas, options)
+
+        before, after = results['default'], results['tuned']
+        for kind in ('reads', 'writes'):
+            ratio = after[kind] / before[kind] if before[kind] else float('inf')
+            self.stdout.write(self.style.SUCCESS(f'{kind}: {ratio:.1f}x the default throughput'))
+
+    def _run(self, label, persistent, pragmas, options):
+        directory = tempfile.mkdtemp(prefix='benchmark_db_')
+        path = os.path.join(directory, 'bench.sqlite3')
+        try:
+            seed = self._connect(path, pragmas)
+            for sql in SCHEMA:
+                seed.execute(sql)
+            seed.executemany(WRITE_SQL, [(f'Meal {i}', 10, 'Pune') for i in range(options['rows'])])
+            seed.commit()
+            seed.close()
+
+            counts = {'reads': 0, 'writes': 0, 'errors': 0}
+            latencies = []
+            lock = threading.Lock()
+            deadline = time.monotonic() + options['seconds']
+
+            def worker(kind):
+                conn = self._connect(path, pragmas) if persistent else None
+                done, errors, waits = 0, 0, []
+                while time.monotonic() < deadline:
+                    # Without persistent connections every request pays for a connect
+                    current = conn or self._connect(path, pragmas)
+                    started = time.perf_counter()
+                    try:
+                        if kind == 'reads':
+                            current.execute(READ_SQL).fetchall()
+                        else:
+                            current.execute('BEGIN IMMEDIATE' if persistent else 'BEGIN')
+                            current.execute(WRITE_SQL, ('Meal', 5, 'Pune'))
+                            current.execute('COMMIT')
+                        done += 1
+                        waits.append(time.perf_counter() - started)
+                    except sqlite3.OperationalError:
+                        errors += 1
+                        if current.in_transaction:
+                            current.execute('ROLLBACK')
+                    finally:
+                        if conn is None:
+                            current.close()
+                if conn is not None:
+                    conn.close()
+                with lock:
+                    counts[kind] += done
+                    counts['errors'] += errors
+                    latencies.extend(waits)
+
+            threads = (
+                [threading.Thread(target=worker, args=('reads',)) for _ in range(options['readers'])]
+                + [threading.Thread(target=worker, args=('writes',)) for _ in range(options['writers'])]
+            )
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        seconds = options['seconds']
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+        result = {'reads': counts['reads'] / seconds, 'writes': counts['writes'] / seconds}
+        self.stdout.write(
+            f"{label:>8}: {result['reads']:9.0f} reads/s  {result['writes']:7.0f} writes/s  "
+            f"p95 {p95:6.2f} ms  {counts['errors']} lock errors"
+        )
+        return result
+
+    def _connect(self, path, pragmas):
+        # isolation_level=None: transactions are managed explicitly, like Django's autocommit
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        for pragma in pragmas:
+            conn.execute(pragma)
+        return conn
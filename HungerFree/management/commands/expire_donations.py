@@ -0,0 +1,49 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from HungerFree.expiry import sweep_expired
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Expire overdue donations, their open pickup requests and past NGO requirements'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=None,
+                            help='Rows per UPDATE (default EXPIRY_SWEEP_CHUNK_SIZE)')
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping on a fixed interval')
+        parser.add_argument('--interval', type=int, default=None,
+                            help='Seconds between sweeps with --loop (default EXPIRY_SWEEP_INTERVAL_SECONDS)')
+        parser.add_argument('--max-runs', type=int, default=None, help='Stop --loop after this many sweeps')
+
+    def handle(self, *args, **options):
+        interval = max(1, options['interval'] or settings.EXPIRY_SWEEP_INTERVAL_SECONDS)
+        runs = 0
+        while True:
+            started = time.monotonic()
+            runs += 1
+            try:
+                result = sweep_expired(chunk_size=options['chunk_size'])
+            except Exception:
+                if not options['loop']:
+                    raise
+                # A failed sweep (e.g. a dropped connection) must not stop the loop
+                logger.exception('Expiry sweep %s failed', runs)
+                self.stderr.write(f'Sweep {runs} failed; retrying in the next interval.')
+            else:
+                self.stdout.write(self.style.SUCCESS(f'Sweep {runs}: {result}.'))
+
+            if not options['loop'] or (options['max_runs'] and runs >= options['max_runs']):
+                return
+            # Drop connections past CONN_MAX_AGE or broken while idle
+            close_old_connections()
+            try:
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+            except KeyboardInterrupt:
+                self.stdout.write('Stopped.')
+                return
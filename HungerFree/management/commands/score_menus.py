@@ -0,0 +1,44 @@
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.core.management.base import BaseCommand
+
+from HungerFree.utils import nutritional_score, nutritional_score_batch
+
+# Smaller inputs are scored in this process; forking costs more than it saves
+PARALLEL_THRESHOLD = 50000
+
+
+class Command(BaseCommand):
+    help = 'Score a file of menus (one comma-separated ingredient list per line) and print JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin")
+        parser.add_argument('--meal-type', default=None, help='Meal type applied to every menu')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Processes for large inputs (default: CPU count; 1 disables the pool)')
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            menus = [line.strip() for line in sys.stdin]
+        else:
+            with open(options['path'], encoding='utf-8') as f:
+                menus = [line.strip() for line in f]
+        menus = [menu for menu in menus if menu]
+
+        meal_type = options['meal_type']
+        workers = options['workers'] or os.cpu_count() or 1
+        if workers == 1 or len(menus) < PARALLEL_THRESHOLD:
+            results = nutritional_score_batch(menus, meal_type)
+        else:
+            chunksize = max(1, len(menus) // (workers * 4))
+            with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+                results = pool.map(partial(nutritional_score, meal_type=meal_type), menus, chunksize=chunksize)
+
+        for result in results:
+            self.stdout.write(json.dumps(result))
+        self.stderr.write(f'Scored {len(menus)} menus.')
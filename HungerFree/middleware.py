@@ -1,8 +1,25 @@
 """
-Middleware for role-based redirects after login.
+Middleware for role-based redirects after login, request-scoped actor loading,
+per-request Server-Timing instrumentation and serving collected static files.
 """
+import logging
+import os
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
 from django.shortcuts import redirect
 from django.urls import reverse
+from django.utils.functional import cached_property
+
+from . import timing
+from .claims import ACTOR_RELATIONS
+from .models import NGO
+from .staticfiles import build_index
+
+timing_logger = logging.getLogger('HungerFree.timing')
 
 
 class RoleBasedRedirectMiddleware:
@@ -41,3 +58,132 @@ class RoleBasedRedirectMiddleware:
 
         return self.get_response(request)
 
+
+
+class Actor:
+    """
+    The current user's UserProfile, role and Donor/NGO records.
+
+    The relations normally arrive with request.user, loaded by
+    claims.ProfileModelBackend, and cost no query. Otherwise (sessions from
+    another backend, RequestFactory users) they are resolved on first access
+    with a single select_related query and cached on request.user, so
+    ``request.user.user_profile`` (views, templates) costs no further queries.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @cached_property
+    def _related(self):
+        if not self.user.is_authenticated:
+            return dict.fromkeys(ACTOR_RELATIONS)
+        fields = [User._meta.get_field(name) for name in ACTOR_RELATIONS]
+        if all(field.is_cached(self.user) for field in fields):
+            return {field.name: field.get_cached_value(self.user) for field in fields}
+        loaded = User.objects.select_related(*ACTOR_RELATIONS).filter(pk=self.user.pk).first()
+        related = {}
+        for field in fields:
+            related[field.name] = field.get_cached_value(loaded, None) if loaded else None
+            field.set_cached_value(self.user, related[field.name])
+        return related
+
+    @property
+    def profile(self):
+        return self._related['user_profile']
+
+    @property
+    def role(self):
+        return self.profile.role if self.profile else None
+
+    @property
+    def donor(self):
+        return self._related['donor_profile']
+
+    @cached_property
+    def ngo(self):
+        """Linked NGO, falling back to an email match for NGOs created without a user link."""
+        ngo = self._related['ngo_profile']
+        if ngo is None and self.user.is_authenticated and self.user.email:
+            ngo = NGO.objects.filter(email=self.user.email).first()
+        return ngo
+
+
+def get_actor(request):
+    """Return request.actor, attaching one if ActorMiddleware did not run (e.g. RequestFactory)."""
+    if not hasattr(request, 'actor'):
+        request.actor = Actor(request.user)
+    return request.actor
+
+
+class ActorMiddleware:
+    """Attach a lazily loaded :class:`Actor` as ``request.actor``."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.actor = Actor(request.user)
+        return self.get_response(request)
+
+
+class ServerTimingMiddleware:
+    """
+    Time each request and report it as a ``Server-Timing`` header and a log line.
+
+    Records total time, DB query count and time, template render time and
+    external call time (see HungerFree.timing). Requests faster than
+    REQUEST_TIMING_LOG_MIN_MS are not logged; the header is always set.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.log_min_seconds = settings.REQUEST_TIMING_LOG_MIN_MS / 1000
+
+    def __call__(self, request):
+        timings, token = timing.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing.record_query))
+                response = self.get_response(request)
+        finally:
+            timing.finish(token)
+
+        total = timings.elapsed()
+        response['Server-Timing'] = timings.header(total)
+        if total >= self.log_min_seconds and timing_logger.isEnabledFor(logging.INFO):
+            timing_logger.info(
+                'request method=%s path=%s status=%s total_ms=%.1f db_queries=%d db_ms=%.1f tpl_ms=%.1f%s',
+                request.method, request.path, response.status_code, total * 1000,
+                timings.db_count, timings.db_time * 1000, timings.template_time * 1000,
+                ''.join(f' {name}_ms={seconds * 1000:.1f}' for name, seconds in timings.external.items()),
+            )
+        return response
+
+
+class StaticFilesMiddleware:
+    """
+    Serve STATIC_ROOT (as written by collectstatic) before the rest of the stack.
+
+    The file index is built once at startup; a path that is not in it falls
+    through to the next middleware. Without a collected STATIC_ROOT (local
+    development, tests) the middleware removes itself.
+    """
+
+    def __init__(self, get_response):
+        root = settings.STATIC_ROOT
+        if not root or not os.path.isdir(root):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else '/' + settings.STATIC_URL
+        self.files = build_index(root, self.prefix)
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix):
+            static_file = self.files.get(request.path)
+            if static_file is not None:
+                return static_file.response(request)
+        return self.get_response(request)
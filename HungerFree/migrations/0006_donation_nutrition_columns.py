@@ -0,0 +1,72 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:05
+
+import re
+
+from django.db import migrations, models
+
+NUTRITION_FIELDS = ('calories', 'protein', 'carbs', 'fats', 'fiber')
+BATCH_SIZE = 2000
+
+
+def _parse(value):
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.match(r'\s*(\d+(?:\.\d+)?)', str(value))
+    return float(match.group(1)) if match else None
+
+
+def backfill_nutrition_columns(apps, schema_editor):
+    """Copy numeric nutritional_info values into the new typed columns."""
+    Donation = apps.get_model('HungerFree', 'Donation')
+    batch = []
+    for donation in Donation.objects.only('id', 'nutritional_info').iterator(chunk_size=BATCH_SIZE):
+        info = donation.nutritional_info if isinstance(donation.nutritional_info, dict) else {}
+        values = {field: _parse(info.get(field)) for field in NUTRITION_FIELDS}
+        if not any(v is not None for v in values.values()):
+            continue
+        for field, value in values.items():
+            setattr(donation, field, value)
+        batch.append(donation)
+        if len(batch) >= BATCH_SIZE:
+            Donation.objects.bulk_update(batch, NUTRITION_FIELDS)
+            batch = []
+    if batch:
+        Donation.objects.bulk_update(batch, NUTRITION_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HungerFree', '0005_ngo_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donation',
+            name='calories',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='donation',
+            name='carbs',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='donation',
+            name='fats',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='donation',
+            name='fiber',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='donation',
+            name='protein',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_nutrition_columns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:12
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HungerFree', '0006_donation_nutrition_columns'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='donor',
+            index=models.Index(fields=['-created_at', '-id'], name='donor_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donor',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='donor_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donor',
+            index=models.Index(django.db.models.functions.text.Lower('email'), name='donor_email_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donor',
+            index=models.Index(django.db.models.functions.text.Lower('city'), name='donor_city_lower_idx'),
+        ),
+    ]
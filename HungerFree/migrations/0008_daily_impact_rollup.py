@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HungerFree', '0007_donor_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyImpactRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('scope', models.CharField(choices=[('donor', 'Donor'), ('ngo', 'NGO'), ('city', 'City')], max_length=10)),
+                ('key', models.CharField(help_text='Donor/NGO id, or normalized city name', max_length=200)),
+                ('donations_count', models.IntegerField(default=0)),
+                ('servings_donated', models.IntegerField(default=0)),
+                ('calories', models.FloatField(default=0)),
+                ('pickups_completed', models.IntegerField(default=0)),
+                ('servings_received', models.IntegerField(default=0)),
+                ('servings_expired', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-date'],
+                'indexes': [models.Index(fields=['scope', 'date'], name='HungerFree__scope_c0fff2_idx')],
+                'constraints': [models.UniqueConstraint(fields=('scope', 'key', 'date'), name='unique_impact_rollup_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,91 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+TABLE = '"HungerFree_donation"'
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS donation_fts USING fts5(
+        title, description, location,
+        content='HungerFree_donation', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS donation_fts_ai AFTER INSERT ON {TABLE} BEGIN
+        INSERT INTO donation_fts(rowid, title, description, location)
+        VALUES (new.id, new.title, new.description, new.location);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS donation_fts_ad AFTER DELETE ON {TABLE} BEGIN
+        INSERT INTO donation_fts(donation_fts, rowid, title, description, location)
+        VALUES ('delete', old.id, old.title, old.description, old.location);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS donation_fts_au AFTER UPDATE OF title, description, location ON {TABLE} BEGIN
+        INSERT INTO donation_fts(donation_fts, rowid, title, description, location)
+        VALUES ('delete', old.id, old.title, old.description, old.location);
+        INSERT INTO donation_fts(rowid, title, description, location)
+        VALUES (new.id, new.title, new.description, new.location);
+    END
+    """,
+    # Index existing rows
+    "INSERT INTO donation_fts(donation_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS donation_fts_ai',
+    'DROP TRIGGER IF EXISTS donation_fts_ad',
+    'DROP TRIGGER IF EXISTS donation_fts_au',
+    'DROP TABLE IF EXISTS donation_fts',
+]
+
+# Expression must match search.PG_SEARCH_VECTOR for the planner to use the index
+POSTGRES_FORWARD = [
+    f"""
+    CREATE INDEX IF NOT EXISTS donation_search_gin ON {TABLE} USING GIN (
+        to_tsvector('english', coalesce({TABLE}."title", '') || ' ' ||
+        coalesce({TABLE}."description", '') || ' ' || coalesce({TABLE}."location", ''))
+    )
+    """,
+]
+
+POSTGRES_REVERSE = ['DROP INDEX IF EXISTS donation_search_gin']
+
+
+def _run(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def create_search_backend(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            _run(schema_editor, SQLITE_FORWARD)
+        except OperationalError:
+            # SQLite built without FTS5: search.py falls back to icontains
+            _run(schema_editor, SQLITE_REVERSE)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_FORWARD)
+
+
+def drop_search_backend(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, SQLITE_REVERSE)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_REVERSE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HungerFree', '0009_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_backend, drop_search_backend),
+    ]
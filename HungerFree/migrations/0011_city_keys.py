@@ -0,0 +1,66 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:31
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# SQLite adds the donation column by rebuilding the table, which drops the
+# FTS5 triggers from 0010; reinstall them (and reindex) afterwards.
+search_backend = import_module('HungerFree.migrations.0010_donation_search')
+
+CHUNK_SIZE = 2000
+
+
+def _backfill(model, compute):
+    last_pk = 0
+    while True:
+        chunk = list(model.objects.filter(pk__gt=last_pk).order_by('pk')[:CHUNK_SIZE])
+        if not chunk:
+            return
+        last_pk = chunk[-1].pk
+        for obj in chunk:
+            obj.city_key = compute(obj)
+        model.objects.bulk_update(chunk, ['city_key'])
+
+
+def backfill_city_keys(apps, schema_editor):
+    from HungerFree.locations import donation_city_key, normalize_city
+
+    donor_cities = dict(apps.get_model('HungerFree', 'Donor').objects.values_list('id', 'city'))
+    for name in ('Donor', 'NGO'):
+        _backfill(apps.get_model('HungerFree', name), lambda obj: normalize_city(obj.city))
+    _backfill(
+        apps.get_model('HungerFree', 'Donation'),
+        lambda d: donation_city_key(d.location, donor_cities.get(d.donor_id, '')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HungerFree', '0010_donation_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donation',
+            name='city_key',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='donor',
+            name='city_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='ngo',
+            name='city_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='donation',
+            index=models.Index(fields=['city_key', 'status', '-created_at'], name='donation_city_status_idx'),
+        ),
+        migrations.RunPython(backfill_city_keys, migrations.RunPython.noop),
+        migrations.RunPython(search_backend.create_search_backend, migrations.RunPython.noop),
+    ]
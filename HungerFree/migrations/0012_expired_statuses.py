@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HungerFree', '0011_city_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ngofoodrequirement',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Fulfilled', 'Fulfilled'), ('Cancelled', 'Cancelled'), ('Expired', 'Expired')], default='Pending', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='pickuprequest',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Approved', 'Approved'), ('Rejected', 'Rejected'), ('Completed', 'Completed'), ('Cancelled', 'Cancelled'), ('Expired', 'Expired')], default='Pending', max_length=20),
+        ),
+    ]
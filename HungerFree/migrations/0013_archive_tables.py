@@ -0,0 +1,111 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HungerFree', '0012_expired_statuses'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedDonation',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('quantity', models.IntegerField()),
+                ('unit', models.CharField(max_length=50)),
+                ('location', models.CharField(max_length=200)),
+                ('city_key', models.CharField(blank=True, max_length=100)),
+                ('expiry_date', models.DateField()),
+                ('status', models.CharField(choices=[('Available', 'Available'), ('Reserved', 'Reserved'), ('Picked Up', 'Picked Up'), ('Expired', 'Expired'), ('Cancelled', 'Cancelled')], max_length=20)),
+                ('calories', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedNotification',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('notification_type', models.CharField(choices=[('ngo_approval', 'NGO Approval'), ('ngo_rejection', 'NGO Rejection'), ('food_shortage', 'Food Shortage Nearby'), ('donation_confirmed', 'Donation Confirmed'), ('donation_accepted', 'Donation Accepted'), ('pickup_scheduled', 'Pickup Scheduled')], max_length=50)),
+                ('title', models.CharField(max_length=200)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedPickupRequest',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('donation_id', models.BigIntegerField(db_index=True)),
+                ('requester_name', models.CharField(max_length=200)),
+                ('requester_email', models.EmailField(max_length=254)),
+                ('status', models.CharField(choices=[('Pending', 'Pending'), ('Approved', 'Approved'), ('Rejected', 'Rejected'), ('Completed', 'Completed'), ('Cancelled', 'Cancelled'), ('Expired', 'Expired')], max_length=20)),
+                ('requested_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'ordering': ['-requested_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['is_read', 'created_at'], name='notification_read_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pickuprequest',
+            index=models.Index(fields=['status', 'requested_at'], name='pickup_status_requested_idx'),
+        ),
+        migrations.AddField(
+            model_name='archiveddonation',
+            name='donor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_donations', to='HungerFree.donor'),
+        ),
+        migrations.AddField(
+            model_name='archiveddonation',
+            name='ngo',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_donations', to='HungerFree.ngo'),
+        ),
+        migrations.AddField(
+            model_name='archivednotification',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='archivedpickuprequest',
+            name='requester',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='archived_pickup_requests', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='archiveddonation',
+            index=models.Index(fields=['donor', '-created_at'], name='archived_donation_donor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archiveddonation',
+            index=models.Index(fields=['ngo', '-created_at'], name='archived_donation_ngo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivednotification',
+            index=models.Index(fields=['user', '-created_at'], name='archived_notification_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedpickuprequest',
+            index=models.Index(fields=['requester', 'status'], name='archived_pickup_requester_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-18 23:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HungerFree', '0013_archive_tables'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='pickuprequest',
+            name='pickup_donation_status_idx',
+        ),
+        migrations.AddField(
+            model_name='pickuprequest',
+            name='pickup_by',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='archivedpickuprequest',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Approved', 'Approved'), ('Rejected', 'Rejected'), ('Completed', 'Completed'), ('Cancelled', 'Cancelled'), ('Expired', 'Expired'), ('Waitlisted', 'Waitlisted')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='pickuprequest',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Approved', 'Approved'), ('Rejected', 'Rejected'), ('Completed', 'Completed'), ('Cancelled', 'Cancelled'), ('Expired', 'Expired'), ('Waitlisted', 'Waitlisted')], default='Pending', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='pickuprequest',
+            index=models.Index(fields=['donation', 'status', 'id'], name='pickup_donation_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pickuprequest',
+            index=models.Index(fields=['status', 'pickup_by'], name='pickup_status_deadline_idx'),
+        ),
+    ]
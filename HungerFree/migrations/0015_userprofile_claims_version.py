@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HungerFree', '0014_pickup_waitlist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='claims_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
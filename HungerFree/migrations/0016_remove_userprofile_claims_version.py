@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:25
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HungerFree', '0015_userprofile_claims_version'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='userprofile',
+            name='claims_version',
+        ),
+    ]
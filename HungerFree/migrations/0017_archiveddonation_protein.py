@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:28
+
+from django.db import migrations, models
+
+CHUNK_SIZE = 2000
+
+
+def copy_protein_from_data(apps, schema_editor):
+    # Rows archived before this column existed kept protein in ``data``
+    ArchivedDonation = apps.get_model('HungerFree', 'ArchivedDonation')
+    last_pk = 0
+    while True:
+        chunk = list(ArchivedDonation.objects.filter(pk__gt=last_pk).order_by('pk')[:CHUNK_SIZE])
+        if not chunk:
+            return
+        last_pk = chunk[-1].pk
+        for archived in chunk:
+            archived.protein = archived.data.pop('protein', None)
+        ArchivedDonation.objects.bulk_update(chunk, ['protein', 'data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HungerFree', '0016_remove_userprofile_claims_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archiveddonation',
+            name='protein',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(copy_protein_from_data, migrations.RunPython.noop),
+    ]
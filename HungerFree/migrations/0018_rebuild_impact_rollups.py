@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-19 00:40
+
+from django.db import migrations
+
+
+def rebuild_impact_rollups(apps, schema_editor):
+    # Rollups were only maintained from 0008 on, and only for new changes;
+    # rebuild them once from full history so dashboards start out correct
+    from HungerFree.rollups import rebuild_rollups
+    rebuild_rollups(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('HungerFree', '0017_archiveddonation_protein'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_impact_rollups, migrations.RunPython.noop),
+    ]
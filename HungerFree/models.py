@@ -1,10 +1,24 @@
-from django.db import models
+import re
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.contrib.auth.signals import user_logged_in
 from django.dispatch import receiver
 from datetime import date, timedelta
+from django.db.models.functions import Lower
 from django.db.models.signals import post_save
 
+from .locations import donation_city_key, normalize_city
+
+
+def parse_nutrient_value(value):
+    """Parse a nutritional_info entry ("250", 250, "12.5 g") to float, or None."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = re.match(r'\s*(\d+(?:\.\d+)?)', str(value))
+    return float(match.group(1)) if match else None
+
 
 # User Profile with Role-Based Access Control
 class UserProfile(models.Model):
@@ -67,14 +81,27 @@ class Donor(models.Model):
     phone = models.CharField(max_length=20, blank=True)
     address = models.TextField(blank=True)
     city = models.CharField(max_length=100, blank=True)
+    # Canonical form of city (see locations.py), kept in sync on save
+    city_key = models.CharField(max_length=100, blank=True, db_index=True, editable=False)
     is_verified = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination and case-insensitive prefix search (see listing.py)
+            models.Index(fields=['-created_at', '-id'], name='donor_created_id_idx'),
+            models.Index(Lower('name'), name='donor_name_lower_idx'),
+            models.Index(Lower('email'), name='donor_email_lower_idx'),
+            models.Index(Lower('city'), name='donor_city_lower_idx'),
+        ]
     
     def __str__(self):
         return self.name
+    
+    def save(self, *args, **kwargs):
+        self.city_key = normalize_city(self.city)
+        super().save(*args, **kwargs)
 
 
 class NGO(models.Model):
@@ -86,15 +113,24 @@ class NGO(models.Model):
     phone = models.CharField(max_length=20)
     address = models.TextField()
     city = models.CharField(max_length=100)
+    city_key = models.CharField(max_length=100, blank=True, db_index=True, editable=False)
     is_verified = models.BooleanField(default=False)
     registration_number = models.CharField(max_length=100, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['name']
+        indexes = [
+            # NGOs are resolved by their login email
+            models.Index(fields=['email'], name='ngo_email_idx'),
+        ]
     
     def __str__(self):
         return self.name
+    
+    def save(self, *args, **kwargs):
+        self.city_key = normalize_city(self.city)
+        super().save(*args, **kwargs)
 
 
 class Donation(models.Model):
@@ -115,11 +151,20 @@ class Donation(models.Model):
     quantity = models.IntegerField()
     unit = models.CharField(max_length=50, default='servings', help_text='e.g., servings, kg, pieces')
     location = models.CharField(max_length=200)
+    # City the donation is in: from location, else the donor's city (see locations.py)
+    city_key = models.CharField(max_length=100, blank=True, editable=False)
     latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     expiry_date = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Available')
     nutritional_info = models.JSONField(default=dict, blank=True, help_text='Nutritional information as JSON')
+    # Typed copies of the numeric nutritional_info values, kept in sync on save
+    # so impact totals can be aggregated in the database.
+    calories = models.FloatField(null=True, blank=True)
+    protein = models.FloatField(null=True, blank=True)
+    carbs = models.FloatField(null=True, blank=True)
+    fats = models.FloatField(null=True, blank=True)
+    fiber = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     pickup_by = models.DateTimeField(null=True, blank=True, help_text='Preferred pickup deadline')
@@ -129,19 +174,61 @@ class Donation(models.Model):
         indexes = [
             models.Index(fields=['status', 'expiry_date']),
             models.Index(fields=['location']),
+            # status='Available' lists ordered newest first
+            models.Index(fields=['status', '-created_at'], name='donation_status_created_idx'),
+            # Available donations in a city, newest first
+            models.Index(fields=['city_key', 'status', '-created_at'], name='donation_city_status_idx'),
         ]
     
+    NUTRITION_FIELDS = ('calories', 'protein', 'carbs', 'fats', 'fiber')
+    
     def __str__(self):
         return f"{self.title} - {self.quantity} {self.unit}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so save() can report status transitions
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        self.sync_nutrition_fields()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            self.sync_city_key()
+        elif 'location' in update_fields:
+            self.sync_city_key()
+            kwargs['update_fields'] = set(update_fields) | {'city_key'}
+        created = self._state.adding
+        previous_status = getattr(self, '_loaded_status', None)
+        from .rollups import record_donation_saved
+        # One transaction, so a concurrent rollup rebuild sees the row and its
+        # increment together or not at all (rollups.rebuild_rollups)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            record_donation_saved(self, created, previous_status)
+        self._loaded_status = self.status
+    
+    def sync_nutrition_fields(self):
+        """Copy numeric values from nutritional_info into the typed columns."""
+        info = self.nutritional_info if isinstance(self.nutritional_info, dict) else {}
+        for field in self.NUTRITION_FIELDS:
+            setattr(self, field, parse_nutrient_value(info.get(field)))
+    
+    def sync_city_key(self):
+        """Recompute city_key from location and the donor's city."""
+        donor_city = self.donor.city if self.donor_id else ''
+        self.city_key = donation_city_key(self.location, donor_city)
+    
     def is_urgent(self):
         """Check if donation expires today or tomorrow."""
         today = date.today()
         return self.expiry_date <= today + timedelta(days=1)
     
     def is_expired(self):
-        """Check if donation has expired."""
-        return self.expiry_date < date.today()
+        """Check if donation has expired (swept to Expired, or past its expiry date)."""
+        return self.status == 'Expired' or self.expiry_date < date.today()
     
     def expire_priority(self):
         """Return priority level based on expiry date."""
@@ -163,6 +250,8 @@ class PickupRequest(models.Model):
         ('Rejected', 'Rejected'),
         ('Completed', 'Completed'),
         ('Cancelled', 'Cancelled'),
+        ('Expired', 'Expired'),
+        ('Waitlisted', 'Waitlisted'),
     ]
     
     donation = models.ForeignKey(Donation, on_delete=models.CASCADE, related_name='pickup_requests')
@@ -173,10 +262,21 @@ class PickupRequest(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
     requested_at = models.DateTimeField(auto_now_add=True)
     scheduled_pickup = models.DateTimeField(null=True, blank=True)
+    # Deadline of an active claim; past it the claim lapses to the waitlist (see pickups.py)
+    pickup_by = models.DateTimeField(null=True, blank=True)
     notes = models.TextField(blank=True)
     
     class Meta:
         ordering = ['-requested_at']
+        indexes = [
+            # Completed-pickup checks per donation (dashboards, rollups); with id
+            # it is also the FIFO waitlist order, so the head is one index seek
+            models.Index(fields=['donation', 'status', 'id'], name='pickup_donation_queue_idx'),
+            # Active claims past their deadline (pickups.lapse_overdue_claims)
+            models.Index(fields=['status', 'pickup_by'], name='pickup_status_deadline_idx'),
+            # Archival of finished requests by age (archive.py)
+            models.Index(fields=['status', 'requested_at'], name='pickup_status_requested_idx'),
+        ]
     
     def __str__(self):
         return f"Pickup request for {self.donation.title} by {self.requester_name}"
@@ -222,6 +322,7 @@ class NGOFoodRequirement(models.Model):
         ('Pending', 'Pending'),
         ('Fulfilled', 'Fulfilled'),
         ('Cancelled', 'Cancelled'),
+        ('Expired', 'Expired'),
     ]
     
     ngo = models.ForeignKey(NGO, on_delete=models.CASCADE, related_name='food_requirements')
@@ -264,11 +365,128 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Unread notifications for a user, newest first
+            models.Index(fields=['user', 'is_read', '-created_at'], name='notification_unread_idx'),
+            # Archival of read notifications by age (archive.py)
+            models.Index(fields=['is_read', 'created_at'], name='notification_read_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.get_notification_type_display()}"
 
 
+class DailyImpactRollup(models.Model):
+    """Per-day impact totals for one donor, NGO or city, maintained incrementally by rollups.py."""
+    SCOPE_CHOICES = [
+        ('donor', 'Donor'),
+        ('ngo', 'NGO'),
+        ('city', 'City'),
+    ]
+    
+    date = models.DateField()
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    key = models.CharField(max_length=200, help_text='Donor/NGO id, or normalized city name')
+    donations_count = models.IntegerField(default=0)
+    servings_donated = models.IntegerField(default=0)
+    calories = models.FloatField(default=0)
+    pickups_completed = models.IntegerField(default=0)
+    servings_received = models.IntegerField(default=0)
+    servings_expired = models.IntegerField(default=0)
+    
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key', 'date'], name='unique_impact_rollup_day'),
+        ]
+        indexes = [
+            models.Index(fields=['scope', 'date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.scope}:{self.key} {self.date}"
+
+
+# ==================== ARCHIVE (see archive.py) ====================
+# Terminal rows moved out of the hot tables keep their original id. Columns
+# that history views and rollups read are copied; everything else is kept
+# in ``data``.
+
+class ArchivedDonation(models.Model):
+    """A picked-up, expired or cancelled donation moved out of Donation."""
+    id = models.BigIntegerField(primary_key=True)
+    donor = models.ForeignKey(Donor, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_donations')
+    ngo = models.ForeignKey(NGO, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_donations')
+    title = models.CharField(max_length=200)
+    quantity = models.IntegerField()
+    unit = models.CharField(max_length=50)
+    location = models.CharField(max_length=200)
+    city_key = models.CharField(max_length=100, blank=True)
+    expiry_date = models.DateField()
+    status = models.CharField(max_length=20, choices=Donation.STATUS_CHOICES)
+    calories = models.FloatField(null=True, blank=True)
+    protein = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    data = models.JSONField(default=dict, blank=True)
+    
+    is_archived = True
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['donor', '-created_at'], name='archived_donation_donor_idx'),
+            models.Index(fields=['ngo', '-created_at'], name='archived_donation_ngo_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.title} - {self.quantity} {self.unit} (archived)"
+
+
+class ArchivedPickupRequest(models.Model):
+    """A finished pickup request moved out of PickupRequest."""
+    id = models.BigIntegerField(primary_key=True)
+    # Live or archived donation id
+    donation_id = models.BigIntegerField(db_index=True)
+    requester = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_pickup_requests')
+    requester_name = models.CharField(max_length=200)
+    requester_email = models.EmailField()
+    status = models.CharField(max_length=20, choices=PickupRequest.STATUS_CHOICES)
+    requested_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    data = models.JSONField(default=dict, blank=True)
+    
+    class Meta:
+        ordering = ['-requested_at']
+        indexes = [
+            models.Index(fields=['requester', 'status'], name='archived_pickup_requester_idx'),
+        ]
+    
+    def __str__(self):
+        return f"Pickup request {self.id} by {self.requester_name} (archived)"
+
+
+class ArchivedNotification(models.Model):
+    """A read notification moved out of Notification."""
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_notifications')
+    notification_type = models.CharField(max_length=50, choices=Notification.TYPE_CHOICES)
+    title = models.CharField(max_length=200)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    data = models.JSONField(default=dict, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='archived_notification_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id} - {self.notification_type} (archived)"
+
+
 # Auto-create a UserProfile for superusers created with createsuperuser
 @receiver(post_save, sender=User)
 def ensure_user_profile_for_superuser(sender, instance, created, **kwargs):
@@ -291,7 +509,9 @@ def mark_donation_picked_up(sender, instance, created, **kwargs):
             donation = instance.donation
             if donation.status != 'Picked Up':
                 donation.status = 'Picked Up'
-                donation.save()
+                donation.save(update_fields=['status', 'updated_at'])
+                from .pickups import close_waitlist
+                close_waitlist(donation.id)
     except Exception:
         # Do not raise from signal
         pass
\ No newline at end of file
@@ -0,0 +1,170 @@
+"""
+Local nutrient composition database for nutrition analysis.
+
+The bundled table (data/nutrients.csv) holds per-100 g calories, protein,
+carbs, fats and fibre for common Indian dishes and ingredients. It is loaded
+lazily into column arrays (one ``array('d')`` per nutrient), so the whole
+table is a few KB and, when gunicorn preloads the app, is shared by forked
+workers. A dish is parsed into (ingredient row, grams) pairs and its totals are
+the weighted sum of the matching rows: one dot product per nutrient column.
+"""
+import csv
+import re
+import threading
+from array import array
+from operator import mul
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+NUTRIENT_TABLE_PATH = Path(__file__).resolve().parent / 'data' / 'nutrients.csv'
+
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fats', 'fiber')
+
+# Grams per unit; liquids are counted at ~1 g/ml. Household measures follow
+# common Indian kitchen sizes (1 katori/bowl ~150 g, 1 cup ~200 g).
+UNIT_GRAMS = {
+    'g': 1, 'gm': 1, 'gms': 1, 'gram': 1, 'grams': 1,
+    'kg': 1000, 'kgs': 1000, 'kilo': 1000, 'kilos': 1000, 'kilogram': 1000, 'kilograms': 1000,
+    'mg': 0.001,
+    'ml': 1, 'l': 1000, 'litre': 1000, 'litres': 1000, 'liter': 1000, 'liters': 1000, 'ltr': 1000,
+    'cup': 200, 'cups': 200, 'katori': 150, 'katoris': 150, 'bowl': 150, 'bowls': 150,
+    'glass': 250, 'glasses': 250, 'plate': 250, 'plates': 250,
+    'tbsp': 15, 'tablespoon': 15, 'tablespoons': 15, 'tsp': 5, 'teaspoon': 5, 'teaspoons': 5,
+    'handful': 30, 'handfuls': 30, 'pinch': 0.5,
+    'lb': 453.6, 'lbs': 453.6, 'oz': 28.35,
+}
+
+# Units that mean "count of pieces" rather than a weight.
+PIECE_UNITS = {'piece', 'pieces', 'pc', 'pcs', 'nos', 'slice', 'slices', 'serving', 'servings'}
+
+# "no onion", "rice without onion": nothing from the negation on is counted.
+NEGATIONS = {'no', 'without'}
+
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5,
+    'six': 6, 'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'half': 0.5, 'dozen': 12,
+}
+
+# Weight assumed for an ingredient listed without a quantity, or per piece when
+# the table has no piece weight.
+DEFAULT_SERVING_GRAMS = 100.0
+
+_ITEM_SPLIT_RE = re.compile(r'[,;\n+&]|\band\b|\bwith\b')
+_TOKEN_RE = re.compile(r'\d+(?:\.\d+)?(?:/\d+)?|[a-z]+')
+
+
+class NutrientTable:
+    """Column-oriented nutrient table with an alias index and ingredient tokenizer."""
+
+    def __init__(self, path: Path = NUTRIENT_TABLE_PATH):
+        self.names = []
+        self.columns = {nutrient: array('d') for nutrient in NUTRIENTS}
+        self.piece_grams = array('d')
+        self.index = {}
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(line for line in f if not line.startswith('#'))
+            for row_id, row in enumerate(reader):
+                self.names.append(row['name'])
+                for nutrient in NUTRIENTS:
+                    self.columns[nutrient].append(float(row[nutrient] or 0))
+                self.piece_grams.append(float(row['piece_g'] or 0))
+                aliases = [row['name']] + [a for a in row['aliases'].split('|') if a]
+                for alias in aliases:
+                    self.index.setdefault(' '.join(alias.lower().split()), row_id)
+        self.max_alias_words = max(len(alias.split()) for alias in self.index)
+
+    def _match(self, words: List[str]) -> Optional[int]:
+        """Row of the longest alias found anywhere in ``words`` (earliest wins ties)."""
+        for length in range(min(self.max_alias_words, len(words)), 0, -1):
+            for start in range(len(words) - length + 1):
+                row = self.index.get(' '.join(words[start:start + length]))
+                if row is not None:
+                    return row
+        return None
+
+    @staticmethod
+    def _number(token: str) -> Optional[float]:
+        if token in NUMBER_WORDS:
+            return NUMBER_WORDS[token]
+        if token[0].isdigit():
+            if '/' in token:
+                numerator, denominator = token.split('/')
+                return float(numerator) / float(denominator) if float(denominator) else None
+            return float(token)
+        return None
+
+    @classmethod
+    def _quantity(cls, tokens: List[str], start: int) -> Tuple[Optional[float], Optional[str], int]:
+        """(quantity, unit, tokens used) for a "<number> <unit> [of]" run at ``start``."""
+        used = 0
+        quantity = cls._number(tokens[start]) if start < len(tokens) else None
+        if quantity is not None:
+            used = 1
+        unit = None
+        if start + used < len(tokens) and (tokens[start + used] in UNIT_GRAMS or tokens[start + used] in PIECE_UNITS):
+            unit = tokens[start + used]
+            used += 1
+            if start + used < len(tokens) and tokens[start + used] == 'of':
+                used += 1
+        return quantity, unit, used
+
+    def parse(self, text: str) -> List[Tuple[int, float]]:
+        """
+        Tokenize an ingredient description into (row, grams) pairs.
+
+        Handles forms such as "2 kg cooked rice", "200g paneer", "3 eggs",
+        "1/2 cup ghee", trailing quantities ("rice 2 kg", "Rice - 2kg") and
+        bare names ("dal", assumed one 100 g serving). Negated ingredients
+        ("no onion", "without garlic") and unknown ones are skipped.
+        """
+        parsed = []
+        for item in _ITEM_SPLIT_RE.split(text.lower()):
+            tokens = _TOKEN_RE.findall(item)
+            for position, token in enumerate(tokens):
+                if token in NEGATIONS:
+                    tokens = tokens[:position]
+                    break
+            if not tokens:
+                continue
+            quantity, unit, used = self._quantity(tokens, 0)
+            name = tokens[used:]
+            if not used:
+                # Quantity after the name: first numeric token
+                for position in range(1, len(tokens)):
+                    if tokens[position][0].isdigit():
+                        quantity, unit, used = self._quantity(tokens, position)
+                        name = tokens[:position] + tokens[position + used:]
+                        break
+            row = self._match(name)
+            if row is None:
+                continue
+            if unit in UNIT_GRAMS:
+                grams = (quantity or 1) * UNIT_GRAMS[unit]
+            else:
+                grams = (quantity or 1) * (self.piece_grams[row] or DEFAULT_SERVING_GRAMS)
+            if grams > 0:
+                parsed.append((row, grams))
+        return parsed
+
+    def totals(self, parsed: List[Tuple[int, float]]) -> Dict[str, float]:
+        """Nutrient totals for parsed ingredients: weights (per 100 g) dot each column."""
+        rows = [row for row, _ in parsed]
+        weights = [grams / 100.0 for _, grams in parsed]
+        return {
+            nutrient: sum(map(mul, weights, [column[row] for row in rows]))
+            for nutrient, column in self.columns.items()
+        }
+
+
+_table = None
+_table_lock = threading.Lock()
+
+
+def get_nutrient_table() -> NutrientTable:
+    """Return the process-wide nutrient table, loading it on first use."""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = NutrientTable()
+    return _table
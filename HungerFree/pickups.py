@@ -0,0 +1,235 @@
+"""
+Race-free donation claims with a FIFO waitlist.
+
+claim_donation() reserves a donation with one conditional UPDATE
+(``... SET status='Reserved' WHERE id=%s AND status='Available'``) and inserts
+the PickupRequest in the same transaction. The database applies the
+condition atomically, so of any number of concurrent claims exactly one
+updates a row; the rest see 0 rows and get DonationUnavailable. No row is
+locked while the claimer's view code runs, so claims on different donations
+never wait on each other.
+
+Losing claimants can join the donation's waitlist instead (status
+Waitlisted). The queue is the (donation, status, id) index: its head is one
+index seek, and promotion is a conditional UPDATE of that one row. When the
+active claim is cancelled, rejected or lapses past its ``pickup_by``
+deadline, the head is promoted to Pending and notified; with an empty queue
+the donation goes back to Available.
+
+A claim only lapses at a deadline that was agreed: a Pending claim inherits
+the donor's own ``pickup_by`` (none means it waits for the donor's review),
+and approve_claim() starts the PICKUP_CLAIM_WINDOW_MINUTES clock.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Donation, NGO, PickupRequest
+
+ACTIVE_CLAIM_STATUSES = ('Pending', 'Approved')
+
+
+class DonationUnavailable(Exception):
+    """The donation was already claimed (or is otherwise not Available)."""
+
+    def __init__(self, donation_id, status=None):
+        self.donation_id = donation_id
+        self.status = status
+        super().__init__(f'Donation {donation_id} is not available (status: {status or "missing"})')
+
+
+def claim_deadline(donation_pickup_by=None, now=None):
+    """Deadline of an approved claim: the claim window, extended to the donor's pickup_by if later."""
+    now = now or timezone.now()
+    deadline = now + timedelta(minutes=settings.PICKUP_CLAIM_WINDOW_MINUTES)
+    if donation_pickup_by and donation_pickup_by > deadline:
+        return donation_pickup_by
+    return deadline
+
+
+def _reserve(donation_id, ngo=None):
+    """Conditionally move an Available donation to Reserved; True if this call won."""
+    changes = {'status': 'Reserved', 'updated_at': timezone.now()}
+    if ngo is not None:
+        changes['ngo'] = ngo
+    return bool(Donation.objects.filter(pk=donation_id, status='Available').update(**changes))
+
+
+def claim_donation(donation, *, requester=None, requester_name='', requester_email='',
+                   requester_phone='', notes='', ngo=None, join_waitlist=False):
+    """
+    Reserve an Available donation and create its pickup request.
+
+    The status is decided by the conditional UPDATE alone; ``donation`` may be
+    a stale instance and only supplies the id and pickup_by. The new claim's
+    deadline is the donor's pickup_by until the claim is approved.
+
+    Args:
+        donation: Donation to claim
+        requester: Requesting User (None for anonymous requests)
+        requester_name, requester_email, requester_phone, notes: PickupRequest details
+        ngo: NGO to assign the donation to, if the claimer is an NGO
+        join_waitlist: If the donation is Reserved, queue a Waitlisted request instead of raising
+
+    Returns:
+        PickupRequest: The new request (Pending, or Waitlisted when queued)
+
+    Raises:
+        DonationUnavailable: Someone else claimed it first (and no waitlist), or it is not claimable
+    """
+    details = {
+        'requester': requester,
+        'requester_name': requester_name or '',
+        'requester_email': requester_email or '',
+        'requester_phone': requester_phone or '',
+        'notes': notes or '',
+    }
+    donation_id = donation.pk
+    with transaction.atomic():
+        if _reserve(donation_id, ngo):
+            return PickupRequest.objects.create(
+                donation_id=donation_id, status='Pending', pickup_by=donation.pickup_by, **details
+            )
+        status = Donation.objects.filter(pk=donation_id).values_list('status', flat=True).first()
+        if not join_waitlist or status != 'Reserved':
+            raise DonationUnavailable(donation_id, status)
+        waiting = PickupRequest.objects.create(donation_id=donation_id, status='Waitlisted', **details)
+    # The claim may have been released between the failed UPDATE and the insert
+    if _promote_if_unclaimed(donation_id):
+        waiting.refresh_from_db()
+    return waiting
+
+
+def waitlist_position(pickup_request):
+    """1-based place of a Waitlisted request in its donation's queue (None if not waiting)."""
+    if pickup_request.status != 'Waitlisted':
+        return None
+    return PickupRequest.objects.filter(
+        donation_id=pickup_request.donation_id, status='Waitlisted', id__lte=pickup_request.id
+    ).count()
+
+
+def promote_next(donation_id):
+    """
+    Hand a released donation to the head of its waitlist.
+
+    Returns:
+        PickupRequest | None: The promoted request, or None (the donation is Available again)
+    """
+    with transaction.atomic():
+        # Only a reserved donation is handed on (not one that expired or was picked up)
+        reserved = Donation.objects.filter(pk=donation_id, status='Reserved').values_list('pickup_by').first()
+        if reserved is None:
+            return None
+        # Pending again: only the donor's own deadline applies until approval
+        deadline = reserved[0]
+        while True:
+            head = (
+                PickupRequest.objects.filter(donation_id=donation_id, status='Waitlisted')
+                .order_by('id').select_related('requester').first()
+            )
+            if head is None:
+                Donation.objects.filter(pk=donation_id, status='Reserved').update(
+                    status='Available', ngo=None, updated_at=timezone.now()
+                )
+                return None
+            # Conditional, so two concurrent promotions cannot take the same head
+            if PickupRequest.objects.filter(pk=head.pk, status='Waitlisted').update(
+                status='Pending', pickup_by=deadline
+            ):
+                break
+    ngo = NGO.objects.filter(email=head.requester_email).first() if head.requester_email else None
+    Donation.objects.filter(pk=donation_id).update(ngo=ngo, updated_at=timezone.now())
+    head.status, head.pickup_by = 'Pending', deadline
+    _notify_promoted(head)
+    return head
+
+
+def _promote_if_unclaimed(donation_id):
+    """Give an Available donation with a waiting queue to the queue head."""
+    with transaction.atomic():
+        if not PickupRequest.objects.filter(donation_id=donation_id, status='Waitlisted').exists():
+            return None
+        if not _reserve(donation_id):
+            return None
+        return promote_next(donation_id)
+
+
+def approve_claim(pickup_request, now=None):
+    """
+    Approve a Pending claim and start its pickup window (see claim_deadline).
+
+    Returns:
+        bool: False if the request was no longer Pending
+    """
+    donation_pickup_by = (
+        Donation.objects.filter(pk=pickup_request.donation_id).values_list('pickup_by', flat=True).first()
+    )
+    deadline = claim_deadline(donation_pickup_by, now)
+    if not PickupRequest.objects.filter(pk=pickup_request.pk, status='Pending').update(
+        status='Approved', pickup_by=deadline
+    ):
+        return False
+    pickup_request.status, pickup_request.pickup_by = 'Approved', deadline
+    return True
+
+
+def release_claim(pickup_request, status='Cancelled'):
+    """
+    End a request (cancelled, rejected or lapsed) and promote the next in line.
+
+    Returns:
+        bool: False if the request had already finished
+    """
+    requests = PickupRequest.objects.filter(pk=pickup_request.pk)
+    with transaction.atomic():
+        # Decided by the stored status, not the (possibly stale) instance
+        if requests.filter(status__in=ACTIVE_CLAIM_STATUSES).update(status=status):
+            promote_next(pickup_request.donation_id)
+        elif not requests.filter(status='Waitlisted').update(status=status):
+            return False
+    pickup_request.status = status
+    return True
+
+
+def lapse_overdue_claims(now=None):
+    """
+    Expire active claims past their pickup_by deadline and promote their waitlists.
+
+    Returns:
+        list: Ids of the lapsed requests
+    """
+    now = now or timezone.now()
+    lapsed = []
+    overdue = (
+        PickupRequest.objects.filter(status__in=ACTIVE_CLAIM_STATUSES, pickup_by__lt=now)
+        .only('pk', 'donation_id', 'status')
+    )
+    for pickup_request in list(overdue):
+        if release_claim(pickup_request, status='Expired'):
+            lapsed.append(pickup_request.pk)
+    return lapsed
+
+
+def close_waitlist(donation_id):
+    """Cancel everyone still waiting once a donation has been picked up."""
+    return PickupRequest.objects.filter(donation_id=donation_id, status='Waitlisted').update(status='Cancelled')
+
+
+def _notify_promoted(pickup_request):
+    try:
+        from .utils import showInAppAlert
+        if pickup_request.requester:
+            showInAppAlert(
+                user=pickup_request.requester,
+                notification_type='donation_accepted',
+                title='A donation you waited for is yours',
+                message=f'You are next in line for donation #{pickup_request.donation_id}. '
+                        + (f'Please pick it up by {timezone.localtime(pickup_request.pickup_by):%b %d, %H:%M}.'
+                           if pickup_request.pickup_by else 'The donor will confirm a pickup time.'),
+                metadata={'donation_id': pickup_request.donation_id, 'pickup_request_id': pickup_request.pk},
+            )
+    except Exception:
+        pass
@@ -0,0 +1,129 @@
+"""
+Local portion-scaling engine for the chatbot.
+
+Most chatbot questions are "how much X to cook for N people". For dishes in the
+bundled portion table (data/portion_table.json) the answer is a linear scaling
+of a standard per-person serving, so it is computed in-process instead of
+calling Gemini.
+"""
+import json
+import math
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+PORTION_TABLE_PATH = Path(__file__).resolve().parent / 'data' / 'portion_table.json'
+
+# Guard against typos such as "5000000 people"; larger events go to the AI.
+MAX_PEOPLE = 5000
+
+# A free-text query is answered locally only when the whole (normalized) query
+# is "how much <one dish> for N people [at <meal>]"; anything else (several
+# dishes, substitutions, storage or safety questions) goes to Gemini.
+_CUSTOM_QUERY_RE = re.compile(
+    r'^(?:how much|how many|quantity of|amount of|portions? of)?\s*'
+    r'(?P<dish>[a-z ]+?)\s+'
+    r'(?:(?:do|should|shall|will) (?:i|we) (?:need|cook|make|prepare)\s+'
+    r'|(?:to|needed to) (?:cook|make|prepare)\s+|(?:is|are) needed\s+|needed\s+)?'
+    r'for\s+(?P<people>\d{1,6})\s+(?:people|persons?|guests?|members?|pax|kids|children|adults|heads?)'
+    r'(?:\s+(?:at|for)\s+(?P<meal>breakfast|lunch|dinner|snack|dessert))?$'
+)
+_NON_WORD_RE = re.compile(r'[^a-z0-9 ]+')
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(_NON_WORD_RE.sub(' ', (text or '').casefold()).split())
+
+
+@lru_cache(maxsize=1)
+def load_portion_table() -> Tuple[Dict[str, dict], Dict[str, float]]:
+    """Load the portion table once and index dishes by every normalized alias."""
+    with open(PORTION_TABLE_PATH, encoding='utf-8') as f:
+        data = json.load(f)
+    by_alias = {}
+    for dish in data['dishes']:
+        for alias in [dish['name']] + dish.get('aliases', []):
+            by_alias.setdefault(_normalize(alias), dish)
+    return by_alias, data.get('meal_factors', {})
+
+
+def find_dish(text: str) -> Optional[dict]:
+    """Look up a dish by its normalized name or one of its aliases."""
+    by_alias, _ = load_portion_table()
+    return by_alias.get(_normalize(text))
+
+
+def _format_quantity(amount: float, unit: str) -> str:
+    if unit == 'pcs':
+        return f'{math.ceil(amount)} pcs'
+    if unit in ('g', 'ml') and amount >= 1000:
+        big_unit = 'kg' if unit == 'g' else 'L'
+        return f'{amount / 1000:.2f}'.rstrip('0').rstrip('.') + f' {big_unit}'
+    if amount >= 10:
+        return f'{round(amount)} {unit}'
+    return f'{amount:.1f}'.rstrip('0').rstrip('.') + f' {unit}'
+
+
+def scale_recipe(dish: dict, num_people: int, meal_type: str = None) -> dict:
+    """Scale a dish's per-person ingredients to ``num_people`` for the given meal."""
+    _, meal_factors = load_portion_table()
+    factor = 1.0
+    if dish.get('category') == 'main' and meal_type:
+        factor = meal_factors.get(meal_type.casefold(), 1.0)
+    ingredients = [
+        (name, amount * num_people * factor, unit)
+        for name, amount, unit in dish['ingredients']
+    ]
+    return {
+        'dish': dish['name'],
+        'num_people': num_people,
+        'meal_type': meal_type or '',
+        'ingredients': ingredients,
+    }
+
+
+def format_portion_answer(scaled: dict) -> str:
+    """Render a scaled recipe as chatbot text (same bullet style as cleaned AI output)."""
+    meal = f" for {scaled['meal_type']}" if scaled['meal_type'] else ''
+    lines = [f"{scaled['dish']} for {scaled['num_people']} people{meal}:", '']
+    for name, amount, unit in scaled['ingredients']:
+        lines.append(f'• {name}: {_format_quantity(amount, unit)}')
+    lines.extend([
+        '',
+        'Quantities are raw/uncooked weights based on standard Indian serving sizes.',
+        'Cook the exact amount listed; leftovers in good condition can be donated on FoodSaver.',
+    ])
+    return '\n'.join(lines)
+
+
+def _parse_people(value) -> Optional[int]:
+    try:
+        people = int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+    return people if 0 < people <= MAX_PEOPLE else None
+
+
+def answer_portion_query(dish_name: str = '', num_people=None, meal_type: str = '',
+                         custom_query: str = '') -> Optional[str]:
+    """
+    Answer a portion question locally, or return None if the dish or headcount
+    is unknown (the caller then falls back to Gemini).
+
+    Accepts either the quick-start form fields or a free-text query of the
+    narrow form "how much <dish> for N people [at <meal>]".
+    """
+    if custom_query:
+        match = _CUSTOM_QUERY_RE.match(_normalize(custom_query))
+        if not match:
+            return None
+        people = _parse_people(match.group('people'))
+        dish = find_dish(match.group('dish'))
+        meal_type = match.group('meal') or ''
+    else:
+        people = _parse_people(num_people)
+        dish = find_dish(dish_name)
+    if dish is None or people is None:
+        return None
+    return format_portion_answer(scale_recipe(dish, people, meal_type))
@@ -0,0 +1,229 @@
+"""
+Daily impact rollups per donor, NGO and city.
+
+DailyImpactRollup rows are updated incrementally as donations are created and
+change status (Donation.save() calls record_donation_saved), so dashboards read
+a handful of pre-summed rows instead of scanning Donation and PickupRequest.
+rebuild_rollups() (the backfill_impact_rollups command, and migration 0018 on
+upgrade) recomputes them from live and archived history.
+
+Attribution:
+    created        -> donations_count, servings_donated, calories (donor, city) on the creation day
+    -> Picked Up   -> pickups_completed, servings_received (donor, city, receiving NGO) on the transition day
+    -> Expired     -> servings_expired (donor, city) on the transition day
+"""
+from collections import Counter, defaultdict
+
+from django.apps import apps as global_apps
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .locations import normalize_city
+from .models import DailyImpactRollup, NGO
+
+ROLLUP_METRICS = (
+    'donations_count', 'servings_donated', 'calories',
+    'pickups_completed', 'servings_received', 'servings_expired',
+)
+
+
+def city_key(city):
+    """Normalize a city name into a rollup key ('' when unknown)."""
+    return normalize_city(city)
+
+
+def donation_city(donation):
+    """City a donation is attributed to: its stored city_key (see Donation.sync_city_key)."""
+    if not donation.city_key:
+        donation.sync_city_key()
+    return donation.city_key
+
+
+def receiving_ngo_id(donation):
+    """NGO credited with a pickup: the assigned NGO, else the NGO that completed a pickup request."""
+    if donation.ngo_id:
+        return donation.ngo_id
+    completed_by = donation.pickup_requests.filter(status='Completed').values('requester__email')
+    return NGO.objects.filter(email__in=completed_by).values_list('id', flat=True).first()
+
+
+def new_deltas():
+    """Empty delta map: {(scope, key, date): Counter(metric=amount)}."""
+    return defaultdict(Counter)
+
+
+def add_created(deltas, donation, city, day):
+    for scope, key in (('donor', donation.donor_id), ('city', city)):
+        if key is None:
+            continue
+        counter = deltas[(scope, str(key), day)]
+        counter['donations_count'] += 1
+        counter['servings_donated'] += donation.quantity or 0
+        counter['calories'] += donation.calories or 0
+
+
+def add_picked_up(deltas, donation, city, ngo_id, day):
+    for scope, key in (('donor', donation.donor_id), ('ngo', ngo_id), ('city', city)):
+        if key is None:
+            continue
+        counter = deltas[(scope, str(key), day)]
+        counter['pickups_completed'] += 1
+        counter['servings_received'] += donation.quantity or 0
+
+
+def add_expired(deltas, donation, city, day):
+    for scope, key in (('donor', donation.donor_id), ('city', city)):
+        if key is None:
+            continue
+        deltas[(scope, str(key), day)]['servings_expired'] += donation.quantity or 0
+
+
+def lock_rollups():
+    """
+    Block rollup writes until the current transaction ends (reads continue).
+
+    SQLite needs no statement: transactions start with BEGIN IMMEDIATE (see
+    FoodSaver.database), so the rebuild already holds the only write lock.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {DailyImpactRollup._meta.db_table} IN EXCLUSIVE MODE')
+
+
+def apply_deltas(deltas):
+    """Add ``deltas`` to the rollup rows, creating missing rows, in one transaction."""
+    with transaction.atomic():
+        for (scope, key, day), counter in deltas.items():
+            increments = {metric: F(metric) + amount for metric, amount in counter.items() if amount}
+            if not increments:
+                continue
+            row, _ = DailyImpactRollup.objects.get_or_create(scope=scope, key=key, date=day)
+            DailyImpactRollup.objects.filter(pk=row.pk).update(**increments)
+
+
+def record_donation_saved(donation, created, previous_status):
+    """Update rollups for a saved donation (creation and/or status transition)."""
+    if not created and (previous_status is None or donation.status == previous_status):
+        return  # No transition, or the previous status is unknown
+    if not created and donation.status not in ('Picked Up', 'Expired'):
+        return
+    day = timezone.localdate()
+    city = donation_city(donation)
+    deltas = new_deltas()
+    if created:
+        add_created(deltas, donation, city, day)
+    if donation.status == 'Picked Up':
+        add_picked_up(deltas, donation, city, receiving_ngo_id(donation), day)
+    elif donation.status == 'Expired':
+        add_expired(deltas, donation, city, day)
+    apply_deltas(deltas)
+
+
+def _add_history(deltas, queryset, pickup_model, ngo_ids_by_email, chunk_size, progress):
+    """Add the created/picked-up/expired deltas of every donation in ``queryset``, in pk chunks."""
+    processed = 0
+    last_pk = 0
+    while True:
+        chunk = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:chunk_size])
+        if not chunk:
+            return processed
+        last_pk = chunk[-1].pk
+
+        # Receiving NGO for picked-up donations without an assigned NGO
+        unassigned = [d.pk for d in chunk if d.status == 'Picked Up' and not d.ngo_id]
+        completed_by = {}
+        for donation_id, email in (
+            pickup_model.objects.filter(donation_id__in=unassigned, status='Completed')
+            .order_by('id').values_list('donation_id', 'requester__email')
+        ):
+            if email in ngo_ids_by_email:
+                completed_by.setdefault(donation_id, ngo_ids_by_email[email])
+
+        for donation in chunk:
+            # Archived and migration-time (historical) models have no
+            # sync_city_key; their city_key is always set
+            city = donation_city(donation) if hasattr(donation, 'sync_city_key') else donation.city_key
+            add_created(deltas, donation, city, timezone.localdate(donation.created_at))
+            # The transition day is not stored; updated_at is the closest record of it
+            transition_day = timezone.localdate(donation.updated_at)
+            if donation.status == 'Picked Up':
+                ngo_id = donation.ngo_id or completed_by.get(donation.pk)
+                add_picked_up(deltas, donation, city, ngo_id, transition_day)
+            elif donation.status == 'Expired':
+                add_expired(deltas, donation, city, transition_day)
+
+        processed += len(chunk)
+        if progress:
+            progress(processed, queryset.model)
+
+
+def rebuild_rollups(apps=global_apps, chunk_size=2000, dry_run=False, progress=None):
+    """
+    Recompute every rollup row from live and archived donations.
+
+    Runs in one transaction that first takes the rollup write lock, so a
+    donation saved meanwhile either is read here or applies its increment
+    after the rebuild commits, never lost or counted twice (Donation.save
+    records its rollup in the same transaction as the row).
+
+    Args:
+        apps: App registry; migrations pass their historical one
+        chunk_size: Donations read per query
+        dry_run: Compute the rows without writing them
+        progress: Optional callback(processed_count, model) after each chunk
+
+    Returns:
+        tuple: (rollup rows written, donations processed)
+    """
+    models = {name: apps.get_model('HungerFree', name) for name in (
+        'ArchivedDonation', 'ArchivedPickupRequest', 'DailyImpactRollup', 'Donation', 'NGO', 'PickupRequest',
+    )}
+    chunk_size = max(1, chunk_size)
+    with transaction.atomic():
+        if not dry_run:
+            lock_rollups()
+        ngo_ids_by_email = dict(models['NGO'].objects.exclude(email='').values_list('email', 'id'))
+        deltas = new_deltas()
+        # Archived donations still count towards impact (see archive.py)
+        processed = _add_history(
+            deltas, models['Donation'].objects.select_related('donor'), models['PickupRequest'],
+            ngo_ids_by_email, chunk_size, progress,
+        )
+        processed += _add_history(
+            deltas, models['ArchivedDonation'].objects.all(), models['ArchivedPickupRequest'],
+            ngo_ids_by_email, chunk_size, progress,
+        )
+        rollup_model = models['DailyImpactRollup']
+        rows = [
+            rollup_model(scope=scope, key=key, date=day, **counter)
+            for (scope, key, day), counter in deltas.items()
+        ]
+        if not dry_run:
+            rollup_model.objects.all().delete()
+            rollup_model.objects.bulk_create(rows, batch_size=chunk_size)
+    return len(rows), processed
+
+
+def _sum_metrics(rows, start=None, end=None):
+    if start:
+        rows = rows.filter(date__gte=start)
+    if end:
+        rows = rows.filter(date__lte=end)
+    totals = rows.aggregate(**{metric: Sum(metric) for metric in ROLLUP_METRICS})
+    return {metric: value or 0 for metric, value in totals.items()}
+
+
+def impact_totals(scope, key, start=None, end=None):
+    """
+    Sum rollup metrics for one donor/NGO/city, optionally within [start, end].
+
+    Returns:
+        dict: metric -> total (0 when there are no rows)
+    """
+    return _sum_metrics(DailyImpactRollup.objects.filter(scope=scope, key=str(key)), start, end)
+
+
+def platform_totals(start=None, end=None):
+    """Platform-wide totals; every donation is attributed to exactly one city row."""
+    return _sum_metrics(DailyImpactRollup.objects.filter(scope='city'), start, end)
@@ -0,0 +1,96 @@
+"""
+Full-text search over donation title, description and location.
+
+Backends, chosen by database vendor:
+    SQLite      FTS5 external-content table ``donation_fts`` kept in sync by
+                triggers, ranked with bm25()
+    PostgreSQL  ``to_tsvector('english', ...)`` expression with a GIN index,
+                ranked with ts_rank()
+    other       icontains fallback (unranked)
+
+Both are created by migration 0010. search_donations() returns the filtered
+queryset annotated with ``search_rank`` (higher is better), so it combines
+with the usual status and expiry filters.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Donation
+
+FTS_TABLE = 'donation_fts'
+DONATION_TABLE = Donation._meta.db_table
+
+# Must match the GIN index expression in migration 0010 exactly
+PG_SEARCH_VECTOR = (
+    "to_tsvector('english', coalesce(\"{table}\".\"title\", '') || ' ' || "
+    "coalesce(\"{table}\".\"description\", '') || ' ' || coalesce(\"{table}\".\"location\", ''))"
+).format(table=DONATION_TABLE)
+
+MAX_SEARCH_TERMS = 8
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+_fts_available = {}
+
+
+def search_terms(query):
+    """Split user input into plain word terms (no operators), at most MAX_SEARCH_TERMS."""
+    return _TERM_RE.findall(query or '')[:MAX_SEARCH_TERMS]
+
+
+def fts5_query(terms):
+    """FTS5 MATCH expression: every term as a quoted prefix, implicitly ANDed."""
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def sqlite_fts_available(using='default'):
+    """Whether the FTS5 table exists on this connection (FTS5 may be compiled out)."""
+    if using not in _fts_available:
+        connection = connections[using]
+        _fts_available[using] = FTS_TABLE in connection.introspection.table_names()
+    return _fts_available[using]
+
+
+def search_donations(queryset, query):
+    """
+    Filter ``queryset`` to donations matching ``query`` and annotate ``search_rank``.
+
+    Args:
+        queryset: A Donation queryset (any filters already applied)
+        query: Free text from the user
+
+    Returns:
+        QuerySet: Unordered; order by ``-search_rank`` for relevance
+    """
+    terms = search_terms(query)
+    if not terms:
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+    vendor = connections[queryset.db].vendor
+
+    if vendor == 'sqlite' and sqlite_fts_available(queryset.db):
+        # Join the FTS table so MATCH runs once and drives the plan; bm25() is
+        # lower-is-better, so negate it. (A correlated rank subquery re-runs
+        # the MATCH per row and is orders of magnitude slower.)
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = "{DONATION_TABLE}"."id"', f'{FTS_TABLE} MATCH %s'],
+            params=[fts5_query(terms)],
+            select={'search_rank': f'-bm25({FTS_TABLE})'},
+        )
+
+    if vendor == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return queryset.filter(
+            RawSQL(f"{PG_SEARCH_VECTOR} @@ to_tsquery('english', %s)", [tsquery], output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(
+                f"ts_rank({PG_SEARCH_VECTOR}, to_tsquery('english', %s))", [tsquery], output_field=FloatField()
+            )
+        )
+
+    condition = Q()
+    for term in terms:
+        condition &= Q(title__icontains=term) | Q(description__icontains=term) | Q(location__icontains=term)
+    return queryset.filter(condition).annotate(search_rank=Value(0.0, output_field=FloatField()))
@@ -0,0 +1,185 @@
+"""
+Hashed, precompressed static files and their in-process server.
+
+At ``collectstatic`` time CompressedManifestStaticFilesStorage writes
+content-hashed copies (``css/style.3f2a9c.css``) listed in staticfiles.json,
+plus ``.gz`` and ``.br`` variants of every text asset that compression
+actually shrinks. ``brotli`` is in requirements.txt; without it only ``.gz``
+variants are written and collectstatic logs a warning.
+
+StaticFilesMiddleware then serves STATIC_ROOT from an index built once at
+startup: the smallest variant the client accepts, with ``Vary:
+Accept-Encoding`` and an ETag. Hashed names never change content, so they are
+cached for a year as ``immutable``; unhashed names get a short max-age.
+"""
+import gzip
+import json
+import logging
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:  # optional: gzip variants only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_EXTENSIONS = frozenset({
+    '.css', '.js', '.mjs', '.map', '.json', '.svg', '.txt', '.html', '.xml', '.ico', '.ttf', '.eot',
+})
+# Below this many bytes the headers cost more than compression saves
+COMPRESS_MIN_SIZE = 256
+# A variant is kept only if it is at most this fraction of the original
+COMPRESS_MAX_RATIO = 0.95
+
+# Accept-Encoding token -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def compress(data):
+    """Compressed variants of ``data`` worth keeping, as {suffix: bytes}."""
+    variants = {}
+    if len(data) < COMPRESS_MIN_SIZE:
+        return variants
+    candidates = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        candidates['.br'] = brotli.compress(data)
+    for suffix, compressed in candidates.items():
+        if len(compressed) <= len(data) * COMPRESS_MAX_RATIO:
+            variants[suffix] = compressed
+    return variants
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also writes .gz/.br variants."""
+
+    def stored_name(self, name):
+        # Before collectstatic has written a manifest (development, tests)
+        # templates get the unhashed names instead of an error
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        if brotli is None:
+            logger.warning(
+                'brotli is not installed: writing .gz variants only, so clients '
+                'that accept br get gzip. Install it from requirements.txt.'
+            )
+        # Originals stay servable under their own names, so both get variants
+        for name in sorted(set(paths) | set(self.hashed_files.values())):
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            with self.open(name) as original:
+                variants = compress(original.read())
+            for suffix, data in variants.items():
+                compressed_name = name + suffix
+                if self.exists(compressed_name):
+                    self.delete(compressed_name)
+                self._save(compressed_name, ContentFile(data))
+                yield name, compressed_name, True
+
+
+def accepted_encodings(header):
+    """Content codings an Accept-Encoding header allows (q=0 excluded)."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        quality = params.replace(' ', '').lower()
+        if quality.startswith('q=') and not quality[2:].strip('0.'):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFile:
+    """One servable file: the original plus its precompressed variants."""
+
+    __slots__ = ('content_type', 'cache_control', 'variants')
+
+    def __init__(self, path, immutable):
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type in ('application/javascript', 'image/svg+xml'):
+            self.content_type += '; charset=utf-8'
+        if immutable:
+            self.cache_control = f'public, max-age={settings.STATIC_IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            self.cache_control = f'public, max-age={settings.STATIC_MAX_AGE}'
+        # (encoding, path, size, etag, last_modified), preferred first, identity last
+        self.variants = []
+        for encoding, suffix in ENCODINGS:
+            if os.path.isfile(path + suffix):
+                self.variants.append(self._variant(encoding, path + suffix))
+        self.variants.append(self._variant(None, path))
+
+    @staticmethod
+    def _variant(encoding, path):
+        stat = os.stat(path)
+        etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}{"-" + encoding if encoding else ""}"'
+        return encoding, path, stat.st_size, etag, http_date(stat.st_mtime)
+
+    def choose(self, accept_encoding):
+        accepted = accepted_encodings(accept_encoding) if accept_encoding else set()
+        for variant in self.variants:
+            encoding = variant[0]
+            if encoding is None or encoding in accepted or '*' in accepted:
+                return variant
+
+    def response(self, request):
+        encoding, path, size, etag, last_modified = self.choose(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = HttpResponseNotModified()
+        elif request.method == 'HEAD':
+            response = HttpResponse(content_type=self.content_type)
+            response['Content-Length'] = str(size)
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=self.content_type)
+            # Would name the .gz/.br file; assets are never downloads
+            del response['Content-Disposition']
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if len(self.variants) > 1:
+            response['Vary'] = 'Accept-Encoding'
+        response['ETag'] = etag
+        response['Last-Modified'] = last_modified
+        response['Cache-Control'] = self.cache_control
+        return response
+
+
+def build_index(root, url_prefix):
+    """
+    Map request paths to StaticFile for every file under ``root``.
+
+    Args:
+        root: STATIC_ROOT as written by collectstatic
+        url_prefix: STATIC_URL
+
+    Returns:
+        dict: {'/static/css/style.3f2a9c.css': StaticFile, ...}
+    """
+    hashed = set()
+    manifest_path = os.path.join(root, ManifestStaticFilesStorage.manifest_name)
+    if os.path.isfile(manifest_path):
+        with open(manifest_path) as manifest:
+            hashed = set(json.load(manifest).get('paths', {}).values())
+
+    index = {}
+    variant_suffixes = tuple(suffix for _, suffix in ENCODINGS)
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            if filename.endswith(variant_suffixes):
+                continue
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, root).replace(os.sep, '/')
+            index[url_prefix + name] = StaticFile(path, immutable=name in hashed)
+    return index
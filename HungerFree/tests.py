@@ -1,8 +1,9 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client
 from django.contrib.auth.models import User
 from django.urls import reverse
+from django.core.cache import cache
 from datetime import date, timedelta
-from .models import Donor, NGO, Donation, PickupRequest, Payment, Food
+from .models import Donor, NGO, Donation, PickupRequest, Payment, Food, NGOFoodRequirement
 from .utils import expire_priority, distance_km, nutritional_score
 
 
@@ -243,3 +244,1745 @@ class UtilsTests(TestCase):
         result = nutritional_score('')
         self.assertEqual(result['score'], 0)
         self.assertEqual(result['calories'], 0)
+
+
+def fake_gemini_manager(build_model, model_names=('model-a',), unavailable=(), **kwargs):
+    """
+    GeminiClientManager that never touches the SDK.
+
+    Args:
+        build_model: Called with a model name; returns the fake model object
+        model_names: Candidate models, in preference order
+        unavailable: Model names whose availability probe fails
+    """
+    from .ai_client import GeminiClientManager
+    
+    class FakeManager(GeminiClientManager):
+        configure_calls = 0
+        
+        def _configure(self):
+            self.configure_calls += 1
+        
+        def _probe(self, name):
+            if name in unavailable:
+                raise RuntimeError('not found')
+        
+        def _build_model(self, name):
+            return build_model(name)
+    
+    return FakeManager('key', list(model_names), **kwargs)
+
+
+class GeminiClientManagerTests(TestCase):
+    """Test cases for the shared Gemini client manager."""
+    
+    def _manager(self, failing=(), unavailable=()):
+        class FakeResult:
+            def __init__(self, text):
+                self.text = text
+        
+        class FakeModel:
+            def __init__(self, name):
+                self.name = name
+            
+            def generate_content(self, prompt, **kwargs):
+                if self.name in failing:
+                    raise RuntimeError(f'{self.name} down')
+                return FakeResult(f'{self.name}: {prompt}')
+        
+        return fake_gemini_manager(FakeModel, ['model-a', 'model-b'], unavailable,
+                                   failure_threshold=2, reset_timeout=60)
+    
+    def test_configures_once_and_reuses_model(self):
+        """SDK setup and model construction happen once per process."""
+        manager = self._manager()
+        self.assertEqual(manager.generate_text('hi'), 'model-a: hi')
+        model = manager._models['model-a']
+        manager.generate_text('again')
+        self.assertEqual(manager.configure_calls, 1)
+        self.assertIs(manager._models['model-a'], model)
+    
+    def test_probe_skips_unavailable_model(self):
+        """Model selection actually tests availability."""
+        manager = self._manager(unavailable=('model-a',))
+        self.assertEqual(manager.select_model(), 'model-b')
+    
+    def test_failover_and_circuit_breaker(self):
+        """Failures switch models and open the breaker of the failing model."""
+        manager = self._manager(failing=('model-a',))
+        self.assertEqual(manager.generate_text('x'), 'model-b: x')
+        self.assertEqual(manager.active_model, 'model-b')
+        manager.active_model = 'model-a'
+        manager.generate_text('y')
+        metrics = manager.get_metrics()
+        self.assertEqual(metrics['models']['model-a']['errors'], 2)
+        self.assertEqual(metrics['models']['model-a']['breaker'], 'open')
+        self.assertEqual(metrics['models']['model-b']['requests'], 2)
+
+
+class ChatbotStreamTests(TestCase):
+    """Test cases for the streaming chatbot."""
+    
+    def setUp(self):
+        from .ai_client import reset_gemini_manager
+        
+        class FakeChunk:
+            def __init__(self, text):
+                self.text = text
+        
+        class FakeModel:
+            def generate_content(self, prompt, **kwargs):
+                return [FakeChunk(c) for c in ['**Rice**', ':\n', '* 2 k', 'g\n- Dal *', '*500 g**']]
+        
+        reset_gemini_manager(fake_gemini_manager(lambda name: FakeModel()))
+        self.addCleanup(reset_gemini_manager, None)
+        self.user = User.objects.create_user(username='streamer', password='testpass123')
+    
+    def test_incremental_cleaner_matches_batch_cleaner(self):
+        """Chunked cleaning produces the same text as cleaning the whole answer."""
+        from .views import IncrementalMarkdownCleaner, clean_ai_markdown
+        text = '**Rice**:\n* 2 kg\n- Dal **500 g**\nServe *hot*'
+        for size in (1, 2, 3, 7):
+            cleaner = IncrementalMarkdownCleaner()
+            parts = [cleaner.feed(text[i:i + size]) for i in range(0, len(text), size)]
+            parts.append(cleaner.flush())
+            self.assertEqual(''.join(parts), clean_ai_markdown(text))
+    
+    async def test_stream_emits_sse_events(self):
+        """The stream view forwards cleaned chunks as SSE frames."""
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(reverse('chatbot_stream'), {'custom_query': 'rice'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        data = ''.join(
+            '\n'.join(line[6:] for line in frame.split('\n') if line.startswith('data: '))
+            for frame in body.split('\n\n') if frame.startswith('data: ')
+        )
+        self.assertIn('event: done', body)
+        self.assertEqual(data, 'Rice:\n• 2 kg\n• Dal 500 g')
+    
+    def test_abandoned_stream_releases_when_upstream_finishes(self):
+        """Closing mid-read keeps the slot until the worker's upstream call returns."""
+        import threading
+        import time
+        from .views import UpstreamStream
+        unblock = threading.Event()
+        finished = []
+        
+        def upstream():
+            yield 'first'
+            unblock.wait(5)
+            yield 'second'
+        
+        stream = UpstreamStream(upstream(), lambda: finished.append(True))
+        self.assertEqual(stream.next(None), 'first')
+        worker = threading.Thread(target=stream.next, args=(None,))
+        worker.start()
+        while not stream._busy:
+            time.sleep(0.001)
+        stream.close()
+        self.assertEqual(finished, [])
+        unblock.set()
+        worker.join(5)
+        self.assertEqual(finished, [True])
+        stream.close()
+        self.assertEqual(stream.next(None), None)
+        self.assertEqual(finished, [True])
+
+
+class ChatbotBulkheadTests(TestCase):
+    """Test cases for the AI bulkhead and hard timeout."""
+    
+    def setUp(self):
+        from .ai_client import reset_gemini_manager
+        import time
+        
+        class SlowResult:
+            text = 'slow answer'
+        
+        class SlowModel:
+            def generate_content(self, prompt, **kwargs):
+                time.sleep(0.3)
+                return SlowResult()
+        
+        reset_gemini_manager(fake_gemini_manager(lambda name: SlowModel()))
+        self.addCleanup(reset_gemini_manager, None)
+        cache.clear()
+        self.user = User.objects.create_user(username='chatter', password='testpass123')
+    
+    async def test_full_bulkhead_returns_busy(self):
+        """Requests beyond the concurrency limit are shed immediately."""
+        from django.test import override_settings
+        from .ai_client import get_ai_bulkhead
+        await self.async_client.aforce_login(self.user)
+        with override_settings(AI_MAX_CONCURRENT_REQUESTS=1):
+            bulkhead = get_ai_bulkhead()
+            self.assertTrue(bulkhead.try_acquire())
+            try:
+                response = await self.async_client.post(reverse('chatbot'), {'custom_query': 'rice'})
+            finally:
+                bulkhead.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(bulkhead.rejected, 1)
+    
+    async def test_slow_upstream_times_out(self):
+        """A Gemini call slower than the hard timeout is answered with 504."""
+        from django.test import override_settings
+        await self.async_client.aforce_login(self.user)
+        with override_settings(AI_REQUEST_TIMEOUT_SECONDS=0.05):
+            response = await self.async_client.post(reverse('chatbot'), {'custom_query': 'rice'})
+        self.assertEqual(response.status_code, 504)
+
+
+class SingleFlightTests(TestCase):
+    """Test cases for AI request coalescing."""
+    
+    def setUp(self):
+        cache.clear()
+    
+    def test_concurrent_identical_calls_share_one_upstream_call(self):
+        """Threads asking the same prompt wait on a single upstream call."""
+        import threading
+        import time
+        from .ai_client import SingleFlight, prompt_key
+        flight = SingleFlight()
+        calls = []
+        
+        def upstream():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'answer'
+        
+        results = []
+        key = prompt_key('Dal  for 50 people')
+        threads = [threading.Thread(target=lambda: results.append(flight.do(key, upstream))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['answer'] * 5)
+        self.assertEqual(prompt_key('dal for 50   PEOPLE'), key)
+    
+    def test_waits_for_result_published_by_other_worker(self):
+        """A held cache lock means another worker is calling upstream."""
+        import threading
+        from .ai_client import SingleFlight
+        flight = SingleFlight(poll_interval=0.01)
+        cache.add('singleflight:lock:k', 1, 30)
+        threading.Timer(0.1, lambda: cache.set('singleflight:result:k', 'shared', 15)).start()
+        self.assertEqual(flight.do('k', lambda: 'own call'), 'shared')
+        self.assertEqual(flight.upstream_calls, 0)
+    
+    def test_errors_are_not_shared_through_cache(self):
+        """A failed upstream call is not cached for later callers."""
+        from .ai_client import SingleFlight
+        flight = SingleFlight()
+        
+        def failing():
+            raise RuntimeError('boom')
+        
+        with self.assertRaises(RuntimeError):
+            flight.do('k2', failing)
+        self.assertEqual(flight.do('k2', lambda: 'ok'), 'ok')
+
+
+class PortionEngineTests(TestCase):
+    """Test cases for the local portion-scaling engine."""
+    
+    def test_scales_known_dish_linearly(self):
+        """Quick-start fields for a known dish are answered locally."""
+        from .portions import answer_portion_query
+        answer = answer_portion_query('Dal Tadka', '40', 'Lunch')
+        self.assertIn('Dal Tadka for 40 people for Lunch', answer)
+        self.assertIn('• Toor dal (raw): 1.4 kg', answer)
+    
+    def test_free_text_query_uses_longest_alias(self):
+        """Custom queries are parsed for headcount and the most specific dish."""
+        from .portions import answer_portion_query
+        answer = answer_portion_query(custom_query='How much chicken biryani for 100 guests at dinner?')
+        self.assertTrue(answer.startswith('Chicken Biryani for 100 people for dinner'))
+    
+    def test_unknown_dish_falls_back(self):
+        """Unknown dishes or missing headcount return None so Gemini is used."""
+        from .portions import answer_portion_query
+        self.assertIsNone(answer_portion_query('Lasagne', '10', 'Dinner'))
+        self.assertIsNone(answer_portion_query(custom_query='How to store leftover rice?'))
+        self.assertIsNone(answer_portion_query('Rice', 'many', 'Lunch'))
+    
+    def test_complex_custom_queries_go_to_gemini(self):
+        """Only a single-dish "how much X for N people" query is answered locally."""
+        from .portions import answer_portion_query
+        self.assertIsNone(answer_portion_query(custom_query='rice and dal for 40 people'))
+        self.assertIsNone(answer_portion_query(
+            custom_query='chicken biryani without chicken for 20 people, it must be vegan'
+        ))
+        self.assertIsNone(answer_portion_query(custom_query='How do I store leftover rice for 10 people safely?'))
+        self.assertIsNotNone(answer_portion_query(custom_query='How much rice do we need for 40 people?'))
+    
+    def test_chatbot_answers_without_gemini(self):
+        """The chatbot view serves table dishes without an AI call."""
+        from .ai_client import reset_gemini_manager
+        reset_gemini_manager(None)
+        user = User.objects.create_user(username='cook', password='testpass123')
+        self.client.force_login(user)
+        with self.settings(GEMINI_API_KEY=''):
+            response = self.client.post(reverse('chatbot'), {
+                'meal_type': 'Lunch', 'dish_name': 'rice', 'num_people': '10',
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Steamed Rice for 10 people', response.context['response'])
+
+
+class NutritionBatchTests(TestCase):
+    """Test cases for compiled keyword scoring and the bulk API."""
+    
+    def test_word_boundaries_and_plurals(self):
+        """Keywords match whole words (with plurals), not substrings."""
+        from .utils import estimate_nutrition_by_keywords
+        self.assertEqual(estimate_nutrition_by_keywords('eggplant, peanut')['protein'], 5)
+        self.assertEqual(estimate_nutrition_by_keywords('eggs, beans')['protein'], 15)
+        self.assertEqual(estimate_nutrition_by_keywords('Vegetables, Whole Grain bread')['fiber'], 6)
+    
+    def test_batch_matches_single_scoring(self):
+        """Batch results equal per-item results, in order."""
+        from .utils import nutritional_score_batch
+        menus = ['rice, dal', '', 'chicken, vegetable, fruit']
+        self.assertEqual(
+            nutritional_score_batch(menus, 'lunch'),
+            [nutritional_score(m, 'lunch') for m in menus],
+        )
+    
+    def test_score_menus_command(self):
+        """score_menus prints one JSON result per menu, with or without the process pool."""
+        import json
+        import tempfile
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        menus = ['rice, dal', 'chicken, vegetable, fruit', 'fruit']
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as f:
+            f.write('\n'.join(menus) + '\n\n')
+            f.flush()
+            outputs = []
+            for workers in (1, 2):
+                out = StringIO()
+                with mock.patch('HungerFree.management.commands.score_menus.PARALLEL_THRESHOLD', 1):
+                    call_command('score_menus', f.name, meal_type='lunch', workers=workers, stdout=out, stderr=StringIO())
+                outputs.append([json.loads(line) for line in out.getvalue().splitlines()])
+        expected = [nutritional_score(m, 'lunch') for m in menus]
+        self.assertEqual(outputs, [expected, expected])
+    
+    def test_bulk_endpoint_caps_menus(self):
+        """Requests over NUTRITION_BULK_MAX_MENUS are rejected."""
+        import json
+        from .dashboard_views import NUTRITION_BULK_MAX_MENUS
+        from .models import UserProfile
+        user = User.objects.create_user(username='bigcanteen', password='testpass123')
+        UserProfile.objects.create(user=user, role='Donor', is_approved=True)
+        self.client.force_login(user)
+        response = self.client.post(
+            reverse('donor_nutrition_bulk'),
+            data=json.dumps({'menus': ['rice'] * (NUTRITION_BULK_MAX_MENUS + 1)}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+    
+    def test_bulk_endpoint(self):
+        """Donors can score many menus in one JSON request."""
+        import json
+        from .models import UserProfile
+        user = User.objects.create_user(username='canteen', password='testpass123')
+        UserProfile.objects.create(user=user, role='Donor', is_approved=True)
+        self.client.force_login(user)
+        response = self.client.post(
+            reverse('donor_nutrition_bulk'),
+            data=json.dumps({'menus': ['rice, chicken', 'fruit'], 'meal_type': 'lunch'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 2)
+        self.assertEqual(response.json()['results'][0]['calories'], 320)
+
+
+class NutrientDatabaseTests(TestCase):
+    """Test cases for the local nutrient database."""
+    
+    def test_tokenizer_handles_quantities_and_units(self):
+        """Quantities, units, pieces and bare names are converted to grams."""
+        from .nutrients import get_nutrient_table
+        table = get_nutrient_table()
+        parsed = table.parse('2 kg cooked rice, 200g paneer, 3 eggs, 1/2 cup ghee and dal')
+        self.assertEqual(
+            [(table.names[row], grams) for row, grams in parsed],
+            [('cooked rice', 2000), ('paneer', 200), ('egg', 150), ('ghee', 100), ('dal', 100)],
+        )
+    
+    def test_trailing_quantities(self):
+        """Quantities written after the ingredient name are read too."""
+        from .nutrients import get_nutrient_table
+        table = get_nutrient_table()
+        for text in ('rice 2 kg, dal 1 kg', 'Rice - 2kg; Dal - 1 kg'):
+            parsed = table.parse(text)
+            self.assertEqual([grams for _, grams in parsed], [2000, 1000], text)
+    
+    def test_negated_ingredients_are_skipped(self):
+        """"no onion" and "without garlic" do not count as ingredients."""
+        from .nutrients import get_nutrient_table
+        table = get_nutrient_table()
+        self.assertEqual(table.parse('no onion'), [])
+        parsed = table.parse('2 kg cooked rice without onion')
+        self.assertEqual([(table.names[row], grams) for row, grams in parsed], [('cooked rice', 2000)])
+    
+    def test_totals_are_weighted_by_grams(self):
+        """Nutrients scale with the weight of each ingredient."""
+        result = nutritional_score('2 kg cooked rice, 1 kg dal')
+        self.assertEqual(result['calories'], 2 * 1300 + 1160)
+        self.assertEqual(result['protein'], 2 * 27 + 70)
+        self.assertEqual(result['total_grams'], 3000)
+    
+    def test_unknown_ingredients_fall_back_to_keywords(self):
+        """Text with no known ingredient uses the keyword estimate."""
+        result = nutritional_score('mystery casserole')
+        self.assertEqual(result['calories'], 200)
+        self.assertNotIn('matched_ingredients', result)
+
+
+class NGOImpactTests(TestCase):
+    """Test cases for typed nutrition columns and NGO impact totals."""
+    
+    def setUp(self):
+        from .models import UserProfile
+        self.user = User.objects.create_user(username='ngo1', email='ngo1@example.com', password='testpass123')
+        UserProfile.objects.create(user=self.user, role='NGO', is_approved=True)
+        self.ngo = NGO.objects.create(
+            user=self.user, name='Food Bank', contact_person='Asha', email='ngo1@example.com',
+            phone='1', address='x', city='Pune'
+        )
+    
+    def _donation(self, **kwargs):
+        return Donation.objects.create(
+            title='Meal', quantity=10, location='Pune',
+            expiry_date=date.today() + timedelta(days=2), **kwargs
+        )
+    
+    def test_nutrition_columns_sync_from_json(self):
+        """Numeric strings in nutritional_info are copied into typed columns."""
+        donation = self._donation(nutritional_info={'calories': '250', 'protein': '12.5 g', 'fats': 'n/a'})
+        self.assertEqual(donation.calories, 250.0)
+        self.assertEqual(donation.protein, 12.5)
+        self.assertIsNone(donation.fats)
+    
+    def test_dashboard_impact_totals(self):
+        """Assigned and requested donations are each counted once."""
+        self._donation(ngo=self.ngo, nutritional_info={'calories': '100', 'protein': '5'})
+        requested = self._donation(nutritional_info={'calories': '300', 'protein': 'x'})
+        for _ in range(2):
+            PickupRequest.objects.create(
+                donation=requested, requester=self.user, requester_name='Food Bank',
+                requester_email='ngo1@example.com', requester_phone='1'
+            )
+        self._donation(nutritional_info={'calories': '999'})
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('ngo_dashboard'))
+        self.assertEqual(response.context['total_received_servings'], 20)
+        self.assertEqual(response.context['total_calories'], 400)
+        self.assertEqual(response.context['total_protein'], 5)
+
+
+class NGODashboardQueryBudgetTests(TestCase):
+    """Test cases for the query budget of the NGO dashboard."""
+    
+    def setUp(self):
+        from .models import UserProfile
+        self.user = User.objects.create_user(username='ngo2', email='ngo2@example.com', password='testpass123')
+        UserProfile.objects.create(user=self.user, role='NGO', is_approved=True)
+        self.ngo = NGO.objects.create(
+            user=self.user, name='Food Bank', contact_person='Asha', email='ngo2@example.com',
+            phone='1', address='x', city='Pune'
+        )
+        donor_user = User.objects.create_user(username='donor2', email='donor2@example.com', password='testpass123')
+        self.donor = Donor.objects.create(
+            user=donor_user, name='Cafe', email='donor2@example.com', phone='1', address='x', city='Pune'
+        )
+        NGOFoodRequirement.objects.create(
+            ngo=self.ngo, required_date=date.today(), required_time='12:00', estimated_servings=30
+        )
+    
+    def _add_donations(self, count):
+        for i in range(count):
+            donation = Donation.objects.create(
+                donor=self.donor, title=f'Meal {i}', quantity=5, location='Pune',
+                expiry_date=date.today() + timedelta(days=2)
+            )
+            if i % 2:
+                PickupRequest.objects.create(
+                    donation=donation, requester=self.user, requester_name='Food Bank',
+                    requester_email='ngo2@example.com', requester_phone='1', status='Completed'
+                )
+                # Completing a pickup marks the donation picked up; keep it listed
+                Donation.objects.filter(pk=donation.pk).update(status='Available')
+    
+    def test_context_within_query_budget(self):
+        """Building the context stays within the budget and marks completed pickups."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .services import NGO_DASHBOARD_QUERY_BUDGET, build_ngo_dashboard_context
+        self._add_donations(15)
+        with CaptureQueriesContext(connection) as queries:
+            context = build_ngo_dashboard_context(self.ngo, 'pending')
+        self.assertLessEqual(len(queries), NGO_DASHBOARD_QUERY_BUDGET)
+        self.assertEqual(context['available_completed_count'], 7)
+        self.assertEqual(len(context['filtered_donations']), 8)
+        self.assertEqual(len(context['donors']), 1)
+    
+    def test_page_queries_do_not_grow_with_donations(self):
+        """Rendering the dashboard costs the same number of queries for 2 or 20 donations."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.client.force_login(self.user)
+        self.client.get(reverse('ngo_dashboard'))  # warm per-process caches
+        self._add_donations(2)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('ngo_dashboard'))
+        self._add_donations(18)
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(reverse('ngo_dashboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(many), len(few))
+
+
+class ActorMiddlewareTests(TestCase):
+    """Test cases for the request-scoped actor loader."""
+    
+    def setUp(self):
+        from .models import UserProfile
+        self.user = User.objects.create_user(username='donor3', email='donor3@example.com', password='testpass123')
+        UserProfile.objects.create(user=self.user, role='Donor', is_approved=True)
+        self.donor = Donor.objects.create(user=self.user, name='Cafe', email='donor3@example.com')
+    
+    def test_actor_loads_in_one_query(self):
+        """Profile, role and donor resolve together and are memoized on the user."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .middleware import Actor
+        user = User.objects.get(pk=self.user.pk)
+        actor = Actor(user)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(actor.role, 'Donor')
+            self.assertEqual(actor.donor, self.donor)
+            self.assertIsNone(actor._related['ngo_profile'])
+            self.assertEqual(user.user_profile.role, 'Donor')
+            self.assertFalse(hasattr(user, 'ngo_profile'))
+        self.assertEqual(len(queries), 1)
+    
+    def test_actor_reuses_backend_user(self):
+        """A user loaded by ProfileModelBackend needs no second actor query."""
+        from .claims import ProfileModelBackend
+        from .middleware import Actor
+        user = ProfileModelBackend().get_user(self.user.pk)
+        actor = Actor(user)
+        with self.assertNumQueries(0):
+            self.assertEqual(actor.role, 'Donor')
+            self.assertEqual(actor.donor, self.donor)
+            self.assertIsNone(actor._related['ngo_profile'])
+    
+    def test_request_loads_user_and_actor_together(self):
+        """A logged-in request loads the user, profile and donor in one query."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('donor_history'))
+        self.assertEqual(response.wsgi_request.actor.donor, self.donor)
+        user_queries = [q['sql'] for q in queries if 'FROM "auth_user"' in q['sql']]
+        self.assertEqual(len(user_queries), 1, user_queries)
+    
+    def test_anonymous_actor(self):
+        """Anonymous users get an empty actor without touching the database."""
+        from django.contrib.auth.models import AnonymousUser
+        from .middleware import Actor
+        actor = Actor(AnonymousUser())
+        with self.assertNumQueries(0):
+            self.assertIsNone(actor.profile)
+            self.assertIsNone(actor.role)
+            self.assertIsNone(actor.ngo)
+    
+    def test_views_use_request_actor(self):
+        """Role checks and donor lookups share the request actor."""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('donor_history'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.actor.donor, self.donor)
+
+
+class RoleClaimsTests(TestCase):
+    """Test cases for role and approval claims."""
+    
+    def setUp(self):
+        from .models import UserProfile
+        cache.clear()
+        self.user = User.objects.create_user(username='ngo4', email='ngo4@example.com', password='testpass123')
+        self.profile = UserProfile.objects.create(user=self.user, role='NGO', is_approved=False)
+        self.client.force_login(self.user)
+    
+    def test_check_runs_no_queries(self):
+        """With the profile loaded by the auth backend, checks run no queries."""
+        from django.test import RequestFactory
+        from .claims import ProfileModelBackend, get_role_claims
+        request = RequestFactory().get('/')
+        request.user = ProfileModelBackend().get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_role_claims(request)['role'], 'NGO')
+            self.assertFalse(get_role_claims(request)['can_access'])
+    
+    def test_sessions_from_the_default_backend_stay_logged_in(self):
+        """Sessions stored with ModelBackend's path still authenticate."""
+        self.profile.is_approved = True
+        self.profile.save()
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        self.assertEqual(self.client.get(reverse('ngo_history')).status_code, 200)
+    
+    def test_approval_takes_effect_immediately(self):
+        """Approving the profile invalidates the cached claims."""
+        response = self.client.get(reverse('ngo_history'))
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        self.profile.is_approved = True
+        self.profile.save()
+        response = self.client.get(reverse('ngo_history'))
+        self.assertEqual(response.status_code, 200)
+    
+    def test_rejection_takes_effect_immediately(self):
+        """Revoking approval blocks the next request."""
+        self.profile.is_approved = True
+        self.profile.save()
+        self.assertEqual(self.client.get(reverse('ngo_history')).status_code, 200)
+        self.profile.is_approved = False
+        self.profile.is_rejected = True
+        self.profile.save()
+        response = self.client.get(reverse('ngo_history'))
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+
+
+class DonorDirectoryTests(TestCase):
+    """Test cases for the keyset-paginated, searchable donor directory."""
+    
+    def setUp(self):
+        from django.utils import timezone
+        from .models import UserProfile
+        cache.clear()
+        self.user = User.objects.create_user(username='ngo5', email='ngo5@example.com', password='testpass123')
+        UserProfile.objects.create(user=self.user, role='NGO', is_approved=True)
+        same_time = timezone.now()
+        for i in range(7):
+            Donor.objects.create(name=f'Donor {i}', email=f'd{i}@example.com', city='Pune' if i % 2 else 'Mumbai')
+        # Ties on created_at are broken by id
+        Donor.objects.update(created_at=same_time)
+    
+    def test_keyset_pages_cover_every_row_once(self):
+        """Walking the cursors returns each donor exactly once, newest id first."""
+        from .listing import paginate
+        seen = []
+        cursor = None
+        while True:
+            page = paginate(Donor.objects.all(), cursor=cursor, page_size=3)
+            seen.extend(d.id for d in page)
+            if not page.has_more:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, list(Donor.objects.order_by('-id').values_list('id', flat=True)))
+    
+    def test_prefix_search_is_case_insensitive(self):
+        """Search matches a prefix of name, email or city."""
+        from .listing import paginate
+        self.assertEqual(len(paginate(Donor.objects.all(), search='PUN', search_fields=('name', 'city'))), 3)
+        self.assertEqual([d.email for d in paginate(Donor.objects.all(), search='d4@', search_fields=('email',))], ['d4@example.com'])
+        self.assertEqual(len(paginate(Donor.objects.all(), search='une', search_fields=('city',))), 0)
+    
+    def test_prefix_search_uses_lower_index(self):
+        """The range predicate on LOWER(city) can use the functional index (SQLite)."""
+        from django.db import connection
+        from .listing import prefix_search
+        if connection.vendor != 'sqlite':
+            self.skipTest('EXPLAIN output checked on SQLite only')
+        plan = prefix_search(Donor.objects.all(), 'pu', ('city',)).explain()
+        self.assertIn('donor_city_lower_idx', plan)
+    
+    def test_json_endpoint_and_invalid_cursor(self):
+        """The API returns a page with a cursor and rejects garbage cursors."""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('donor_directory_api'), {'limit': 5})
+        data = response.json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertTrue(data['has_more'])
+        response = self.client.get(reverse('donor_directory_api'), {'cursor': data['next_cursor']})
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertFalse(response.json()['has_more'])
+        response = self.client.get(reverse('donor_directory_api'), {'cursor': '!!!'})
+        self.assertEqual(response.status_code, 400)
+    
+    def test_ngo_donors_page(self):
+        """The HTML page renders one page and a load-more control."""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('ngo_donors'), {'q': 'mum'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page']), 4)
+        self.assertNotContains(response, 'donorDirectoryMore')
+    
+    def test_admin_manage_users_page(self):
+        """The admin page shares the paginated donor directory."""
+        from .models import UserProfile
+        admin = User.objects.create_user(username='admin5', email='admin5@example.com', password='testpass123')
+        UserProfile.objects.create(user=admin, role='Admin', is_approved=True)
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin_manage_users'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['page']), 7)
+
+
+class ImpactRollupTests(TestCase):
+    """Test cases for incremental daily impact rollups."""
+    
+    def setUp(self):
+        self.donor = Donor.objects.create(name='Cafe', email='cafe@example.com', city='Pune ')
+        self.ngo = NGO.objects.create(name='Food Bank', contact_person='Asha', email='bank@example.com', phone='1', address='x', city='Pune')
+        self.requester = User.objects.create_user(username='bank', email='bank@example.com', password='testpass123')
+    
+    def _donation(self, quantity=10, **kwargs):
+        return Donation.objects.create(
+            donor=self.donor, title='Meal', quantity=quantity, location='Pune',
+            expiry_date=date.today() + timedelta(days=2), nutritional_info={'calories': '200'}, **kwargs
+        )
+    
+    def test_created_and_transitions_update_rollups(self):
+        """Creation, pickup completion and expiry are each counted once."""
+        from .rollups import impact_totals
+        picked = self._donation(quantity=10)
+        expired = self._donation(quantity=4)
+        PickupRequest.objects.create(
+            donation=picked, requester=self.requester, requester_name='Food Bank',
+            requester_email='bank@example.com', requester_phone='1', status='Completed'
+        )
+        expired.status = 'Expired'
+        expired.save()
+        expired.save()  # no transition, no double count
+        
+        donor = impact_totals('donor', self.donor.id)
+        self.assertEqual(donor['donations_count'], 2)
+        self.assertEqual(donor['servings_donated'], 14)
+        self.assertEqual(donor['calories'], 400)
+        self.assertEqual(donor['pickups_completed'], 1)
+        self.assertEqual(donor['servings_expired'], 4)
+        self.assertEqual(impact_totals('ngo', self.ngo.id)['servings_received'], 10)
+        self.assertEqual(impact_totals('city', 'pune')['donations_count'], 2)
+    
+    def test_backfill_matches_incremental(self):
+        """The backfill command rebuilds the same totals from history in chunks."""
+        from django.core.management import call_command
+        from io import StringIO
+        from .models import DailyImpactRollup
+        from .rollups import impact_totals
+        for quantity in (3, 5, 7):
+            self._donation(quantity=quantity)
+        Donation.objects.filter(quantity=5).update(status='Picked Up', ngo=self.ngo)
+        incremental = impact_totals('donor', self.donor.id)
+        DailyImpactRollup.objects.all().delete()
+        call_command('backfill_impact_rollups', chunk_size=2, stdout=StringIO())
+        rebuilt = impact_totals('donor', self.donor.id)
+        self.assertEqual(rebuilt['servings_donated'], incremental['servings_donated'])
+        self.assertEqual(rebuilt['pickups_completed'], 1)
+        self.assertEqual(impact_totals('ngo', self.ngo.id)['servings_received'], 5)
+    
+    def test_upgrade_migration_rebuilds_rollups(self):
+        """Migration 0018 fills the rollups for history recorded before they existed."""
+        from importlib import import_module
+        from django.db import connection
+        from django.db.migrations.loader import MigrationLoader
+        from .models import DailyImpactRollup
+        from .rollups import platform_totals
+        for quantity in (3, 5):
+            self._donation(quantity=quantity)
+        DailyImpactRollup.objects.all().delete()
+        migration = import_module('HungerFree.migrations.0018_rebuild_impact_rollups')
+        state = MigrationLoader(connection).project_state(('HungerFree', '0018_rebuild_impact_rollups'))
+        migration.rebuild_impact_rollups(state.apps, None)
+        self.assertEqual(platform_totals()['donations_count'], 2)
+        self.assertEqual(platform_totals()['servings_donated'], 8)
+    
+    def test_rebuild_takes_the_rollup_lock_first(self):
+        """The rebuild reads history only after locking rollup writes."""
+        from unittest import mock
+        from .rollups import rebuild_rollups
+        calls = []
+        with mock.patch('HungerFree.rollups.lock_rollups', side_effect=lambda: calls.append('lock')), \
+                mock.patch('HungerFree.rollups._add_history', side_effect=lambda *args: calls.append('read') or 0):
+            rebuild_rollups()
+        self.assertEqual(calls, ['lock', 'read', 'read'])
+
+
+class TimeseriesAPITests(TestCase):
+    """Test cases for the rollup-backed admin time-series API."""
+    
+    def setUp(self):
+        from .models import DailyImpactRollup, UserProfile
+        cache.clear()
+        admin = User.objects.create_user(username='admin6', email='admin6@example.com', password='testpass123')
+        UserProfile.objects.create(user=admin, role='Admin', is_approved=True)
+        self.client.force_login(admin)
+        self.end = date(2026, 3, 31)
+        for offset in range(730):
+            DailyImpactRollup.objects.create(
+                scope='city', key='pune' if offset % 2 else 'mumbai', date=self.end - timedelta(days=offset),
+                donations_count=1, servings_donated=10, servings_expired=1 if offset % 2 else 0,
+            )
+    
+    def _get(self, **params):
+        return self.client.get(reverse('admin_timeseries'), params)
+    
+    def test_two_year_daily_series_is_downsampled(self):
+        """A 2-year daily series is bounded and keeps the total."""
+        response = self._get(metric='donations_count', start='2024-04-01', end='2026-03-31', max_points=100)
+        data = response.json()
+        self.assertLessEqual(len(data['points']), 100)
+        self.assertEqual(data['buckets_per_point'], 8)
+        self.assertEqual(sum(p['value'] for p in data['points']), 730)
+    
+    def test_monthly_buckets_and_ratio_metric(self):
+        """Month buckets start on the 1st; the waste rate is recomputed from sums."""
+        data = self._get(metric='expiry_waste_rate', bucket='month', start='2026-01-01', end='2026-03-31').json()
+        self.assertEqual([p['start'] for p in data['points']], ['2026-01-01', '2026-02-01', '2026-03-01'])
+        for point in data['points']:
+            self.assertAlmostEqual(point['value'], 0.05, places=2)
+    
+    def test_city_filter_and_weeks(self):
+        """A city key restricts the series; week buckets start on Monday."""
+        data = self._get(metric='servings_donated', bucket='week', key='Pune', start='2026-03-02', end='2026-03-15').json()
+        self.assertEqual([p['start'] for p in data['points']], ['2026-03-02', '2026-03-09'])
+        self.assertEqual(sum(p['value'] for p in data['points']), 70)
+    
+    def test_results_are_cached(self):
+        """Repeat requests are served from the cache."""
+        self._get(metric='donations_count', start='2026-03-01', end='2026-03-31')
+        with self.assertNumQueries(0):
+            from .analytics import cached_timeseries
+            cached_timeseries(metric='donations_count', bucket='day', scope=None, key=None,
+                              start=date(2026, 3, 1), end=date(2026, 3, 31), max_points=None)
+    
+    def test_invalid_params(self):
+        """Unknown metrics and malformed dates are rejected."""
+        self.assertEqual(self._get(metric='nope').status_code, 400)
+        self.assertEqual(self._get(start='2026-02-30').status_code, 400)
+        self.assertEqual(self._get(bucket='year').status_code, 400)
+
+
+class QueryPlanTests(TestCase):
+    """EXPLAIN regression tests: hot queries must not fall back to full table scans."""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='plan', email='plan@example.com', password='testpass123')
+        cls.donor = Donor.objects.create(name='Cafe', email='cafe@example.com', city='Pune')
+        cls.donation = Donation.objects.create(
+            donor=cls.donor, title='Meal', quantity=5, location='Pune',
+            expiry_date=date.today() + timedelta(days=1)
+        )
+    
+    def _plan(self, queryset):
+        from django.db import connection
+        if connection.vendor == 'postgresql':
+            # Tiny test tables make sequential scans cheapest; ask whether an index path exists
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+            try:
+                return queryset.explain()
+            finally:
+                with connection.cursor() as cursor:
+                    cursor.execute('SET enable_seqscan = on')
+        return queryset.explain()
+    
+    def assertNoFullScan(self, queryset):
+        import re
+        from django.db import connection
+        plan = self._plan(queryset)
+        if connection.vendor == 'sqlite':
+            # "SCAN <table>" without "USING ... INDEX" is a full table scan
+            full_scans = [line for line in plan.splitlines() if re.search(r'\bSCAN\b', line) and 'INDEX' not in line]
+        elif connection.vendor == 'postgresql':
+            full_scans = [line for line in plan.splitlines() if 'Seq Scan' in line]
+        else:
+            self.skipTest(f'No plan check for {connection.vendor}')
+        self.assertEqual(full_scans, [], f'Full scan in plan:\n{plan}')
+    
+    def test_available_donations_newest_first(self):
+        self.assertNoFullScan(Donation.objects.filter(status='Available').order_by('-created_at')[:20])
+    
+    def test_available_donations_near_city(self):
+        self.assertNoFullScan(
+            Donation.objects.filter(status='Available', city_key='pune')
+            .select_related('donor').order_by('-created_at')[:20]
+        )
+    
+    def test_donors_in_city(self):
+        self.assertNoFullScan(Donor.objects.filter(city_key='pune').order_by('-created_at')[:20])
+    
+    def test_completed_pickup_for_donation(self):
+        self.assertNoFullScan(PickupRequest.objects.filter(donation=self.donation, status='Completed'))
+    
+    def test_completed_pickup_annotation(self):
+        from django.db.models import Exists, OuterRef
+        completed = PickupRequest.objects.filter(donation=OuterRef('pk'), status='Completed')
+        self.assertNoFullScan(
+            Donation.objects.filter(status='Available').annotate(done=Exists(completed)).order_by('-created_at')[:20]
+        )
+    
+    def test_ngo_by_email(self):
+        self.assertNoFullScan(NGO.objects.filter(email='plan@example.com'))
+    
+    def test_unread_notifications(self):
+        from .models import Notification
+        self.assertNoFullScan(
+            Notification.objects.filter(user=self.user, is_read=False).order_by('-created_at')[:5]
+        )
+    
+    def test_donor_directory_prefix_search(self):
+        from .listing import prefix_search
+        self.assertNoFullScan(prefix_search(Donor.objects.all(), 'pu', ('city',)))
+
+
+class DonationSearchTests(TestCase):
+    """Test cases for full-text donation search."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='searcher', email='searcher@example.com', password='testpass123')
+        self.client.force_login(self.user)
+        tomorrow = date.today() + timedelta(days=1)
+        self.biryani = Donation.objects.create(
+            title='Chicken biryani', description='Biryani trays from a wedding, biryani raita included',
+            quantity=40, location='Andheri West', expiry_date=tomorrow
+        )
+        self.paneer = Donation.objects.create(
+            title='Paneer curry', description='Served with biryani rice', quantity=10,
+            location='Bandra', expiry_date=date.today() + timedelta(days=5)
+        )
+        self.dal = Donation.objects.create(
+            title='Dal tadka', description='Yellow lentils', quantity=15, location='Andheri East', expiry_date=tomorrow
+        )
+    
+    def _search(self, query):
+        from .search import search_donations
+        return list(search_donations(Donation.objects.all(), query).order_by('-search_rank', '-created_at'))
+    
+    def test_ranked_matches_across_fields(self):
+        """Matches in title and description are ranked; prefixes match."""
+        self.assertEqual(self._search('biryani'), [self.biryani, self.paneer])
+        self.assertEqual(self._search('birya'), [self.biryani, self.paneer])
+        self.assertEqual(set(self._search('andheri')), {self.biryani, self.dal})
+        self.assertEqual(self._search('lentils andheri'), [self.dal])
+    
+    def test_index_follows_updates_and_deletes(self):
+        """Triggers keep the search index in sync with the donation table."""
+        self.dal.title = 'Rajma chawal'
+        self.dal.save()
+        self.assertEqual(self._search('rajma'), [self.dal])
+        self.assertEqual(self._search('tadka'), [])
+        self.dal.delete()
+        self.assertEqual(self._search('rajma'), [])
+    
+    def test_operators_in_input_are_ignored(self):
+        """Punctuation and FTS syntax in user input cannot break the query."""
+        self.assertEqual(self._search('"biryani" OR (NEAR'), [])
+        self.assertEqual(self._search('biryani*'), [self.biryani, self.paneer])
+        self.assertEqual(len(self._search('  !!  ')), 3)
+    
+    def test_donations_page_combines_search_and_expiry(self):
+        """q= works with the expiry filter on /donations/."""
+        response = self.client.get(reverse('donations'), {'q': 'biryani', 'expiry': 'soon'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['donations']), [self.biryani])
+        self.assertEqual(response.context['sort_by'], 'relevance')
+    
+    def test_api_search(self):
+        """q= on /api/donations/ returns ranked results."""
+        response = self.client.get(reverse('api_donations'), {'q': 'biryani'})
+        self.assertEqual([r['id'] for r in response.json()['results']], [self.biryani.id, self.paneer.id])
+    
+    def test_search_uses_fts_index(self):
+        """On SQLite the match is answered by the FTS5 index, not a table scan."""
+        from django.db import connection
+        from .search import search_donations, sqlite_fts_available
+        if connection.vendor != 'sqlite' or not sqlite_fts_available():
+            self.skipTest('FTS5 not available')
+        plan = search_donations(Donation.objects.filter(status='Available'), 'biryani').explain()
+        self.assertIn('VIRTUAL TABLE INDEX', plan)
+
+
+class LocationNormalizationTests(TestCase):
+    """Test cases for normalized city keys."""
+    
+    def setUp(self):
+        self.client.force_login(User.objects.create_user(username='locator', password='testpass123'))
+        tomorrow = date.today() + timedelta(days=1)
+        self.donor = Donor.objects.create(name='Blr Donor', email='blr@example.com', city='Bangalore ')
+        self.ngo = NGO.objects.create(
+            name='Blr NGO', contact_person='Asha', email='blrngo@example.com',
+            phone='1234567890', address='MG Road', city='BENGALURU'
+        )
+        self.in_city = Donation.objects.create(
+            donor=self.donor, title='Idli', quantity=10, location='Koramangala', expiry_date=tomorrow
+        )
+        self.by_location = Donation.objects.create(
+            title='Vada pav', quantity=20, location='Andheri West, Bombay', expiry_date=tomorrow
+        )
+    
+    def test_normalize_city(self):
+        """Case, whitespace, punctuation, aliases and region suffixes collapse to one key."""
+        from .locations import city_key_from_location, normalize_city
+        self.assertEqual(normalize_city('  bangalore '), 'bengaluru')
+        self.assertEqual(normalize_city('Bengaluru, Karnataka'), 'bengaluru')
+        self.assertEqual(normalize_city('St. Thomas  Mount'), 'st thomas mount')
+        self.assertEqual(normalize_city(''), '')
+        self.assertEqual(city_key_from_location('Pune Road, Mumbai'), 'mumbai')
+        self.assertEqual(city_key_from_location('Shivaji Nagar, Kolhapur, Maharashtra, India'), 'kolhapur')
+    
+    def test_keys_set_on_save(self):
+        """Donation keys come from the location, else the donor's city."""
+        self.assertEqual(self.donor.city_key, 'bengaluru')
+        self.assertEqual(self.ngo.city_key, 'bengaluru')
+        self.assertEqual(self.in_city.city_key, 'bengaluru')
+        self.assertEqual(self.by_location.city_key, 'mumbai')
+        self.by_location.location = 'Madras'
+        self.by_location.save(update_fields=['location'])
+        self.by_location.refresh_from_db()
+        self.assertEqual(self.by_location.city_key, 'chennai')
+    
+    def test_bengaluru_matches_bangalore(self):
+        """The NGO dashboard matches donations across spellings of the city."""
+        from .services import build_ngo_dashboard_context
+        context = build_ngo_dashboard_context(self.ngo)
+        self.assertEqual([d.id for d in context['nearby_donations']], [self.in_city.id])
+        self.assertEqual(context['donors'], [self.donor])
+    
+    def test_api_location_filter(self):
+        """?location= filters by city key."""
+        response = self.client.get(reverse('api_donations'), {'location': 'bombay'})
+        self.assertEqual([r['id'] for r in response.json()['results']], [self.by_location.id])
+    
+    def test_backfill_command(self):
+        """backfill_city_keys repairs stale keys without touching up-to-date rows."""
+        from io import StringIO
+        from django.core.management import call_command
+        Donation.objects.filter(pk=self.in_city.pk).update(city_key='')
+        Donor.objects.filter(pk=self.donor.pk).update(city_key='bangalore')
+        out = StringIO()
+        call_command('backfill_city_keys', chunk_size=1, stdout=out)
+        self.assertIn('Updated city_key on 1 donors', out.getvalue())
+        self.assertIn('Updated city_key on 1 donations', out.getvalue())
+        self.in_city.refresh_from_db()
+        self.assertEqual(self.in_city.city_key, 'bengaluru')
+
+
+class ExpirySweepTests(TestCase):
+    """Test cases for the expiry sweeper."""
+    
+    def setUp(self):
+        self.donor = Donor.objects.create(name='Cafe', email='cafe@example.com', city='Pune')
+        self.ngo = NGO.objects.create(name='Food Bank', contact_person='Asha', email='bank@example.com', phone='1', address='x', city='Pune')
+        yesterday = date.today() - timedelta(days=1)
+        self.overdue = [
+            Donation.objects.create(donor=self.donor, title=f'Old {i}', quantity=i, location='Pune', expiry_date=yesterday)
+            for i in (2, 3, 4)
+        ]
+        self.fresh = Donation.objects.create(
+            donor=self.donor, title='Fresh', quantity=9, location='Pune', expiry_date=date.today()
+        )
+        self.pickup = PickupRequest.objects.create(
+            donation=self.overdue[0], requester_name='Food Bank', requester_email='bank@example.com', requester_phone='1'
+        )
+        self.requirement = NGOFoodRequirement.objects.create(
+            ngo=self.ngo, required_date=yesterday, required_time='12:00', estimated_servings=20
+        )
+    
+    def test_sweep_expires_overdue_rows_in_chunks(self):
+        """Overdue donations, their open pickups and past requirements become Expired."""
+        from .expiry import sweep_expired
+        from .rollups import impact_totals
+        result = sweep_expired(chunk_size=2)
+        self.assertEqual(sorted(result.donation_ids), sorted(d.pk for d in self.overdue))
+        self.assertEqual(result.pickup_ids, [self.pickup.pk])
+        self.assertEqual(result.requirement_ids, [self.requirement.pk])
+        self.assertEqual(Donation.objects.filter(status='Available').get(), self.fresh)
+        self.pickup.refresh_from_db()
+        self.assertEqual(self.pickup.status, 'Expired')
+        self.assertEqual(impact_totals('donor', self.donor.id)['servings_expired'], 9)
+        # A second sweep finds nothing and counts nothing twice
+        self.assertEqual(sweep_expired().total, 0)
+        self.assertEqual(impact_totals('donor', self.donor.id)['servings_expired'], 9)
+    
+    def test_one_event_batch_per_sweep(self):
+        """expiry_sweep_completed fires once per run, with every expired id."""
+        from .expiry import expiry_sweep_completed, sweep_expired
+        events = []
+        handler = lambda sender, **kwargs: events.append(kwargs)
+        expiry_sweep_completed.connect(handler)
+        try:
+            sweep_expired(chunk_size=1)
+            sweep_expired(chunk_size=1)
+        finally:
+            expiry_sweep_completed.disconnect(handler)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(len(events[0]['donation_ids']), 3)
+    
+    def test_command_loop(self):
+        """expire_donations --loop stops after --max-runs."""
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        out = StringIO()
+        with mock.patch('time.sleep') as sleep:
+            call_command('expire_donations', loop=True, interval=5, max_runs=2, stdout=out)
+        self.assertEqual(sleep.call_count, 1)
+        self.assertIn('Sweep 1: 3 donations, 1 pickup requests, 1 requirements expired', out.getvalue())
+        self.assertIn('Sweep 2: 0 donations', out.getvalue())
+    
+    def test_command_loop_survives_a_failed_sweep(self):
+        """A sweep that raises is logged and the loop carries on."""
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from django.db import OperationalError
+        from .expiry import sweep_expired
+        out, err = StringIO(), StringIO()
+        calls = []
+        
+        def flaky_sweep(**kwargs):
+            calls.append(kwargs)
+            if len(calls) == 1:
+                raise OperationalError('connection lost')
+            return sweep_expired(**kwargs)
+        
+        with mock.patch('time.sleep'), \
+                mock.patch('HungerFree.management.commands.expire_donations.sweep_expired', flaky_sweep), \
+                self.assertLogs('HungerFree.management.commands.expire_donations', 'ERROR'):
+            call_command('expire_donations', loop=True, interval=5, max_runs=2, stdout=out, stderr=err)
+        self.assertIn('Sweep 1 failed', err.getvalue())
+        self.assertIn('Sweep 2: 3 donations, 1 pickup requests, 1 requirements expired', out.getvalue())
+
+
+class ArchivalTests(TestCase):
+    """Test cases for archiving finished rows and reading history across the archive."""
+    
+    def setUp(self):
+        from django.utils import timezone
+        from .models import Notification
+        self.user = User.objects.create_user(username='archdonor', email='archdonor@example.com', password='testpass123')
+        self.ngo_user = User.objects.create_user(username='archngo', email='archngo@example.com', password='testpass123')
+        self.donor = Donor.objects.create(user=self.user, name='Cafe', email='archdonor@example.com', city='Pune')
+        self.ngo = NGO.objects.create(
+            user=self.ngo_user, name='Food Bank', contact_person='Asha', email='archngo@example.com',
+            phone='1', address='x', city='Pune'
+        )
+        expiry = date.today() + timedelta(days=1)
+        self.old = [
+            Donation.objects.create(donor=self.donor, title=f'Old {i}', quantity=5, location='Pune', expiry_date=expiry)
+            for i in range(3)
+        ]
+        self.pickup = PickupRequest.objects.create(
+            donation=self.old[0], requester=self.ngo_user, requester_name='Food Bank',
+            requester_email='archngo@example.com', requester_phone='1', status='Completed'
+        )
+        self.live = Donation.objects.create(donor=self.donor, title='Current', quantity=2, location='Pune', expiry_date=expiry)
+        Notification.objects.create(user=self.user, notification_type='donation_confirmed', title='Thanks', message='m', is_read=True)
+        # Age the finished rows past the archive threshold
+        past = timezone.now() - timedelta(days=120)
+        Donation.objects.filter(pk__in=[d.pk for d in self.old]).update(status='Picked Up', created_at=past, updated_at=past)
+        PickupRequest.objects.update(requested_at=past)
+        Notification.objects.update(created_at=past)
+    
+    def test_archives_terminal_rows_in_chunks(self):
+        """Old finished rows move to the archive tables; live rows stay."""
+        from .archive import archive_terminal_rows
+        from .models import ArchivedDonation, ArchivedNotification, ArchivedPickupRequest, Notification
+        result = archive_terminal_rows(older_than_days=90, chunk_size=2, segment_dir='')
+        self.assertEqual((result.donations, result.pickup_requests, result.notifications), (3, 1, 1))
+        self.assertEqual(list(Donation.objects.all()), [self.live])
+        self.assertFalse(PickupRequest.objects.exists())
+        self.assertFalse(Notification.objects.exists())
+        archived = ArchivedDonation.objects.get(pk=self.old[0].pk)
+        self.assertEqual((archived.donor, archived.status, archived.city_key), (self.donor, 'Picked Up', 'pune'))
+        self.assertEqual(archived.data['description'], '')
+        self.assertEqual(ArchivedPickupRequest.objects.get().donation_id, self.old[0].pk)
+        self.assertEqual(ArchivedNotification.objects.get().data['message'], 'm')
+        self.assertEqual(archive_terminal_rows(older_than_days=90).donations, 0)
+    
+    def test_segments_written(self):
+        """With a segment directory, each chunk is also written as gzip JSONL."""
+        import gzip
+        import json
+        import tempfile
+        from .archive import archive_terminal_rows
+        with tempfile.TemporaryDirectory() as directory:
+            result = archive_terminal_rows(older_than_days=90, chunk_size=2, segment_dir=directory)
+            self.assertEqual(len(result.segments), 4)  # 2 donation chunks, 1 pickup, 1 notification
+            with gzip.open(result.segments[0], 'rt') as f:
+                rows = [json.loads(line) for line in f]
+        self.assertEqual([row['id'] for row in rows], [self.old[0].pk, self.old[1].pk])
+    
+    def test_history_reads_live_and_archive(self):
+        """donor_history and ngo_history include archived donations."""
+        from .archive import archive_terminal_rows
+        from .models import UserProfile
+        archive_terminal_rows(older_than_days=90)
+        UserProfile.objects.create(user=self.user, role='Donor', is_approved=True)
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('donor_history'))
+        self.assertEqual([d.title for d in response.context['donations']], ['Current', 'Old 2', 'Old 1', 'Old 0'])
+        UserProfile.objects.create(user=self.ngo_user, role='NGO', is_approved=True)
+        self.client.force_login(self.ngo_user)
+        response = self.client.get(reverse('ngo_history'))
+        self.assertEqual([d.title for d in response.context['donations']], ['Old 0'])
+    
+    def test_history_pages_span_live_and_archive(self):
+        """Keyset pages continue from live rows into archived ones without gaps."""
+        from .archive import archive_terminal_rows, donor_history
+        archive_terminal_rows(older_than_days=90)
+        first = donor_history(self.donor, page_size=2)
+        second = donor_history(self.donor, cursor=first.next_cursor, page_size=2)
+        self.assertEqual([d.title for d in first], ['Current', 'Old 2'])
+        self.assertEqual([d.title for d in second], ['Old 1', 'Old 0'])
+        self.assertFalse(second.has_more)
+    
+    def test_ngo_impact_survives_archival(self):
+        """NGO dashboard totals are the same before and after archiving."""
+        from .archive import archive_terminal_rows
+        from .services import build_ngo_dashboard_context
+        Donation.objects.filter(pk=self.old[0].pk).update(calories=400, protein=12)
+        keys = ('total_received_servings', 'total_calories', 'total_protein')
+        before = [build_ngo_dashboard_context(self.ngo)[key] for key in keys]
+        archive_terminal_rows(older_than_days=90)
+        after = [build_ngo_dashboard_context(self.ngo)[key] for key in keys]
+        self.assertEqual(before, [5, 400, 12])
+        self.assertEqual(after, before)
+    
+    def test_rollup_backfill_includes_archive(self):
+        """backfill_impact_rollups still counts archived donations."""
+        from io import StringIO
+        from django.core.management import call_command
+        from .archive import archive_terminal_rows
+        from .rollups import impact_totals
+        archive_terminal_rows(older_than_days=90)
+        call_command('backfill_impact_rollups', stdout=StringIO())
+        totals = impact_totals('donor', self.donor.id)
+        self.assertEqual(totals['donations_count'], 4)
+        self.assertEqual(totals['pickups_completed'], 3)
+        self.assertEqual(impact_totals('ngo', self.ngo.id)['servings_received'], 5)
+
+
+class DatabaseConfigTests(TestCase):
+    """Test cases for the connection configuration layer."""
+    
+    def test_sqlite_entry(self):
+        """SQLite gets persistent connections, WAL pragmas and immediate transactions."""
+        from FoodSaver.database import build_databases
+        entry = build_databases('', '/tmp/db.sqlite3')['default']
+        self.assertGreater(entry['CONN_MAX_AGE'], 0)
+        self.assertTrue(entry['CONN_HEALTH_CHECKS'])
+        self.assertIn('PRAGMA journal_mode=WAL', entry['OPTIONS']['init_command'])
+        self.assertIn('PRAGMA synchronous=NORMAL', entry['OPTIONS']['init_command'])
+        self.assertEqual(entry['OPTIONS']['transaction_mode'], 'IMMEDIATE')
+    
+    def test_no_persistent_connections_under_asgi(self):
+        """CONN_MAX_AGE defaults to 0 when FoodSaver.asgi is the entry point."""
+        import importlib
+        import os
+        from unittest import mock
+        from FoodSaver import database
+        try:
+            with mock.patch.dict(os.environ, {'FOODSAVER_ASGI': '1'}):
+                os.environ.pop('DB_CONN_MAX_AGE', None)
+                importlib.reload(database)
+                self.assertEqual(database.build_databases('', '/tmp/db.sqlite3')['default']['CONN_MAX_AGE'], 0)
+        finally:
+            importlib.reload(database)
+    
+    def test_pragmas_applied_on_connect(self):
+        """The test connection runs the configured init_command."""
+        from django.db import connection
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertGreater(cursor.fetchone()[0], 0)
+    
+    def test_benchmark_command(self):
+        """benchmark_db reports throughput for both configurations."""
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('benchmark_db', readers=1, writers=1, seconds=0.2, rows=10, stdout=out)
+        self.assertIn('default:', out.getvalue())
+        self.assertIn('tuned:', out.getvalue())
+
+
+class ReplicaRoutingTests(TestCase):
+    """Test cases for read-replica routing and read-your-writes stickiness."""
+    
+    def setUp(self):
+        from django.test import RequestFactory
+        self.factory = RequestFactory()
+    
+    def _request(self, view, cookies=None):
+        from django.test import override_settings
+        from .db_routing import ReplicaRoutingMiddleware
+        request = self.factory.get('/')
+        request.COOKIES.update(cookies or {})
+        with override_settings(DATABASE_REPLICAS=['replica1']):
+            return ReplicaRoutingMiddleware(view)(request)
+    
+    def test_reads_routed_only_inside_read_only_views(self):
+        """Read-only views read app models from a replica; other reads use the primary."""
+        from django.http import HttpResponse
+        from .db_routing import replica_reads
+        seen = {}
+        
+        @replica_reads
+        def read_view(request):
+            seen['donation'] = Donation.objects.all().db
+            seen['user'] = User.objects.all().db
+            return HttpResponse()
+        
+        def plain_view(request):
+            seen['plain'] = Donation.objects.all().db
+            return HttpResponse()
+        
+        response = self._request(read_view)
+        self._request(plain_view)
+        self.assertEqual(seen, {'donation': 'replica1', 'user': 'default', 'plain': 'default'})
+        self.assertNotIn('db_primary_until', response.cookies)
+    
+    def test_write_pins_request_and_sets_sticky_cookie(self):
+        """After a write, reads stay on the primary and the browser is pinned."""
+        from django.http import HttpResponse
+        from .db_routing import replica_reads
+        seen = []
+        
+        @replica_reads
+        def write_view(request):
+            Donor.objects.create(name='Sticky', email='sticky@example.com')
+            seen.append(Donor.objects.all().db)
+            return HttpResponse()
+        
+        @replica_reads
+        def read_view(request):
+            seen.append(Donation.objects.all().db)
+            return HttpResponse()
+        
+        response = self._request(write_view)
+        cookie = response.cookies['db_primary_until']
+        self._request(read_view, cookies={'db_primary_until': cookie.value})
+        self._request(read_view, cookies={'db_primary_until': '0'})
+        self.assertEqual(seen, ['default', 'default', 'replica1'])
+    
+    def test_one_replica_per_request(self):
+        """Every read in a request uses the replica picked for its first read."""
+        from django.http import HttpResponse
+        from django.test import override_settings
+        from .db_routing import ReplicaRoutingMiddleware, replica_reads
+        seen = []
+        
+        @replica_reads
+        def read_view(request):
+            seen.extend(Donation.objects.all().db for _ in range(20))
+            return HttpResponse()
+        
+        with override_settings(DATABASE_REPLICAS=['replica1', 'replica2', 'replica3']):
+            for _ in range(5):
+                ReplicaRoutingMiddleware(read_view)(self.factory.get('/'))
+                self.assertEqual(len(set(seen)), 1)
+                self.assertIn(seen[0], ['replica1', 'replica2', 'replica3'])
+                seen.clear()
+    
+    def test_no_replicas_configured(self):
+        """Without replicas every read uses the primary."""
+        from .db_routing import read_only
+        with read_only():
+            self.assertEqual(Donation.objects.all().db, 'default')
+    
+    def test_migrations_skip_replicas(self):
+        from django.test import override_settings
+        from .db_routing import ReplicaRouter
+        with override_settings(DATABASE_REPLICAS=['replica1']):
+            self.assertFalse(ReplicaRouter().allow_migrate('replica1', 'HungerFree'))
+            self.assertTrue(ReplicaRouter().allow_migrate('default', 'HungerFree'))
+
+
+class DonationClaimTests(TestCase):
+    """Test cases for atomic conditional donation claims."""
+    
+    def setUp(self):
+        from .models import UserProfile
+        self.user = User.objects.create_user(username='claimer', email='claimer@example.com', password='testpass123')
+        UserProfile.objects.create(user=self.user, role='NGO', is_approved=True)
+        self.ngo = NGO.objects.create(
+            user=self.user, name='Claim NGO', contact_person='Asha', email='claimer@example.com',
+            phone='1', address='x', city='Pune'
+        )
+        self.donation = Donation.objects.create(
+            title='Tray', quantity=10, location='Pune', expiry_date=date.today() + timedelta(days=1)
+        )
+    
+    def test_first_claim_wins(self):
+        """The first claim reserves the donation; later claims are rejected without side effects."""
+        from .pickups import DonationUnavailable, claim_donation
+        pickup = claim_donation(self.donation, requester=self.user, requester_name='Claim NGO', ngo=self.ngo)
+        self.donation.refresh_from_db()
+        self.assertEqual((self.donation.status, self.donation.ngo), ('Reserved', self.ngo))
+        self.assertEqual(pickup.status, 'Pending')
+        with self.assertRaises(DonationUnavailable) as raised:
+            claim_donation(self.donation, requester_name='Late NGO')
+        self.assertEqual(raised.exception.status, 'Reserved')
+        self.assertEqual(PickupRequest.objects.count(), 1)
+    
+    def test_claim_is_a_single_conditional_update(self):
+        """The claim never reads the row before updating it."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .pickups import claim_donation
+        with CaptureQueriesContext(connection) as queries:
+            claim_donation(self.donation, requester_name='Claim NGO')
+        updates = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"status" = \'Available\'', updates[0].replace('%s', "'Available'"))
+        self.assertFalse(any(q['sql'].startswith('SELECT') for q in queries.captured_queries))
+    
+    def test_api_claim(self):
+        """The claim API answers 201, then 409 already_claimed, and 404 for unknown donations."""
+        self.client.force_login(self.user)
+        url = reverse('api_claim_donation', args=[self.donation.id])
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['status'], 'Reserved')
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {'error': 'already_claimed', 'status': 'Reserved'})
+        self.assertEqual(self.client.post(reverse('api_claim_donation', args=[999999])).status_code, 404)
+        self.assertEqual(self.client.get(url).status_code, 405)
+    
+    def test_ngo_view_joins_waitlist_when_claimed(self):
+        """ngo_request_pickup queues the NGO instead of double-booking."""
+        Donation.objects.filter(pk=self.donation.pk).update(status='Reserved')
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('ngo_request_pickup', args=[self.donation.id]), follow=True)
+        self.assertContains(response, 'on the waitlist')
+        self.assertEqual(list(PickupRequest.objects.values_list('status', flat=True)), ['Waitlisted'])
+
+
+class ConcurrentClaimTests(TransactionTestCase):
+    """Concurrent claims on one donation: exactly one wins."""
+    
+    def test_concurrent_claims(self):
+        import threading
+        import time
+        from django.db import OperationalError, connection
+        from .pickups import DonationUnavailable, claim_donation
+        donation = Donation.objects.create(
+            title='Tray', quantity=10, location='Pune', expiry_date=date.today() + timedelta(days=1)
+        )
+        outcomes = []
+        barrier = threading.Barrier(8)
+        
+        def claim(number):
+            barrier.wait()
+            try:
+                # The in-memory shared-cache test database reports contention as
+                # "table is locked" instead of waiting; retry like a busy client.
+                for _ in range(200):
+                    try:
+                        claim_donation(donation, requester_name=f'NGO {number}')
+                        outcomes.append('claimed')
+                        return
+                    except DonationUnavailable:
+                        outcomes.append('unavailable')
+                        return
+                    except OperationalError:
+                        time.sleep(0.005)
+            finally:
+                connection.close()
+        
+        threads = [threading.Thread(target=claim, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(outcomes), ['claimed'] + ['unavailable'] * 7)
+        self.assertEqual(PickupRequest.objects.filter(donation=donation).count(), 1)
+
+
+class WaitlistTests(TestCase):
+    """Test cases for the per-donation FIFO waitlist."""
+    
+    def setUp(self):
+        self.donation = Donation.objects.create(
+            title='Tray', quantity=10, location='Pune', expiry_date=date.today() + timedelta(days=2)
+        )
+        self.users = [
+            User.objects.create_user(username=f'waiter{n}', email=f'waiter{n}@example.com', password='testpass123')
+            for n in range(3)
+        ]
+    
+    def _claim(self, number):
+        from .pickups import claim_donation
+        return claim_donation(self.donation, requester=self.users[number],
+                              requester_name=f'NGO {number}', join_waitlist=True)
+    
+    def test_losers_queue_in_order(self):
+        """Claims after the first are Waitlisted in arrival order."""
+        from .pickups import waitlist_position
+        first, second, third = self._claim(0), self._claim(1), self._claim(2)
+        self.assertEqual([first.status, second.status, third.status], ['Pending', 'Waitlisted', 'Waitlisted'])
+        # No deadline was agreed: the donor set no pickup_by and has not approved
+        self.assertIsNone(first.pickup_by)
+        self.assertEqual([waitlist_position(second), waitlist_position(third)], [1, 2])
+    
+    def test_cancel_promotes_head(self):
+        """Cancelling the active claim promotes the oldest waiting request and notifies it."""
+        from .models import Notification
+        from .pickups import release_claim
+        first, second, third = self._claim(0), self._claim(1), self._claim(2)
+        self.assertTrue(release_claim(first))
+        second.refresh_from_db()
+        third.refresh_from_db()
+        self.assertEqual((second.status, third.status), ('Pending', 'Waitlisted'))
+        self.assertIsNone(second.pickup_by)
+        self.donation.refresh_from_db()
+        self.assertEqual(self.donation.status, 'Reserved')
+        self.assertTrue(Notification.objects.filter(user=self.users[1], notification_type='donation_accepted').exists())
+        self.assertFalse(release_claim(first))
+    
+    def test_empty_queue_releases_donation(self):
+        """With nobody waiting, a cancelled claim makes the donation Available again."""
+        from .pickups import release_claim
+        release_claim(self._claim(0))
+        self.donation.refresh_from_db()
+        self.assertEqual(self.donation.status, 'Available')
+    
+    def test_lapsed_claim_promotes_head(self):
+        """The expiry sweep lapses a claim past pickup_by and hands the donation on."""
+        from django.utils import timezone
+        from .expiry import sweep_expired
+        first, second = self._claim(0), self._claim(1)
+        PickupRequest.objects.filter(pk=first.pk).update(pickup_by=timezone.now() - timedelta(minutes=1))
+        result = sweep_expired()
+        self.assertEqual(result.lapsed_pickup_ids, [first.pk])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), ('Expired', 'Pending'))
+    
+    def test_unreviewed_claim_does_not_lapse(self):
+        """A Pending claim without a donor deadline waits for review; approval starts the clock."""
+        from django.utils import timezone
+        from .pickups import approve_claim, lapse_overdue_claims
+        first, second = self._claim(0), self._claim(1)
+        later = timezone.now() + timedelta(days=1)
+        self.assertEqual(lapse_overdue_claims(now=later), [])
+        self.assertTrue(approve_claim(first))
+        self.assertEqual(first.status, 'Approved')
+        self.assertEqual(lapse_overdue_claims(now=later), [first.pk])
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'Pending')
+    
+    def test_donor_pickup_by_applies_to_pending_claims(self):
+        """A Pending claim lapses at the donor's own pickup_by."""
+        from django.utils import timezone
+        self.donation.pickup_by = timezone.now() + timedelta(hours=5)
+        self.donation.save()
+        self.assertEqual(self._claim(0).pickup_by, self.donation.pickup_by)
+    
+    def test_admin_rejection_promotes_waitlist(self):
+        """Rejecting a claim in the Django admin hands the donation to the next in line."""
+        from django.contrib.admin.sites import site
+        from django.test import RequestFactory
+        first, second = self._claim(0), self._claim(1)
+        request = RequestFactory().post('/')
+        request.user = User.objects.create_superuser(username='staff', email='staff@example.com', password='x')
+        model_admin = site._registry[PickupRequest]
+        form = model_admin.get_form(request, first)(
+            instance=first,
+            data={
+                'donation': self.donation.pk, 'requester': self.users[0].pk, 'requester_name': 'NGO 0',
+                'requester_email': 'waiter0@example.com', 'requester_phone': '1', 'status': 'Rejected', 'notes': '',
+            },
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        model_admin.save_model(request, form.save(commit=False), form, change=True)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, second.status), ('Rejected', 'Pending'))
+        self.donation.refresh_from_db()
+        self.assertEqual(self.donation.status, 'Reserved')
+    
+    def test_pickup_closes_waitlist(self):
+        """Once picked up, everyone still waiting is cancelled."""
+        first, second = self._claim(0), self._claim(1)
+        first.status = 'Completed'
+        first.save()
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'Cancelled')
+    
+    def test_cancel_view(self):
+        """Requesters cancel their own request from the detail page; others get 404."""
+        first, second = self._claim(0), self._claim(1)
+        self.client.force_login(self.users[2])
+        self.assertEqual(self.client.post(reverse('cancel_pickup_request', args=[first.id])).status_code, 404)
+        self.client.force_login(self.users[0])
+        response = self.client.post(reverse('cancel_pickup_request', args=[first.id]))
+        self.assertRedirects(response, reverse('donation_detail', args=[self.donation.id]), fetch_redirect_response=False)
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'Pending')
+    
+    def test_api_waitlist(self):
+        """The claim API answers 202 with a queue position when waitlist=1."""
+        self._claim(0)
+        self.client.force_login(self.users[1])
+        response = self.client.post(reverse('api_claim_donation', args=[self.donation.id]), {'waitlist': '1'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual((response.json()['status'], response.json()['position']), ('Waitlisted', 1))
+
+
+class ServerTimingTests(TestCase):
+    """Test cases for per-request Server-Timing instrumentation."""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='timed', password='testpass123')
+        self.client.force_login(self.user)
+    
+    def _metrics(self, response):
+        metrics = {}
+        for part in response['Server-Timing'].split(', '):
+            name, *params = part.split(';')
+            metrics[name] = dict(param.split('=', 1) for param in params)
+        return metrics
+    
+    def test_header_reports_db_and_templates(self):
+        """Rendered pages report total, db (with the query count) and template time."""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('home'))
+        metrics = self._metrics(response)
+        self.assertEqual(set(metrics), {'total', 'db', 'tpl'})
+        self.assertEqual(metrics['db']['desc'], f'"{len(queries.captured_queries)} queries"')
+        self.assertGreater(float(metrics['tpl']['dur']), 0)
+        self.assertGreaterEqual(float(metrics['total']['dur']), float(metrics['db']['dur']))
+    
+    def test_external_calls_are_attributed(self):
+        """external_call() time shows up under the service name."""
+        from unittest import mock
+        from . import timing
+        from .utils import reverse_geocode
+        timings, token = timing.start()
+        try:
+            with mock.patch('HungerFree.utils.requests.get') as get:
+                get.return_value.json.return_value = {'address': {'city': 'Pune'}}
+                self.assertEqual(reverse_geocode(18.5, 73.8)['city'], 'Pune')
+        finally:
+            timing.finish(token)
+        self.assertIn('nominatim', timings.external)
+        self.assertIn('nominatim;dur=', timings.header())
+    
+    def test_inactive_outside_requests(self):
+        """Queries and external calls outside a request record nothing."""
+        from .timing import current, external_call
+        with external_call('gemini'):
+            User.objects.count()
+        self.assertIsNone(current())
+    
+    def test_request_is_logged(self):
+        """Each request is logged as one key=value line."""
+        with self.assertLogs('HungerFree.timing', level='INFO') as logs:
+            self.client.get(reverse('home'))
+        self.assertIn('path=/ status=200', logs.output[0])
+        self.assertIn('db_queries=', logs.output[0])
+
+
+class StaticPipelineTests(TestCase):
+    """Test cases for hashed, precompressed static files and their middleware."""
+    
+    def setUp(self):
+        import shutil
+        import tempfile
+        from django.core.files.base import ContentFile
+        from .staticfiles import CompressedManifestStaticFilesStorage
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.storage = CompressedManifestStaticFilesStorage(location=self.root, base_url='/static/')
+        self.css = 'body { color: green; }\n' * 100
+        files = {'css/site.css': self.css, 'img/logo.png': 'not really a png'}
+        for name, content in files.items():
+            self.storage.save(name, ContentFile(content.encode()))
+        list(self.storage.post_process({name: (self.storage, name) for name in files}))
+        self.hashed_css = self.storage.stored_name('css/site.css')
+    
+    def _middleware(self):
+        from django.http import HttpResponse
+        from django.test import override_settings
+        from .middleware import StaticFilesMiddleware
+        with override_settings(STATIC_ROOT=self.root):
+            return StaticFilesMiddleware(lambda request: HttpResponse('app'))
+    
+    def _get(self, path, **headers):
+        from django.test import RequestFactory
+        return self._middleware()(RequestFactory().get(path, **headers))
+    
+    def test_collectstatic_writes_hashed_and_gzip_variants(self):
+        """Text assets get a hashed name and .gz variants; binary assets are left alone."""
+        import gzip
+        import os
+        self.assertRegex(self.hashed_css, r'^css/site\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.root, self.hashed_css + '.gz'), 'rb') as compressed:
+            self.assertEqual(gzip.decompress(compressed.read()).decode(), self.css)
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'css/site.css.gz')))
+        self.assertFalse(any(name.endswith('.gz') for name in os.listdir(os.path.join(self.root, 'img'))))
+    
+    def test_collectstatic_warns_without_brotli(self):
+        """A missing brotli package is reported instead of silently skipping .br files."""
+        from unittest import mock
+        with mock.patch('HungerFree.staticfiles.brotli', None), \
+                self.assertLogs('HungerFree.staticfiles', 'WARNING') as logs:
+            list(self.storage.post_process({'css/site.css': (self.storage, 'css/site.css')}))
+        self.assertIn('brotli is not installed', logs.output[0])
+    
+    def test_serves_precompressed_variant_with_immutable_caching(self):
+        """Hashed files are served gzipped to clients that accept it and cached for a year."""
+        import gzip
+        response = self._get('/static/' + self.hashed_css, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertTrue(response['Content-Type'].startswith('text/css'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).decode(), self.css)
+    
+    def test_identity_and_revalidation(self):
+        """Clients without gzip get the original; a matching ETag answers 304."""
+        response = self._get('/static/' + self.hashed_css, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(int(response['Content-Length']), len(self.css))
+        response = self._get('/static/' + self.hashed_css, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+    
+    def test_unhashed_and_unknown_paths(self):
+        """Unhashed names get a short max-age; unknown paths fall through to the app."""
+        self.assertNotIn('immutable', self._get('/static/css/site.css')['Cache-Control'])
+        self.assertEqual(self._get('/static/missing.css').content, b'app')
+        self.assertEqual(self._get('/static/../settings.py').content, b'app')
+    
+    def test_without_manifest(self):
+        """Before collectstatic, templates get unhashed URLs and the middleware steps aside."""
+        import tempfile
+        from django.core.exceptions import MiddlewareNotUsed
+        from django.test import override_settings
+        from django.templatetags.static import static
+        from .middleware import StaticFilesMiddleware
+        self.assertEqual(static('css/style.css'), '/static/css/style.css')
+        with override_settings(STATIC_ROOT=tempfile.gettempdir() + '/no-such-static-root'):
+            with self.assertRaises(MiddlewareNotUsed):
+                StaticFilesMiddleware(lambda request: None)
@@ -0,0 +1,121 @@
+"""
+Per-request performance timings, reported as a Server-Timing header.
+
+ServerTimingMiddleware starts a RequestTimings for each request. While it is
+active the request accumulates:
+
+    db        query count and time, via connection.execute_wrapper
+    tpl       template render time, via the TimedDjangoTemplates backend
+    <name>    time in external calls wrapped in ``external_call(name)``
+              (gemini, nominatim, ipstack)
+
+Outside a request (shell, commands, threads started without the request's
+context) nothing is recorded and the hooks cost one ContextVar lookup.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template.exceptions import TemplateDoesNotExist
+
+_timings = contextvars.ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Counters for one request; all times in seconds."""
+
+    __slots__ = ('started', 'db_count', 'db_time', 'template_time', 'external')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_count = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.external = {}
+
+    def add_external(self, name, seconds):
+        self.external[name] = self.external.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def header(self, total=None):
+        """The Server-Timing header value (durations in milliseconds)."""
+        total = self.elapsed() if total is None else total
+        parts = [
+            f'total;dur={total * 1000:.1f}',
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_count} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+        ]
+        parts.extend(f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.external.items())
+        return ', '.join(parts)
+
+
+def current():
+    """The active RequestTimings, or None outside an instrumented request."""
+    return _timings.get()
+
+
+def start():
+    """Begin timing; returns a token for finish()."""
+    timings = RequestTimings()
+    return timings, _timings.set(timings)
+
+
+def finish(token):
+    _timings.reset(token)
+
+
+def record_query(execute, sql, params, many, context):
+    """connection.execute_wrapper hook: counts and times every query."""
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.db_time += time.perf_counter() - started
+        timings.db_count += 1
+
+
+@contextmanager
+def external_call(name):
+    """Attribute the block's wall time to an external service, e.g. ``with external_call('gemini'):``."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add_external(name, time.perf_counter() - started)
+
+
+class TimedTemplate(Template):
+    """Django template whose top-level render time is recorded (includes are part of it)."""
+
+    def render(self, context=None, request=None):
+        timings = _timings.get()
+        if timings is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend returning TimedTemplate."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
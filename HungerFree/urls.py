@@ -7,6 +7,7 @@ urlpatterns = [
     # Public pages
     path('', views.home, name='home'),
     path('chatbot/', views.chatbot, name='chatbot'),
+    path('chatbot/stream/', views.chatbot_stream, name='chatbot_stream'),
     path('about/', views.about, name='about'),
     path('donations/', views.donations, name='donations'),
     path('future-features/', views.future_features, name='future_features'),
@@ -21,9 +22,12 @@ urlpatterns = [
     path('donation/add/', views.donation_add, name='donation_add'),
     path('donation/<int:donation_id>/', views.donation_detail, name='donation_detail'),
     path('donation/<int:donation_id>/request-pickup/', views.donation_request_pickup, name='donation_request_pickup'),
+    path('pickup/<int:pickup_id>/cancel/', views.cancel_pickup_request, name='cancel_pickup_request'),
     
     # API endpoints
     path('api/donations/', views.api_donations, name='api_donations'),
+    path('api/donations/<int:donation_id>/claim/', views.api_claim_donation, name='api_claim_donation'),
+    path('api/donors/', dashboard_views.donor_directory_api, name='donor_directory_api'),
     
     # Payment URLs
     path('payment/callback/', views.payment_callback, name='payment_callback'),
@@ -38,6 +42,7 @@ urlpatterns = [
     path('donor/', dashboard_views.donor_dashboard, name='donor_dashboard'),
     path('donor/upload/', dashboard_views.donor_upload_food, name='donor_upload_food'),
     path('donor/nutrition/', dashboard_views.donor_nutrition_analysis, name='donor_nutrition_analysis'),
+    path('donor/nutrition/bulk/', dashboard_views.nutrition_analysis_bulk, name='donor_nutrition_bulk'),
     path('donor/history/', dashboard_views.donor_history, name='donor_history'),
     path('donor/nearby/', dashboard_views.donor_nearby_donations, name='donor_nearby_donations'),
     
@@ -45,6 +50,7 @@ urlpatterns = [
     path('ngo/', dashboard_views.ngo_dashboard, name='ngo_dashboard'),
     path('ngo/calendar/', dashboard_views.ngo_calendar, name='ngo_calendar'),
     path('ngo/nutrition/', dashboard_views.ngo_nutrition_analysis, name='ngo_nutrition_analysis'),
+    path('ngo/nutrition/bulk/', dashboard_views.nutrition_analysis_bulk, name='ngo_nutrition_bulk'),
     path('ngo/history/', dashboard_views.ngo_history, name='ngo_history'),
     path('ngo/donors/', dashboard_views.ngo_donors, name='ngo_donors'),
     path('ngo/nearby/', dashboard_views.ngo_nearby_donations, name='ngo_nearby_donations'),
@@ -56,4 +62,6 @@ urlpatterns = [
     path('platform-admin/reject-ngo/<int:user_id>/', dashboard_views.admin_reject_ngo, name='admin_reject_ngo'),
     path('platform-admin/manage-users/', dashboard_views.admin_manage_users, name='admin_manage_users'),
     path('platform-admin/unapproved-ngos/', dashboard_views.admin_helper, name='admin_helper'),
+    path('platform-admin/api/ai-metrics/', dashboard_views.admin_ai_metrics, name='admin_ai_metrics'),
+    path('platform-admin/api/timeseries/', dashboard_views.admin_timeseries, name='admin_timeseries'),
 ]
\ No newline at end of file
@@ -1,11 +1,13 @@
 """
 Utility functions for HungerFree app.
 """
+import re
 import requests
 from math import radians, sin, cos, sqrt, atan2
-from typing import Dict, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 from decouple import config
 from django.conf import settings
+from .timing import external_call
 
 
 def reverse_geocode(latitude: float, longitude: float) -> Optional[Dict[str, str]]:
@@ -21,7 +23,8 @@ def reverse_geocode(latitude: float, longitude: float) -> Optional[Dict[str, str
     """
     try:
         url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={latitude}&lon={longitude}"
-        response = requests.get(url, timeout=5)
+        with external_call('nominatim'):
+            response = requests.get(url, timeout=5)
         response.raise_for_status()
         data = response.json()
         
@@ -72,13 +75,30 @@ def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     return distance
 
 
+# Keyword tables for the fallback nutrition estimate, compiled once into a single
+# word-boundary regex (longest keyword first, optional plural suffix).
+HEALTHY_KEYWORDS = ('vegetable', 'fruit', 'whole grain', 'legume', 'nut', 'seed')
+PROTEIN_KEYWORDS = ('chicken', 'fish', 'meat', 'egg', 'dairy', 'tofu', 'bean', 'lentil')
+CARB_KEYWORDS = ('rice', 'wheat', 'bread', 'pasta', 'potato', 'corn')
+
+_KEYWORD_CATEGORY = {}
+for _category, _keywords in (('healthy', HEALTHY_KEYWORDS), ('protein', PROTEIN_KEYWORDS), ('carb', CARB_KEYWORDS)):
+    for _keyword in _keywords:
+        _KEYWORD_CATEGORY[_keyword] = _category
+
+_KEYWORD_RE = re.compile(
+    r'\b(' + '|'.join(re.escape(k) for k in sorted(_KEYWORD_CATEGORY, key=len, reverse=True)) + r')(?:e?s)?\b'
+)
+
 def nutritional_score(ingredients: str, meal_type: str = None) -> Dict[str, any]:
     """
-    Calculate a basic nutritional score based on ingredients.
-    This is a placeholder - in production, integrate with a proper nutritional API.
+    Calculate a nutritional score and nutrient totals for a dish.
+    Ingredients found in the bundled nutrient database (see nutrients.py) are
+    summed by weight; if none are recognised, a keyword-based estimate is used.
     
     Args:
-        ingredients: Comma-separated list of ingredients
+        ingredients: Comma-separated list of ingredients, optionally with
+            quantities (e.g. "2 kg cooked rice, 1 kg dal")
         meal_type: Optional meal type (breakfast, lunch, dinner)
     
     Returns:
@@ -95,37 +115,68 @@ def nutritional_score(ingredients: str, meal_type: str = None) -> Dict[str, any]
             'notes': 'No ingredients provided'
         }
     
-    # Simple keyword-based scoring (placeholder)
-    ingredients_lower = ingredients.lower()
+    from .nutrients import get_nutrient_table
+    table = get_nutrient_table()
+    parsed = table.parse(ingredients)
+    if not parsed:
+        return estimate_nutrition_by_keywords(ingredients, meal_type)
     
-    # Basic scoring based on common healthy ingredients
-    healthy_keywords = ['vegetable', 'fruit', 'whole grain', 'legume', 'nut', 'seed']
-    protein_keywords = ['chicken', 'fish', 'meat', 'egg', 'dairy', 'tofu', 'bean', 'lentil']
-    carb_keywords = ['rice', 'wheat', 'bread', 'pasta', 'potato', 'corn']
+    totals = table.totals(parsed)
+    energy = max(totals['calories'], 1.0)
+    protein_share = totals['protein'] * 4 / energy
+    fat_share = totals['fats'] * 9 / energy
+    fiber_per_1000_kcal = totals['fiber'] * 1000 / energy
     
-    score = 50  # Base score
-    calories = 200  # Base calories
-    protein = 5
-    carbs = 30
-    fats = 5
-    fiber = 2
+    # Reward protein and fibre density, penalise fat-heavy dishes
+    score = 40 + min(30, protein_share * 150) + min(20, fiber_per_1000_kcal)
+    score += 10 if fat_share <= 0.35 else -10
+    score = int(round(max(0, min(score, 100))))
     
-    # Adjust based on keywords
-    for keyword in healthy_keywords:
-        if keyword in ingredients_lower:
-            score += 5
-            fiber += 2
+    return {
+        'score': score,
+        'calories': round(totals['calories']),
+        'protein': round(totals['protein'], 1),
+        'carbs': round(totals['carbs'], 1),
+        'fats': round(totals['fats'], 1),
+        'fiber': round(totals['fiber'], 1),
+        'meal_type': meal_type,
+        'total_grams': round(sum(grams for _, grams in parsed)),
+        'matched_ingredients': [
+            {'name': table.names[row], 'grams': round(grams, 1)} for row, grams in parsed
+        ],
+        'notes': 'Computed from the bundled nutrient database (per-100 g values for typical preparations)'
+    }
+
+
+def estimate_nutrition_by_keywords(ingredients: str, meal_type: str = None) -> Dict[str, any]:
+    """
+    Fallback keyword-based estimate for ingredients not in the nutrient database.
     
-    for keyword in protein_keywords:
-        if keyword in ingredients_lower:
-            score += 3
-            protein += 5
-            calories += 50
+    Args:
+        ingredients: Comma-separated list of ingredients
+        meal_type: Optional meal type (breakfast, lunch, dinner)
     
-    for keyword in carb_keywords:
-        if keyword in ingredients_lower:
-            carbs += 20
-            calories += 80
+    Returns:
+        Dictionary with nutritional information and score
+    """
+    # Each distinct keyword counts once, matched on whole words only
+    matched = set(_KEYWORD_RE.findall(ingredients.lower()))
+    healthy = protein_hits = carb_hits = 0
+    for keyword in matched:
+        category = _KEYWORD_CATEGORY[keyword]
+        if category == 'healthy':
+            healthy += 1
+        elif category == 'protein':
+            protein_hits += 1
+        else:
+            carb_hits += 1
+    
+    score = 50 + 5 * healthy + 3 * protein_hits  # Base score plus keyword bumps
+    calories = 200 + 50 * protein_hits + 80 * carb_hits  # Base calories
+    protein = 5 + 5 * protein_hits
+    carbs = 30 + 20 * carb_hits
+    fats = 5
+    fiber = 2 + 2 * healthy
     
     # Cap score at 100
     score = min(score, 100)
@@ -142,6 +193,24 @@ def nutritional_score(ingredients: str, meal_type: str = None) -> Dict[str, any]
     }
 
 
+def nutritional_score_batch(ingredients_list: List[str], meal_type: str = None) -> List[Dict[str, any]]:
+    """
+    Score many ingredient lists (e.g. a whole canteen menu) in one call.
+    
+    Scoring runs in the calling process. Very large offline batches go
+    through ``manage.py score_menus``, which can spread them over a process
+    pool; web workers never fork one.
+    
+    Args:
+        ingredients_list: List of comma-separated ingredient strings
+        meal_type: Optional meal type applied to every entry
+    
+    Returns:
+        List of nutritional_score() results in input order
+    """
+    return [nutritional_score(ingredients, meal_type) for ingredients in ingredients_list]
+
+
 def expire_priority(expiry_date, current_date=None) -> str:
     """
     Determine priority level based on expiry date.
@@ -189,7 +258,8 @@ def get_ipstack_location(ip_address: str = None) -> Optional[Dict[str, any]]:
             ip_address = 'check'  # ipstack auto-detects
         
         url = f"http://api.ipstack.com/{ip_address}?access_key={api_key}"
-        response = requests.get(url, timeout=5)
+        with external_call('ipstack'):
+            response = requests.get(url, timeout=5)
         response.raise_for_status()
         data = response.json()
         
@@ -1,26 +1,62 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import logout
-import google.generativeai as genai 
+import asyncio
 import requests
 import re
+import threading
+import time
 from decouple import config
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseNotAllowed, StreamingHttpResponse
+from asgiref.sync import sync_to_async
 from django.views.decorators.http import require_http_methods
 from django.core.paginator import Paginator
 from django.contrib import messages
 import json
 from .models import *
+from .portions import answer_portion_query
+from .db_routing import replica_reads
+from .locations import city_key_from_location
+from .pickups import DonationUnavailable, claim_donation, release_claim, waitlist_position
+from .search import search_donations
+from .ai_client import AIServiceBusy, get_ai_bulkhead, get_gemini_manager, get_single_flight, prompt_key
 from datetime import date, timedelta
 from django.conf import settings
 
+# Minimum seconds between two chatbot requests from the same session
+CHATBOT_COOLDOWN_SECONDS = 2
 
 
 # Create your views here.
 def home(request):
     return render(request, 'home.html')
 
-def chatbot(request):
-    """AI chatbot view with input validation and error handling."""
+def build_chatbot_prompt(meal_type, dish_name, num_people, custom_query):
+    """Build the Gemini prompt for the chatbot forms, or None if the input is incomplete."""
+    if custom_query:
+        return f''' 
+            Question : I Want to Prepare {custom_query} 
+            Instructions
+            1. If the question is not related to food, do not answer.
+            2. Provide precise amounts according to Indian Food Standards.
+            3. Focus on minimizing food waste.'''
+    if dish_name and num_people:
+        return f''' 
+            Question : I Want to Prepare {dish_name} for Number of People: {num_people} for {meal_type} without wasting any Food Give me Presize Amounts of Food according to Indian Food Standards. 
+            Instructions
+            1. If the question is not related to food, do not answer.
+            2. Provide precise amounts according to Indian Food Standards.
+            3. Focus on minimizing food waste.'''
+    return None
+
+
+async def chatbot(request):
+    """
+    AI chatbot view with input validation and error handling.
+
+    Runs as an async view: the Gemini call happens in a worker thread behind the
+    AI bulkhead with a hard timeout, so slow AI traffic sheds load ("busy, try
+    again") instead of tying up the workers that serve donation flows.
+    """
     if request.method == 'POST':
         meal_type = request.POST.get('meal_type', '').strip()
         dish_name = request.POST.get('dish_name', '').strip()
@@ -28,74 +64,244 @@ def chatbot(request):
         custom_query = request.POST.get('custom_query', '').strip()
         
         # Validate input - ensure at least one field is provided
-        if not custom_query and not (dish_name and num_people):
+        prompt = build_chatbot_prompt(meal_type, dish_name, num_people, custom_query)
+        if not prompt:
             messages.error(request, "Please provide either a custom query or dish name with number of people.")
-            return render(request, 'chatbot.html')
+            return await _render_async(request, 'chatbot.html')
+        
+        # Known dish + headcount: scale the standard portion table locally, no AI call
+        local_answer = answer_portion_query(dish_name, num_people, meal_type, custom_query)
+        if local_answer:
+            return await _render_async(request, 'chatbot.html', context={'response': local_answer})
         
         # Basic rate limiting awareness: check session for recent requests
         # (In production, use Redis or database-based rate limiting)
-        last_request = request.session.get('last_chatbot_request', 0)
-        import time
-        if time.time() - last_request < 2:  # 2 second cooldown
+        last_request = await request.session.aget('last_chatbot_request', 0)
+        if time.time() - last_request < CHATBOT_COOLDOWN_SECONDS:
             messages.warning(request, "Please wait a moment before making another request.")
-            return render(request, 'chatbot.html')
+            return await _render_async(request, 'chatbot.html')
         
-        request.session['last_chatbot_request'] = time.time()
-        
-        if custom_query:
-            prompt = f''' 
-            Question : I Want to Prepare {custom_query} 
-            Instructions
-            1. If the question is not related to food, do not answer.
-            2. Provide precise amounts according to Indian Food Standards.
-            3. Focus on minimizing food waste.'''
-        else:
-            prompt = f''' 
-            Question : I Want to Prepare {dish_name} for Number of People: {num_people} for {meal_type} without wasting any Food Give me Presize Amounts of Food according to Indian Food Standards. 
-            Instructions
-            1. If the question is not related to food, do not answer.
-            2. Provide precise amounts according to Indian Food Standards.
-            3. Focus on minimizing food waste.'''
+        await request.session.aset('last_chatbot_request', time.time())
         
         try:
-            response = ask_gemini(prompt)
+            response = await ask_gemini_async(prompt)
             cleaned = clean_ai_markdown(response)
-            return render(request, 'chatbot.html', context={'response': cleaned})
+            return await _render_async(request, 'chatbot.html', context={'response': cleaned})
+        except AIServiceBusy:
+            messages.warning(request, "The AI assistant is busy right now. Please try again in a few seconds.")
+            return await _render_async(request, 'chatbot.html', status=503)
+        except asyncio.TimeoutError:
+            messages.error(request, "The AI assistant took too long to answer. Please try again.")
+            return await _render_async(request, 'chatbot.html', status=504)
         except Exception as e:
             messages.error(request, f"An error occurred: {str(e)}")
-            return render(request, 'chatbot.html')
+            return await _render_async(request, 'chatbot.html')
+
+    return await _render_async(request, 'chatbot.html')
+
+
+async def _render_async(request, template_name, context=None, status=None):
+    """render() from an async view; templates may touch the DB (e.g. user.user_profile)."""
+    return await sync_to_async(render)(request, template_name, context, status=status)
+
+
+def _sse_event(data, event=None):
+    """Format one Server-Sent Events frame (multi-line data is split per the spec)."""
+    lines = [f'event: {event}'] if event else []
+    lines.extend(f'data: {line}' for line in data.split('\n'))
+    return '\n'.join(lines) + '\n\n'
 
-    return render(request, 'chatbot.html')
 
-def ask_gemini(prompt):
-    """Call Gemini API with proper error handling and rate limiting awareness."""
-    api_key = getattr(settings, 'GEMINI_API_KEY', None) or config('GEMINI_API_KEY', default='')
+class UpstreamStream:
+    """
+    A blocking upstream iterator (a Gemini stream) that runs ``on_finish``
+    exactly once, when the upstream call is really over.
+
+    The consumer may stop early (timeout, client disconnect) while a worker
+    thread is still blocked in next(). close() then only marks the stream
+    abandoned, and that worker thread closes the iterator and runs
+    ``on_finish`` when its call returns. This keeps the bulkhead's in-flight
+    count equal to the number of live upstream calls.
+    """
+
+    def __init__(self, iterator, on_finish):
+        self.iterator = iterator
+        self.on_finish = on_finish
+        self._lock = threading.Lock()
+        self._busy = False
+        self._abandoned = False
+        self._finished = False
+
+    def next(self, default):
+        """Next item or ``default``; called from a worker thread."""
+        with self._lock:
+            if self._abandoned:
+                return default
+            self._busy = True
+        try:
+            return next(self.iterator, default)
+        finally:
+            with self._lock:
+                self._busy = False
+                abandoned = self._abandoned
+            if abandoned:
+                self._finish()
+
+    def close(self):
+        """Stop consuming; finishes now, or when the in-flight next() returns."""
+        with self._lock:
+            self._abandoned = True
+            if self._busy:
+                return
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            if self._finished:
+                return
+            self._finished = True
+        try:
+            close = getattr(self.iterator, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self.on_finish()
+
+
+async def _iterate_in_thread(stream, deadline):
+    """
+    Drive an UpstreamStream from async code without holding the event loop,
+    raising asyncio.TimeoutError once the loop time passes ``deadline``.
+    """
+    loop = asyncio.get_running_loop()
+    sentinel = object()
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        item = await asyncio.wait_for(
+            sync_to_async(stream.next, thread_sensitive=False)(sentinel), remaining
+        )
+        if item is sentinel:
+            break
+        yield item
+
+
+async def chatbot_stream(request):
+    """
+    Streaming variant of the chatbot: forwards Gemini chunks as Server-Sent Events.
+
+    This is an async view, so when served by the ASGI app (FoodSaver.asgi) a long
+    generation only holds an event-loop task, not a sync worker. The stream
+    holds an AI bulkhead slot and is cut off after AI_REQUEST_TIMEOUT_SECONDS.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
     
-    if not api_key:
-        return "Error: Gemini API key not configured. Please set GEMINI_API_KEY in your environment variables."
+    form_fields = (
+        request.POST.get('meal_type', '').strip(),
+        request.POST.get('dish_name', '').strip(),
+        request.POST.get('num_people', '').strip(),
+        request.POST.get('custom_query', '').strip(),
+    )
+    prompt = build_chatbot_prompt(*form_fields)
+    if not prompt:
+        return JsonResponse({'error': 'Please provide either a custom query or dish name with number of people.'}, status=400)
     
-    try:
-        genai.configure(api_key=api_key)
-        # Use the latest stable Gemini model
-        # Try gemini-2.0-flash first (fastest), fallback to gemini-2.5-flash, then gemini-pro
+    meal_type, dish_name, num_people, custom_query = form_fields
+    local_answer = answer_portion_query(dish_name, num_people, meal_type, custom_query)
+    if local_answer:
+        response = StreamingHttpResponse([_sse_event(local_answer), _sse_event('', event='done')], content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        return response
+    
+    last_request = await request.session.aget('last_chatbot_request', 0)
+    if time.time() - last_request < CHATBOT_COOLDOWN_SECONDS:
+        return JsonResponse({'error': 'Please wait a moment before making another request.'}, status=429)
+    await request.session.aset('last_chatbot_request', time.time())
+    
+    manager = get_gemini_manager()
+    timeout = settings.AI_REQUEST_TIMEOUT_SECONDS
+    
+    async def events():
+        if manager is None:
+            yield _sse_event("Error: Gemini API key not configured. Please set GEMINI_API_KEY in your environment variables.", event='error')
+            return
+        bulkhead = get_ai_bulkhead()
+        if not bulkhead.try_acquire():
+            yield _sse_event("The AI assistant is busy right now. Please try again in a few seconds.", event='busy')
+            return
+        cleaner = IncrementalMarkdownCleaner()
+        # The slot is returned by the stream itself, once Gemini lets go of it
+        stream = UpstreamStream(manager.stream_text(prompt, timeout=timeout), bulkhead.release)
         try:
-            model = genai.GenerativeModel('gemini-2.0-flash')
-        except:
-            try:
-                model = genai.GenerativeModel('gemini-2.5-flash')
-            except:
-                model = genai.GenerativeModel('gemini-pro')
-        # generate_content expects a string prompt
-        result = model.generate_content(prompt)
+            deadline = asyncio.get_running_loop().time() + timeout
+            async for chunk in _iterate_in_thread(stream, deadline):
+                text = cleaner.feed(chunk)
+                if text:
+                    yield _sse_event(text)
+            tail = cleaner.flush()
+            if tail:
+                yield _sse_event(tail)
+            yield _sse_event('', event='done')
+        except asyncio.TimeoutError:
+            yield _sse_event("The AI assistant took too long to answer. Please try again.", event='error')
+        except Exception as e:
+            yield _sse_event(f"Error communicating with AI service: {str(e)}. Please try again later.", event='error')
+        finally:
+            stream.close()
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies (nginx/Render) from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def ask_gemini(prompt, timeout=None, bulkhead=None):
+    """
+    Call Gemini through the shared client manager with failover and error handling.
+
+    Identical prompts in flight at the same time (in this process, or in other
+    workers via the shared cache) are coalesced into a single upstream call.
+    When a bulkhead is given, only the call that actually goes upstream takes a
+    slot; AIServiceBusy is raised if none is free.
+    """
+    manager = get_gemini_manager()
+    
+    if manager is None:
+        return "Error: Gemini API key not configured. Please set GEMINI_API_KEY in your environment variables."
+    
+    def call_upstream():
+        if bulkhead is not None and not bulkhead.try_acquire():
+            raise AIServiceBusy()
         try:
-            return result.text
-        except Exception:
-            # Fallback formatting
-            return str(result)
+            return manager.generate_text(prompt, timeout=timeout)
+        finally:
+            if bulkhead is not None:
+                bulkhead.release()
+    
+    try:
+        return get_single_flight().do(prompt_key(prompt), call_upstream)
+    except AIServiceBusy:
+        raise
     except Exception as e:
         # Log error in production, return user-friendly message
         return f"Error communicating with AI service: {str(e)}. Please try again later."
 
+
+async def ask_gemini_async(prompt):
+    """
+    ask_gemini() behind the AI bulkhead with a hard timeout.
+
+    Raises AIServiceBusy when every bulkhead slot is taken and
+    asyncio.TimeoutError after AI_REQUEST_TIMEOUT_SECONDS. The slot is released
+    by the worker thread when the upstream call actually returns, so timed-out
+    calls still count against the limit until Gemini lets go of them.
+    """
+    timeout = settings.AI_REQUEST_TIMEOUT_SECONDS
+    call = sync_to_async(ask_gemini, thread_sensitive=False)
+    return await asyncio.wait_for(call(prompt, timeout=timeout, bulkhead=get_ai_bulkhead()), timeout)
+
 def update_location(request):
     today = date.today()
     tomorrow = today + timedelta(days=1)
@@ -194,6 +400,51 @@ def clean_ai_markdown(text: str) -> str:
     bulletized = re.sub(r'^\s*[\*-]\s+', '• ', without_bold, flags=re.MULTILINE)
     return bulletized
 
+class IncrementalMarkdownCleaner:
+    """
+    Streaming counterpart of ``clean_ai_markdown``.
+
+    Text is fed chunk by chunk; anything that could still change meaning once
+    more text arrives (a trailing ``*`` that may be half of ``**``, or a line
+    start that may still become a bullet) is held back until it is decided.
+    """
+    _pending_bullet = re.compile(r'[ \t]*[\*-]?[ \t]*\Z')
+    _bullet = re.compile(r'^\s*[\*-]\s+', flags=re.MULTILINE)
+
+    def __init__(self):
+        self._buffer = ''
+        self._at_line_start = True
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk and return the cleaned text that is safe to emit."""
+        self._buffer += chunk or ''
+        cut = len(self._buffer.rstrip('*'))
+        last_newline = self._buffer.rfind('\n', 0, cut)
+        if last_newline >= 0:
+            line_start = last_newline + 1
+        else:
+            line_start = 0 if self._at_line_start else None
+        if line_start is not None and self._pending_bullet.match(self._buffer, line_start, cut):
+            cut = line_start
+        return self._emit(cut)
+
+    def flush(self) -> str:
+        """Return whatever is still buffered at the end of the stream."""
+        return self._emit(len(self._buffer))
+
+    def _emit(self, cut: int) -> str:
+        segment, self._buffer = self._buffer[:cut], self._buffer[cut:]
+        if not segment:
+            return ''
+        segment = segment.replace('**', '')
+        if self._at_line_start:
+            cleaned = self._bullet.sub('• ', segment)
+        else:
+            head, sep, rest = segment.partition('\n')
+            cleaned = head + sep + self._bullet.sub('• ', rest)
+        self._at_line_start = segment.endswith('\n')
+        return cleaned
+
 def about(request):
     return render(request, 'about.html')
 
@@ -206,9 +457,14 @@ def donations(request):
     # Get donations from new Donation model (preferred)
     donations_qs = Donation.objects.filter(status='Available')
     
-    # Filter by location if saved
+    # Filter by the saved location's city
     if saved_location:
-        donations_qs = donations_qs.filter(location__icontains=saved_location)
+        donations_qs = donations_qs.filter(city_key=city_key_from_location(saved_location))
+    
+    # Full-text search over title, description and location
+    query = request.GET.get('q', '').strip()
+    if query:
+        donations_qs = search_donations(donations_qs, query)
     
     # Filter by expiry priority
     expiry_filter = request.GET.get('expiry')
@@ -219,9 +475,11 @@ def donations(request):
     elif expiry_filter == 'fresh':
         donations_qs = donations_qs.filter(expiry_date__gt=tomorrow)
     
-    # Sorting
-    sort_by = request.GET.get('sort', 'created_at')
-    if sort_by == 'expiry':
+    # Sorting (search results default to relevance)
+    sort_by = request.GET.get('sort', 'relevance' if query else 'created_at')
+    if sort_by == 'relevance' and query:
+        donations_qs = donations_qs.order_by('-search_rank', '-created_at')
+    elif sort_by == 'expiry':
         donations_qs = donations_qs.order_by('expiry_date')
     elif sort_by == 'quantity':
         donations_qs = donations_qs.order_by('-quantity')
@@ -248,6 +506,7 @@ def donations(request):
         'saved_location': saved_location,
         'expiry_filter': expiry_filter or 'all',
         'sort_by': sort_by,
+        'query': query,
     })
 
 def future_features(request):
@@ -305,7 +564,10 @@ def donation_add(request):
 def donation_detail(request, donation_id):
     """View to show donation details."""
     donation = get_object_or_404(Donation, id=donation_id)
-    pickup_requests = donation.pickup_requests.filter(status__in=['Pending', 'Approved'])
+    # Active claim first, then the waitlist in queue order
+    pickup_requests = donation.pickup_requests.filter(
+        status__in=['Pending', 'Approved', 'Waitlisted']
+    ).order_by('id')
     
     return render(request, 'donation_detail.html', {
         'donation': donation,
@@ -323,8 +585,9 @@ def donation_request_pickup(request, donation_id):
     
     if request.method == 'POST':
         try:
-            pickup_request = PickupRequest.objects.create(
-                donation=donation,
+            # Reserves the donation only if it is still Available
+            claim_donation(
+                donation,
                 requester=request.user if request.user.is_authenticated else None,
                 requester_name=request.POST.get('requester_name'),
                 requester_email=request.POST.get('requester_email'),
@@ -332,26 +595,31 @@ def donation_request_pickup(request, donation_id):
                 notes=request.POST.get('notes', ''),
             )
             
-            # Update donation status to Reserved
-            donation.status = 'Reserved'
-            donation.save()
-            
             messages.success(request, 'Pickup request submitted successfully!')
             return redirect('donation_detail', donation_id=donation_id)
+        except DonationUnavailable:
+            messages.error(request, 'Sorry, this donation has already been claimed.')
+            return redirect('donation_detail', donation_id=donation_id)
         except Exception as e:
             messages.error(request, f'Error submitting pickup request: {str(e)}')
     
     return render(request, 'pickup_request_form.html', {'donation': donation})
 
 
+@replica_reads
 def api_donations(request):
     """REST API endpoint for donations listing with filters and pagination."""
     donations_qs = Donation.objects.filter(status='Available')
     
-    # Filter by location
+    # Filter by the city of the given location
     location = request.GET.get('location')
     if location:
-        donations_qs = donations_qs.filter(location__icontains=location)
+        donations_qs = donations_qs.filter(city_key=city_key_from_location(location))
+    
+    # Full-text search, ranked by relevance
+    query = request.GET.get('q', '').strip()
+    if query:
+        donations_qs = search_donations(donations_qs, query).order_by('-search_rank', '-created_at')
     
     # Filter by expiry (urgent, soon, fresh)
     expiry_filter = request.GET.get('expiry')
@@ -402,6 +670,55 @@ def api_donations(request):
     })
 
 
+@require_http_methods(['POST'])
+def api_claim_donation(request, donation_id):
+    """
+    Claim an available donation for pickup.
+
+    Returns 201 with the pickup request, or 409 when another requester
+    claimed it first (404 if the donation does not exist). With
+    ``waitlist=1`` a claimed donation answers 202 with a waitlist position.
+    """
+    donation = get_object_or_404(Donation.objects.only('id', 'pickup_by'), id=donation_id)
+    ngo = request.actor.ngo
+    try:
+        pickup_request = claim_donation(
+            donation,
+            requester=request.user,
+            requester_name=ngo.name if ngo else request.user.get_full_name() or request.user.username,
+            requester_email=ngo.email if ngo else request.user.email,
+            requester_phone=ngo.phone if ngo else request.POST.get('requester_phone', ''),
+            notes=request.POST.get('notes', ''),
+            ngo=ngo,
+            join_waitlist=request.POST.get('waitlist') in ('1', 'true'),
+        )
+    except DonationUnavailable as e:
+        return JsonResponse({'error': 'already_claimed', 'status': e.status}, status=409)
+    if pickup_request.status == 'Waitlisted':
+        return JsonResponse({
+            'donation_id': donation.id,
+            'pickup_request_id': pickup_request.id,
+            'status': 'Waitlisted',
+            'position': waitlist_position(pickup_request),
+        }, status=202)
+    return JsonResponse({
+        'donation_id': donation.id,
+        'pickup_request_id': pickup_request.id,
+        'status': 'Reserved',
+    }, status=201)
+
+
+@require_http_methods(['POST'])
+def cancel_pickup_request(request, pickup_id):
+    """Cancel the user's own pickup request (or waitlist place); the next in line is promoted."""
+    pickup_request = get_object_or_404(PickupRequest, id=pickup_id, requester=request.user)
+    if release_claim(pickup_request):
+        messages.success(request, 'Your pickup request was cancelled.')
+    else:
+        messages.error(request, 'This pickup request has already finished.')
+    return redirect('donation_detail', donation_id=pickup_request.donation_id)
+
+
 def payment_callback(request):
     """Handle payment gateway callback/webhook."""
     if request.method == 'POST':
@@ -450,8 +767,8 @@ def payment_thanks(request, payment_id):
 def dashboard(request):
     """Legacy dashboard view - redirects to role-based dashboards."""
     if request.user.is_authenticated:
-        if hasattr(request.user, 'user_profile'):
-            profile = request.user.user_profile
+        profile = request.actor.profile
+        if profile:
             if profile.is_admin():
                 return redirect('admin_dashboard')
             elif profile.is_ngo() and profile.is_approved: